@@ -0,0 +1,48 @@
+-- Change log customer_profile untuk incremental dashboard aggregates
+-- Trigger mencatat setiap INSERT/UPDATE/DELETE; service (CHANGELOG_POLL_SECONDS > 0)
+-- mem-poll change_id > watermark, lalu hanya me-rescore customer yang berubah.
+
+CREATE TABLE IF NOT EXISTS customer_profile_changes (
+  change_id BIGSERIAL PRIMARY KEY,
+  customer_id VARCHAR(20) NOT NULL,
+  op CHAR(1) NOT NULL CHECK (op IN ('I', 'U', 'D', 'T')),
+  changed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create index for retention cleanup
+CREATE INDEX IF NOT EXISTS idx_customer_profile_changes_changed_at ON customer_profile_changes(changed_at);
+
+CREATE OR REPLACE FUNCTION log_customer_profile_change() RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'TRUNCATE' THEN
+    -- Tidak ada row-level event: service melakukan full reload snapshot
+    INSERT INTO customer_profile_changes (customer_id, op) VALUES ('*', 'T');
+    RETURN NULL;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    INSERT INTO customer_profile_changes (customer_id, op) VALUES (OLD.customer_id, LEFT(TG_OP, 1));
+  END IF;
+  IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.customer_id IS DISTINCT FROM OLD.customer_id) THEN
+    INSERT INTO customer_profile_changes (customer_id, op) VALUES (NEW.customer_id, LEFT(TG_OP, 1));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_customer_profile_changes ON customer_profile;
+CREATE TRIGGER trg_customer_profile_changes
+  AFTER INSERT OR UPDATE OR DELETE ON customer_profile
+  FOR EACH ROW EXECUTE FUNCTION log_customer_profile_change();
+
+DROP TRIGGER IF EXISTS trg_customer_profile_truncate ON customer_profile;
+CREATE TRIGGER trg_customer_profile_truncate
+  AFTER TRUNCATE ON customer_profile
+  FOR EACH STATEMENT EXECUTE FUNCTION log_customer_profile_change();
+
+-- Add comment to table
+COMMENT ON TABLE customer_profile_changes IS 'Append-only change log of customer_profile, polled by the analytics service';
+COMMENT ON COLUMN customer_profile_changes.op IS 'I = insert, U = update, D = delete, T = truncate (customer_id = *)';
+
+-- Change log hanya perlu menjangkau SNAPSHOT_TTL_SECONDS terakhir (full reload berikutnya
+-- mengambil watermark baru). Bersihkan berkala, mis. dengan pg_cron:
+-- DELETE FROM customer_profile_changes WHERE changed_at < NOW() - INTERVAL '7 days';
@@ -1,8 +1,8 @@
-import React, { useState, useEffect } from 'react'
+import React, { useState, useEffect, useRef } from 'react'
 import Toast from '../../components/Toast';
 import ImportFile from '../../components/ImportFile';
 import { createPortal } from 'react-dom'
-import { getCustomers, getCustomerInsights, createCustomer, updateCustomer, deleteCustomer, predictCustomerOfferML } from '../../services/api'
+import { getCustomers, getCustomerInsights, getInsightJob, streamInsightJob, createCustomer, updateCustomer, deleteCustomer, predictCustomerOfferML } from '../../services/api'
 import { Search, X, AlertTriangle, Sparkles, ChevronRight, Plus, Trash2 } from 'lucide-react'
 import ConfirmDialog from '../../components/ConfirmDialog'
 
@@ -17,6 +17,9 @@ const UserProfile = () => {
   const [recommendations, setRecommendations] = useState([])
   const [churnInsight, setChurnInsight] = useState(null)
   const [aiInsights, setAiInsights] = useState(null)
+  const [aiInsightLoading, setAiInsightLoading] = useState(false)
+  const insightJobRef = useRef(null) // job AI insight yang sedang di-poll (null = berhenti)
+  const closeInsightStreamRef = useRef(null)
   const [userCategory, setUserCategory] = useState('')
   const [currentPage, setCurrentPage] = useState(1)
   const [pageSize, setPageSize] = useState(10)
@@ -78,7 +81,14 @@ const UserProfile = () => {
     fetchInsights(customer.customerId || customer.id)
   }
 
+  const stopAiInsights = () => {
+    insightJobRef.current = null
+    closeInsightStreamRef.current?.()
+    closeInsightStreamRef.current = null
+  }
+
   const closeAnalysis = () => {
+    stopAiInsights()
     setIsClosing(true)
     setTimeout(() => {
       setShowAnalysis(false)
@@ -87,19 +97,88 @@ const UserProfile = () => {
       setRecommendations([])
       setChurnInsight(null)
       setAiInsights(null)
+      setAiInsightLoading(false)
       setUserCategory('')
     }, 400) // Match animation duration
   }
 
+  // Stream AI insight (SSE) supaya teks tampil bertahap; fallback ke polling jika gagal
+  const streamAiInsights = (jobId) => {
+    insightJobRef.current = jobId
+    setAiInsightLoading(true)
+    let received = false
+    const close = streamInsightJob(jobId, {
+      onDelta: ({ section, text }) => {
+        if (insightJobRef.current !== jobId || !section) return
+        received = true
+        setAiInsights(prev => ({ ...(prev || {}), [section]: ((prev || {})[section] || '') + (text || '') }))
+      },
+      onSection: ({ section, text }) => {
+        if (insightJobRef.current !== jobId || !section) return
+        received = true
+        setAiInsights(prev => ({ ...(prev || {}), [section]: text || '' }))
+      },
+      onDone: (job) => {
+        if (insightJobRef.current !== jobId) return
+        if (job.ai_insights) setAiInsights(job.ai_insights)
+        closeInsightStreamRef.current = null
+        insightJobRef.current = null
+        setAiInsightLoading(false)
+      },
+      onError: () => {
+        if (insightJobRef.current !== jobId) return
+        closeInsightStreamRef.current = null
+        if (!received) {
+          pollAiInsights(jobId)
+        } else {
+          insightJobRef.current = null
+          setAiInsightLoading(false)
+        }
+      },
+    })
+    if (close) {
+      closeInsightStreamRef.current = close
+    } else {
+      pollAiInsights(jobId)
+    }
+  }
+
+  // AI insight di-generate di background: long-poll sampai selesai atau modal ditutup
+  const pollAiInsights = async (jobId) => {
+    insightJobRef.current = jobId
+    setAiInsightLoading(true)
+    try {
+      for (let attempt = 0; attempt < 12 && insightJobRef.current === jobId; attempt++) {
+        const job = await getInsightJob(jobId)
+        if (insightJobRef.current !== jobId) return
+        if (!job || job.status === 'failed') break
+        if (job.status === 'done') {
+          setAiInsights(job.ai_insights || null)
+          break
+        }
+      }
+    } finally {
+      if (insightJobRef.current === jobId) {
+        insightJobRef.current = null
+        setAiInsightLoading(false)
+      }
+    }
+  }
+
   const fetchInsights = async (customerId) => {
     if (!customerId) return
     try {
       setInsightLoading(true)
+      setAiInsights(null)
+      stopAiInsights()
       const data = await getCustomerInsights(customerId)
       setRecommendations(data.recommendations?.items || [])
       setChurnInsight(data.churn || null)
       setAiInsights(data.ai_insights || null)
       setUserCategory(data.user_category || '')
+      if (data.insight_job_id) {
+        streamAiInsights(data.insight_job_id)
+      }
 
       // 🎯 Fix: Update customer target_offer in DB with the analysis result
       if (data.churn?.raw_label && customerId) {
@@ -710,7 +789,7 @@ const UserProfile = () => {
                   <div className="mt-4 rounded-lg bg-slate-100 dark:bg-slate-900/60 border border-slate-200 dark:border-slate-700 p-4">
                     <p className="text-sm font-semibold text-slate-900 dark:text-white mb-2">AI Risk Analysis</p>
                     <p className="text-sm text-slate-700 dark:text-slate-300 leading-relaxed">
-                      {aiInsights?.churn_analysis || 'Analisis churn belum tersedia untuk pelanggan ini.'}
+                      {aiInsights?.churn_analysis || (aiInsightLoading ? 'AI sedang menganalisis risiko churn...' : 'Analisis churn belum tersedia untuk pelanggan ini.')}
                     </p>
                   </div>
                 </div>
@@ -746,7 +825,7 @@ const UserProfile = () => {
                       <div>
                         <p className="text-sm font-semibold text-slate-900 dark:text-white mb-1">AI Analysis</p>
                         <p className="text-sm text-slate-700 dark:text-slate-300 leading-relaxed">
-                          {aiInsights?.product_recommendation || 'Analisis AI belum tersedia untuk pelanggan ini.'}
+                          {aiInsights?.product_recommendation || (aiInsightLoading ? 'AI sedang menyusun analisis produk...' : 'Analisis AI belum tersedia untuk pelanggan ini.')}
                         </p>
                       </div>
                     </div>
@@ -435,6 +435,65 @@ export const getCustomerInsights = async (customerId, topN = 5) => {
   }
 }
 
+/**
+ * Ambil status AI insight (di-generate di background setelah /infer/analytic).
+ * waitSeconds > 0 = long-poll: server menahan response sampai job selesai atau timeout.
+ *
+ * @returns {Promise<Object|null>} { job_id, status, ai_insights, error } atau null jika gagal/expired
+ */
+export const getInsightJob = async (jobId, waitSeconds = 10) => {
+  const controller = new AbortController()
+  const timeout = setTimeout(() => controller.abort(), (waitSeconds + 5) * 1000)
+
+  try {
+    const res = await fetch(`${RECSYS_BASE_URL}/infer/analytic/insights/${encodeURIComponent(jobId)}?wait=${waitSeconds}`, {
+      signal: controller.signal,
+    })
+    if (!res.ok) {
+      console.warn(`⚠️ Insight job ${jobId} returned ${res.status}`)
+      return null
+    }
+    return await res.json()
+  } catch (error) {
+    console.error('⚠️ Error fetching AI insight job:', error)
+    return null
+  } finally {
+    clearTimeout(timeout)
+  }
+}
+
+/**
+ * Stream AI insight via Server-Sent Events (teks tampil bertahap selagi LLM generate).
+ * Event: delta { section, text } potongan teks, section { section, text } teks final,
+ * done { status, ai_insights, error }.
+ *
+ * @returns {Function|null} fungsi untuk menutup stream, atau null jika EventSource tidak didukung
+ */
+export const streamInsightJob = (jobId, { onDelta, onSection, onDone, onError } = {}) => {
+  if (typeof EventSource === 'undefined') return null
+
+  const source = new EventSource(`${RECSYS_BASE_URL}/infer/analytic/insights/${encodeURIComponent(jobId)}/stream`)
+  const parse = (event) => {
+    try {
+      return JSON.parse(event.data)
+    } catch {
+      return {}
+    }
+  }
+  source.addEventListener('delta', (event) => onDelta?.(parse(event)))
+  source.addEventListener('section', (event) => onSection?.(parse(event)))
+  source.addEventListener('done', (event) => {
+    source.close()
+    onDone?.(parse(event))
+  })
+  source.onerror = (error) => {
+    // Tutup supaya browser tidak auto-reconnect (stream diulang dari awal)
+    source.close()
+    onError?.(error)
+  }
+  return () => source.close()
+}
+
 /**
  * Predict target offer untuk customer BARU (tanpa ID di database).
  * Pure ML prediction untuk user form input (add customer).
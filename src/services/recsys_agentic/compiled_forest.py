@@ -0,0 +1,447 @@
+"""Compiled forest: RandomForest/ExtraTrees + ColumnTransformer sebagai array NumPy (bisa di-mmap)."""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer, OneHotEncoder, OrdinalEncoder
+
+
+class UnsupportedModel(Exception):
+    """Struktur model tidak bisa di-compile; prediksi tetap lewat clf.predict."""
+
+
+class CompiledForest:
+    """
+    RandomForest/ExtraTrees + preprocessing ColumnTransformer yang di-flatten ke array NumPy.
+
+    Semua tree digabung menjadi satu tabel node (feature, threshold, left, right) dengan
+    index global; leaf menunjuk ke dirinya sendiri sehingga traversal cukup max_depth
+    langkah vektor untuk semua (tree, row) sekaligus, tanpa validasi DataFrame dan
+    dispatch per tree. Batch besar memakai tree_.apply (Cython sklearn) per tree di
+    atas matrix yang sudah di-encode, karena traversal NumPy kalah cepat untuk N besar.
+    Prediksi = argmax rata-rata proba leaf, dengan X dibandingkan sebagai float32
+    seperti sklearn, sehingga hasilnya identik dengan clf.predict.
+    """
+
+    ROW_CHUNK = 4096  # baris per langkah traversal (batas memori node x tree x class)
+    TRAVERSAL_MAX_ROWS = 256  # di atas ini: tree_.apply per tree
+    SMALL_FRAME_ROWS = 64  # di bawah ini: encode lewat dict lookup (tanpa hash table pandas)
+
+    ARRAYS = ('feature', 'threshold', 'left', 'right', 'leaf_proba', 'roots', 'classes')
+    FORMAT_VERSION = 1  # naikkan jika layout array/meta berubah
+
+    def __init__(
+        self,
+        feature_specs: List[Tuple[str, str, int]],
+        categorical: Dict[str, Tuple[pd.Index, str, np.ndarray]],
+        arrays: Dict[str, np.ndarray],
+        max_depth: int,
+        trees: Optional[List[Any]] = None,
+        allow_nan: bool = False,
+    ):
+        self.allow_nan = allow_nan  # False: forest menolak NaN (sklearn < 1.4), engine ikut raise
+        self.feature_specs = feature_specs  # per fitur output: (kind, input column, category index)
+        self.categorical = categorical  # input column -> (categories, handle_unknown, nilai ordinal per code)
+        self.n_features = len(feature_specs)
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.leaf_proba = arrays['leaf_proba']
+        self.roots = arrays['roots']
+        self.classes = arrays['classes']
+        self.n_estimators = len(self.roots)
+        self.n_nodes = len(self.feature)
+        self.max_depth = max_depth
+        self.trees = trees  # tree_ sklearn; None jika di-load dari artifact mmap
+        self.lookups = {
+            col: ({value: code for code, value in enumerate(categories) if not pd.isna(value)},
+                  next((code for code, value in enumerate(categories) if pd.isna(value)), -1))
+            for col, (categories, _, _) in categorical.items()
+        }
+
+    @classmethod
+    def from_forest(
+        cls,
+        feature_specs: List[Tuple[str, str, int]],
+        categorical: Dict[str, Tuple[pd.Index, str, np.ndarray]],
+        forest: Any,
+        normalize_leaves: bool,
+        allow_nan: bool = False,
+    ) -> "CompiledForest":
+        classes = np.asarray(forest.classes_)
+        features, thresholds, lefts, rights, leaf_values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        n_classes = len(classes)
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            node_ids = np.arange(n_nodes, dtype=np.int64)
+            is_leaf = tree.children_left < 0
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int64))
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold).astype(np.float64))
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+            value = np.asarray(tree.value[:, 0, :n_classes], dtype=np.float64)
+            if normalize_leaves:
+                # sklearn < 1.4: tree_.value berisi weighted count, predict_proba menormalisasi
+                normalizer = value.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                value = value / normalizer
+            leaf_values.append(value)
+            roots.append(offset)
+            max_depth = max(max_depth, tree.max_depth)
+            offset += n_nodes
+
+        arrays = {
+            'feature': np.ascontiguousarray(np.concatenate(features)),
+            'threshold': np.ascontiguousarray(np.concatenate(thresholds)),
+            'left': np.ascontiguousarray(np.concatenate(lefts)),
+            'right': np.ascontiguousarray(np.concatenate(rights)),
+            'leaf_proba': np.ascontiguousarray(np.concatenate(leaf_values)),
+            'roots': np.asarray(roots, dtype=np.int64),
+            'classes': classes,
+        }
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        return cls(feature_specs, categorical, arrays, max_depth, trees, allow_nan)
+
+    def save(self, path: Path, version: str) -> None:
+        """Tulis array .npy + meta.json ke directory baru `path` (dibuat di sini)."""
+        if self.classes.dtype.kind not in 'biuU':
+            raise UnsupportedModel(f'classes dtype {self.classes.dtype} cannot be memory-mapped')
+        path.mkdir(parents=True)
+        for name in self.ARRAYS:
+            np.save(path / f'{name}.npy', np.ascontiguousarray(getattr(self, name)), allow_pickle=False)
+        meta = {
+            'format': self.FORMAT_VERSION,
+            'model_version': version,
+            'max_depth': self.max_depth,
+            'allow_nan': self.allow_nan,
+            'feature_specs': [list(spec) for spec in self.feature_specs],
+            'categorical': {
+                col: {
+                    'categories': [
+                        None if pd.isna(value) else value.item() if isinstance(value, np.generic) else value
+                        for value in categories.tolist()
+                    ],
+                    'handle_unknown': handle_unknown,
+                    'ordinal_values': values.tolist(),
+                }
+                for col, (categories, handle_unknown, values) in self.categorical.items()
+            },
+        }
+        (path / 'meta.json').write_text(json.dumps(meta), encoding='utf-8')
+
+    @classmethod
+    def load(cls, path: Path, version: str) -> "CompiledForest":
+        """Map artifact hasil save() read-only: page cache dipakai bersama oleh semua worker."""
+        meta = json.loads((path / 'meta.json').read_text(encoding='utf-8'))
+        if meta.get('format') != cls.FORMAT_VERSION or meta.get('model_version') != version:
+            raise UnsupportedModel(f'stale compiled artifact in {path}')
+        arrays = {name: np.load(path / f'{name}.npy', mmap_mode='r', allow_pickle=False) for name in cls.ARRAYS}
+        categorical = {
+            col: (
+                pd.Index([np.nan if value is None else value for value in spec['categories']], dtype=object),
+                spec['handle_unknown'],
+                np.asarray(spec['ordinal_values'], dtype=np.float64),
+            )
+            for col, spec in meta['categorical'].items()
+        }
+        feature_specs = [(kind, col, int(k)) for kind, col, k in meta['feature_specs']]
+        return cls(feature_specs, categorical, arrays, int(meta['max_depth']), allow_nan=bool(meta['allow_nan']))
+
+    def _category_codes(self, col: str, values: np.ndarray) -> np.ndarray:
+        categories, handle_unknown, _ = self.categorical[col]
+        if len(values) < self.SMALL_FRAME_ROWS:
+            lookup, na_code = self.lookups[col]
+            code = np.fromiter(
+                (na_code if pd.isna(v) else lookup.get(v, -1) for v in values), dtype=np.int64, count=len(values)
+            )
+        else:
+            code = categories.get_indexer(values)
+        if handle_unknown == 'error' and (code < 0).any():
+            unknown = sorted({str(v) for v in values[code < 0]})
+            raise ValueError(f"Found unknown categories {unknown} in column {col} during transform")
+        return code
+
+    def encode(self, X: pd.DataFrame) -> np.ndarray:
+        """Raw feature frame -> matrix float32 seperti output ColumnTransformer."""
+        if len(X) < self.SMALL_FRAME_ROWS:
+            raw = X.to_numpy(dtype=object)
+            return self.encode_columns({col: raw[:, i] for i, col in enumerate(X.columns)}, len(X))
+        return self.encode_columns({col: X[col].to_numpy() for col in X.columns}, len(X))
+
+    def encode_columns(self, columns: Dict[str, np.ndarray], n_rows: int) -> np.ndarray:
+        """Kolom fitur (hasil FeatureEncoder.batch) -> matrix float32."""
+        codes = {col: self._category_codes(col, np.asarray(columns[col], dtype=object)) for col in self.categorical}
+
+        out = np.empty((n_rows, self.n_features), dtype=np.float32)
+        for j, (kind, col, k) in enumerate(self.feature_specs):
+            if kind == 'num':
+                with np.errstate(over='ignore'):  # > float32 max -> inf, ditolak _check_finite
+                    out[:, j] = np.asarray(columns[col], dtype=np.float64)
+            elif kind == 'onehot':
+                out[:, j] = codes[col] == k
+            else:  # ordinal: code -1 (unknown) = elemen terakhir tabel
+                out[:, j] = self.categorical[col][2][codes[col]]
+        return self._check_finite(out)
+
+    @staticmethod
+    def _check_finite(X32: np.ndarray) -> np.ndarray:
+        # sklearn menolak inf (termasuk nilai di luar range float32); NaN diteruskan
+        if np.isinf(X32).any():
+            raise ValueError("Input X contains infinity or a value too large for dtype('float32').")
+        return X32
+
+    def encode_row(self, features: Dict[str, Any]) -> np.ndarray:
+        """Satu baris fitur (hasil FeatureEncoder.row) -> matrix float32 (1, n_features), tanpa array per kolom."""
+        codes: Dict[str, int] = {}
+        for col, (_, handle_unknown, _) in self.categorical.items():
+            value = features[col]
+            lookup, na_code = self.lookups[col]
+            code = na_code if pd.isna(value) else lookup.get(value, -1)
+            if handle_unknown == 'error' and code < 0:
+                raise ValueError(f"Found unknown categories {[str(value)]} in column {col} during transform")
+            codes[col] = code
+        row = [
+            features[col] if kind == 'num'
+            else float(codes[col] == k) if kind == 'onehot'
+            else self.categorical[col][2][codes[col]]
+            for kind, col, k in self.feature_specs
+        ]
+        with np.errstate(over='ignore'):
+            return self._check_finite(np.asarray([row], dtype=np.float32))
+
+    def predict_encoded(self, X32: np.ndarray) -> np.ndarray:
+        """Matrix hasil encode -> classes_ seperti forest.predict."""
+        has_nan = bool(np.isnan(X32).any())
+        if has_nan and not self.allow_nan:
+            raise ValueError('Input X contains NaN.')
+        if self.trees is not None and (len(X32) > self.TRAVERSAL_MAX_ROWS or has_nan):
+            return self._predict_apply(X32)
+        if len(X32) > self.TRAVERSAL_MAX_ROWS:
+            return self._predict_compacted(X32)
+        return self._predict_traversal(X32)
+
+    def _predict_apply(self, X32: np.ndarray) -> np.ndarray:
+        """Leaf per tree lewat tree_.apply (juga menangani NaN persis seperti sklearn)."""
+        X32 = np.ascontiguousarray(X32, dtype=np.float32)
+        proba = np.zeros((len(X32), len(self.classes)), dtype=np.float64)
+        for root, tree in zip(self.roots, self.trees):
+            proba += self.leaf_proba[root + tree.apply(X32)]
+        proba /= self.n_estimators
+        return self.classes.take(np.argmax(proba, axis=1))
+
+    def _predict_traversal(self, X32: np.ndarray) -> np.ndarray:
+        """Traversal vektor semua tree sekaligus untuk N kecil (N=1 untuk single-row)."""
+        n_rows = len(X32)
+        out = np.empty(n_rows, dtype=self.classes.dtype)
+        for start in range(0, n_rows, self.ROW_CHUNK):
+            chunk = X32[start:start + self.ROW_CHUNK]
+            flat = chunk.ravel()
+            row_offset = (np.arange(len(chunk), dtype=np.int64) * self.n_features)[np.newaxis, :]
+            node = np.repeat(self.roots[:, np.newaxis], len(chunk), axis=1)  # (n_trees, rows)
+            for _ in range(self.max_depth):
+                go_left = flat[row_offset + self.feature[node]] <= self.threshold[node]
+                node = np.where(go_left, self.left[node], self.right[node])
+            # Jumlah per tree berurutan (axis 0) seperti akumulasi di RandomForest.predict_proba
+            proba = self.leaf_proba[node].sum(axis=0)
+            proba /= self.n_estimators
+            out[start:start + len(chunk)] = self.classes.take(np.argmax(proba, axis=1))
+        return out
+
+    def _predict_compacted(self, X32: np.ndarray) -> np.ndarray:
+        """
+        Traversal untuk batch besar tanpa tree_ sklearn (engine dari mmap): pasangan
+        (tree, row) yang sudah sampai leaf dikeluarkan tiap langkah, jadi biaya mengikuti
+        panjang path rata-rata, bukan max_depth.
+        """
+        n_rows = len(X32)
+        n_trees = len(self.roots)
+        out = np.empty(n_rows, dtype=self.classes.dtype)
+        for start in range(0, n_rows, self.ROW_CHUNK):
+            chunk = X32[start:start + self.ROW_CHUNK]
+            flat = chunk.ravel()
+            node = np.repeat(self.roots, len(chunk))  # tree-major: pair = tree * rows + row
+            row_offset = np.tile(np.arange(len(chunk), dtype=np.int64) * self.n_features, n_trees)
+            pair = np.arange(len(node))
+            leaf = np.empty(len(node), dtype=np.int64)
+            while len(node):
+                go_left = flat[row_offset + self.feature[node]] <= self.threshold[node]
+                node = np.where(go_left, self.left[node], self.right[node])
+                done = self.left[node] == node
+                leaf[pair[done]] = node[done]
+                active = ~done
+                node, row_offset, pair = node[active], row_offset[active], pair[active]
+            proba = self.leaf_proba[leaf].reshape(n_trees, len(chunk), -1).sum(axis=0)
+            proba /= self.n_estimators
+            out[start:start + len(chunk)] = self.classes.take(np.argmax(proba, axis=1))
+        return out
+
+
+def _resolve_columns(columns: Any, input_columns: List[str]) -> List[str]:
+    if isinstance(columns, (str, int, np.integer)):
+        columns = [columns]
+    if isinstance(columns, slice):
+        return list(input_columns[columns])
+    columns = list(columns)
+    if columns and all(isinstance(c, (bool, np.bool_)) for c in columns):
+        return [col for col, keep in zip(input_columns, columns) if keep]
+    return [input_columns[c] if isinstance(c, (int, np.integer)) else c for c in columns]
+
+
+def _is_identity(transformer: Any) -> bool:
+    """'passthrough' (sklearn >= 1.4 menyimpannya sebagai FunctionTransformer identitas setelah fit)."""
+    if isinstance(transformer, str):
+        return transformer == 'passthrough'
+    return isinstance(transformer, FunctionTransformer) and transformer.func is None
+
+
+def _input_columns(step: Any, feature_columns: Optional[List[str]]) -> List[str]:
+    """Kolom input step pertama: feature_names_in_ (fit dengan DataFrame), selain itu feature_columns."""
+    columns = getattr(step, 'feature_names_in_', feature_columns)
+    if columns is None:
+        raise UnsupportedModel('nama kolom input tidak diketahui (model di-fit tanpa DataFrame)')
+    return list(columns)
+
+
+def _compile_preprocessing(
+    preprocessor: Optional[Any], forest: Any, feature_columns: Optional[List[str]] = None
+) -> Tuple[List[Tuple[str, str, int]], Dict[str, Tuple[pd.Index, str, np.ndarray]], List[str]]:
+    """Feature spec per kolom output + encoder categorical dari ColumnTransformer."""
+    if preprocessor is None:
+        input_columns = _input_columns(forest, feature_columns)
+        return [('num', col, 0) for col in input_columns], {}, input_columns
+    if not isinstance(preprocessor, ColumnTransformer):
+        raise UnsupportedModel(f'preprocessing {type(preprocessor).__name__}')
+
+    input_columns = _input_columns(preprocessor, feature_columns)
+    specs: List[Tuple[str, str, int]] = []
+    categorical: Dict[str, Tuple[pd.Index, str, np.ndarray]] = {}
+    for name, transformer, columns in preprocessor.transformers_:
+        if isinstance(transformer, str) and transformer == 'drop':
+            continue
+        cols = _resolve_columns(columns, input_columns)
+        if _is_identity(transformer):
+            specs.extend(('num', col, 0) for col in cols)
+        elif isinstance(transformer, OneHotEncoder):
+            if getattr(transformer, 'drop_idx_', None) is not None or transformer.handle_unknown not in ('error', 'ignore'):
+                raise UnsupportedModel(f'OneHotEncoder {name} (drop/handle_unknown)')
+            if any(c is not None for c in (getattr(transformer, 'infrequent_categories_', None) or [])):
+                raise UnsupportedModel(f'OneHotEncoder {name} (infrequent categories)')
+            for col, cats in zip(cols, transformer.categories_):
+                categorical[col] = (pd.Index(cats, dtype=object), transformer.handle_unknown, np.empty(0))
+                specs.extend(('onehot', col, k) for k in range(len(cats)))
+        elif isinstance(transformer, OrdinalEncoder):
+            if transformer.handle_unknown not in ('error', 'use_encoded_value'):
+                raise UnsupportedModel(f'OrdinalEncoder {name} (handle_unknown)')
+            unknown_value = float(transformer.unknown_value) if transformer.handle_unknown == 'use_encoded_value' else np.nan
+            missing_value = float(getattr(transformer, 'encoded_missing_value', np.nan))
+            for col, cats in zip(cols, transformer.categories_):
+                categories = pd.Index(cats, dtype=object)
+                # nilai per code + unknown di akhir; kategori missing memakai encoded_missing_value
+                table = np.append(np.where(pd.isna(categories), missing_value, np.arange(len(categories))), unknown_value)
+                categorical[col] = (categories, transformer.handle_unknown, table)
+                specs.append(('ordinal', col, 0))
+        else:
+            raise UnsupportedModel(f'transformer {name} ({type(transformer).__name__})')
+    return specs, categorical, input_columns
+
+
+def _parity_sample(engine: CompiledForest, input_columns: List[str], n_rows: int = 2048) -> pd.DataFrame:
+    """Data sintetis untuk cek parity: kategori (+ unknown jika diizinkan) dan nilai tepat di/sekitar threshold."""
+    rng = np.random.default_rng(0)
+    split_features = engine.feature[engine.left != np.arange(engine.n_nodes)]
+    split_thresholds = engine.threshold[engine.left != np.arange(engine.n_nodes)]
+    data: Dict[str, Any] = {}
+    for col in input_columns:
+        if col in engine.categorical:
+            categories, handle_unknown, _ = engine.categorical[col]
+            values = list(categories)
+            if handle_unknown != 'error':
+                values.append('__unknown__')
+            if pd.isna(categories).any():
+                values.append(None)
+            data[col] = np.asarray(values, dtype=object)[rng.integers(0, len(values), n_rows)]
+            continue
+        j = next((j for j, (kind, c, _) in enumerate(engine.feature_specs) if c == col), None)
+        if j is None:  # kolom di-drop oleh ColumnTransformer
+            data[col] = np.zeros(n_rows)
+            continue
+        thresholds = split_thresholds[split_features == j]
+        thresholds = thresholds[np.isfinite(thresholds)]  # split NaN-vs-nilai (sklearn >= 1.4) memakai threshold inf
+        candidates = np.concatenate([
+            [0.0],
+            thresholds,
+            np.nextafter(thresholds.astype(np.float32), np.float32(np.inf)).astype(np.float64),
+            np.nextafter(thresholds.astype(np.float32), np.float32(-np.inf)).astype(np.float64),
+        ])
+        values = candidates[rng.integers(0, len(candidates), n_rows)]
+        if len(thresholds):
+            spread = rng.uniform(thresholds.min() - 1, thresholds.max() + 1, n_rows)
+            values = np.where(rng.random(n_rows) < 0.5, values, spread)
+        data[col] = values
+    return pd.DataFrame(data, columns=input_columns)
+
+
+def compile_model(model: Any, feature_columns: Optional[List[str]] = None) -> CompiledForest:
+    """
+    Compile Pipeline([ColumnTransformer, RandomForest]) atau forest saja. Raise
+    UnsupportedModel jika strukturnya tidak didukung atau hasil tidak identik dengan
+    model.predict pada data sintetis. feature_columns: urutan kolom input jika model
+    tidak menyimpan feature_names_in_.
+    """
+    steps = list(model.steps) if isinstance(model, Pipeline) else [('model', model)]
+    preprocessors = [step for _, step in steps[:-1] if step is not None and not (isinstance(step, str) and step == 'passthrough')]
+    forest = steps[-1][1]
+    if not isinstance(forest, (RandomForestClassifier, ExtraTreesClassifier)):
+        raise UnsupportedModel(f'estimator {type(forest).__name__}')
+    if forest.n_outputs_ != 1:
+        raise UnsupportedModel('multi-output forest')
+    if len(preprocessors) > 1:
+        raise UnsupportedModel(f'{len(preprocessors)} preprocessing steps')
+
+    specs, categorical, input_columns = _compile_preprocessing(
+        preprocessors[0] if preprocessors else None, forest, feature_columns
+    )
+    if len(specs) != forest.n_features_in_:
+        raise UnsupportedModel(f'{len(specs)} encoded features vs {forest.n_features_in_} expected')
+
+    # Dukungan NaN ikut versi sklearn terpasang (RandomForest >= 1.4 merutekan NaN, versi lama raise)
+    try:
+        forest.predict(np.full((1, forest.n_features_in_), np.nan, dtype=np.float32))
+        allow_nan = True
+    except ValueError:
+        allow_nan = False
+
+    # sklearn >= 1.4 menyimpan fraksi di tree_.value, versi lama menyimpan count:
+    # ikuti apa yang dilakukan predict_proba versi terpasang
+    engine = CompiledForest.from_forest(specs, categorical, forest, normalize_leaves=False, allow_nan=allow_nan)
+    sample = _parity_sample(engine, input_columns)
+    X32 = engine.encode(sample)
+    first_tree = forest.estimators_[0]
+    normalize = not np.array_equal(
+        first_tree.predict_proba(X32), first_tree.tree_.predict(X32)[:, :len(engine.classes)]
+    )
+    if normalize:
+        engine = CompiledForest.from_forest(specs, categorical, forest, normalize_leaves=True, allow_nan=allow_nan)
+
+    # model yang di-fit tanpa DataFrame diberi array (hindari warning feature names sklearn)
+    first_step = preprocessors[0] if preprocessors else forest
+    expected = np.asarray(model.predict(sample if hasattr(first_step, 'feature_names_in_') else sample.to_numpy()))
+    # semua jalur diuji: tree_.apply untuk semua baris, traversal untuk baris tanpa NaN
+    finite = ~np.isnan(X32).any(axis=1)
+    mismatches = int((expected != engine._predict_apply(X32)).sum())
+    mismatches += int((expected[finite] != engine._predict_traversal(X32[finite])).sum())
+    mismatches += int((expected[finite] != engine._predict_compacted(X32[finite])).sum())
+    if mismatches:
+        raise UnsupportedModel(f'parity check failed on {mismatches}/{len(sample)} synthetic rows')
+    return engine
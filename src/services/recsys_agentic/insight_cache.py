@@ -0,0 +1,110 @@
+"""Cache teks insight LLM: LRU + TTL di memory dengan tier sqlite opsional."""
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+class InsightCache:
+    """
+    Cache teks LLM: LRU + TTL di memory, opsional tier sqlite (bertahan antar restart
+    dan dipakai bersama semua worker di host yang sama).
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, db_path: str = ''):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS llm_insight_cache '
+                '(key TEXT PRIMARY KEY, created_at REAL NOT NULL, text TEXT NOT NULL)'
+            )
+            self.db.execute('CREATE INDEX IF NOT EXISTS llm_insight_cache_created_at ON llm_insight_cache (created_at)')
+            self.db.commit()
+
+    def peek(self, key: str) -> Optional[str]:
+        """Lookup memory saja (tanpa I/O); miss tidak dihitung."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        created_at, text = entry
+        if time.time() - created_at > self.ttl_seconds:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return text
+
+    async def get(self, key: str) -> Optional[str]:
+        text = self.peek(key)
+        if text is not None:
+            return text
+        if self.db is not None:
+            try:
+                row = await run_in_threadpool(self._db_get, key)
+            except sqlite3.Error as e:  # mis. 'database is locked': anggap miss
+                print(f"⚠️ Insight cache sqlite read failed: {e}")
+                row = None
+            if row is not None and time.time() - row[0] <= self.ttl_seconds:
+                self._remember(key, row[0], row[1])
+                self.disk_hits += 1
+                return row[1]
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, text: str) -> None:
+        now = time.time()
+        self._remember(key, now, text)
+        if self.db is not None:
+            try:
+                await run_in_threadpool(self._db_put, key, now, text)
+            except sqlite3.Error as e:  # entry tetap ada di LRU memory
+                print(f"⚠️ Insight cache sqlite write failed: {e}")
+
+    def _remember(self, key: str, created_at: float, text: str) -> None:
+        self.entries[key] = (created_at, text)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _db_get(self, key: str) -> Optional[Tuple[float, str]]:
+        with self._db_lock:
+            return self.db.execute('SELECT created_at, text FROM llm_insight_cache WHERE key = ?', (key,)).fetchone()
+
+    def _db_put(self, key: str, created_at: float, text: str) -> None:
+        with self._db_lock:
+            try:
+                self.db.execute('INSERT OR REPLACE INTO llm_insight_cache VALUES (?, ?, ?)', (key, created_at, text))
+                self.db.execute('DELETE FROM llm_insight_cache WHERE created_at < ?', (created_at - self.ttl_seconds,))
+                self.db.commit()
+            except sqlite3.Error:
+                self.db.rollback()  # jangan biarkan transaksi setengah jalan menahan lock
+                raise
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            'disk_tier': self.db is not None,
+        }
+
+    def close(self) -> None:
+        if self.db is not None:
+            with self._db_lock:
+                self.db.close()
+            self.db = None
@@ -2,23 +2,45 @@ from __future__ import annotations
 
 import os
 from pathlib import Path
-from typing import List, Literal, Optional, Dict, Any
-from collections import Counter
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Literal, Optional, Tuple
+from collections import Counter, deque
+from bisect import bisect_right
 from functools import lru_cache
+import asyncio
+import hashlib
+import json
+import shutil
+import threading
 import time
-import requests
+import uuid
 
+import httpx
 import joblib
 import numpy as np
 import pandas as pd
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from datetime import datetime, timezone
 
-from supabase import create_client, Client
 from dotenv import load_dotenv
 
+try:  # uvicorn src.services.recsys_agentic.main:app
+    from .insight_cache import InsightCache
+    from .ollama_limiter import LimiterRejected, OllamaLimiter
+    from .compiled_forest import CompiledForest, UnsupportedModel, compile_model
+    from .snapshot_store import SharedSnapshotStore
+    from .sketches import QuantileSketch
+except ImportError:  # main.py di-import langsung dari directory ini (tests)
+    from insight_cache import InsightCache
+    from ollama_limiter import LimiterRejected, OllamaLimiter
+    from compiled_forest import CompiledForest, UnsupportedModel, compile_model
+    from snapshot_store import SharedSnapshotStore
+    from sketches import QuantileSketch
+
 # ---------- Config ----------
 APP_DIR = Path(__file__).resolve().parent  # src/services/recsys_agentic
 SERVICES_DIR = APP_DIR.parent  # src/services
@@ -49,6 +71,59 @@ print(f"DEBUG: VITE_SUPABASE_URL = {VITE_SUPABASE_URL}")
 print(f"DEBUG: VITE_SUPABASE_ANON_KEY = {VITE_SUPABASE_ANON_KEY[:20] if VITE_SUPABASE_ANON_KEY else 'NOT SET'}...")
 
 TOP_N_DEFAULT = 5
+SNAPSHOT_TTL_SECONDS = float(os.getenv("SNAPSHOT_TTL_SECONDS", "300"))  # 0 = refresh hanya saat diminta
+# Snapshot customer sebagai .npy per kolom, di-mmap bersama semua worker di host (kosong = per proses)
+SNAPSHOT_SHARED_DIR = os.getenv("SNAPSHOT_SHARED_DIR", "")
+SNAPSHOT_LOCK_TIMEOUT_SECONDS = float(os.getenv("SNAPSHOT_LOCK_TIMEOUT_SECONDS", "300"))  # lock refresh basi setelah ini
+# Full-base analytics: chunk clean -> predict -> aggregate. "stream" = scan PostgREST per request
+# tanpa menyimpan snapshot (memory konstan), "snapshot" = chunk dari snapshot bersama
+ANALYTICS_SOURCE = os.getenv("ANALYTICS_SOURCE", "snapshot")
+ANALYTICS_CHUNK_ROWS = int(os.getenv("ANALYTICS_CHUNK_ROWS", "50000"))
+# Quantile dashboard: exact sampai sekian nilai per kolom, di atasnya KLL sketch (error rank ~1.3% untuk k=200)
+ANALYTICS_SKETCH_EXACT_MAX = int(os.getenv("ANALYTICS_SKETCH_EXACT_MAX", "100000"))
+ANALYTICS_SKETCH_K = int(os.getenv("ANALYTICS_SKETCH_K", "200"))
+# Incremental dashboard: poll customer_profile_changes (migration 003) dan terapkan delta ke
+# snapshot + agregat dashboard; 0 = nonaktif (tiap refresh snapshot = rescan penuh)
+CHANGELOG_POLL_SECONDS = float(os.getenv("CHANGELOG_POLL_SECONDS", "0"))
+CHANGELOG_MAX_DELTA_FRACTION = float(os.getenv("CHANGELOG_MAX_DELTA_FRACTION", "0.2"))  # lebih dari ini: full reload
+PRODUCT_CATALOG_TTL_SECONDS = float(os.getenv("PRODUCT_CATALOG_TTL_SECONDS", "600"))
+# Cache response /analytics/overview + churn-composition; setelah TTL response lama tetap
+# dilayani selama satu refresh jalan di background (0 = hitung ulang tiap request)
+ANALYTICS_CACHE_TTL_SECONDS = float(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", "60"))
+ANALYTIC_BATCH_MAX = int(os.getenv("ANALYTIC_BATCH_MAX", "10000"))
+PRODUCT_SWEEP_MAX_POINTS = int(os.getenv("PRODUCT_SWEEP_MAX_POINTS", "1000"))
+CUSTOMER_IN_CHUNK = 200  # customer_id per query `in` (batas panjang URL PostgREST)
+PG_PAGE_SIZE = int(os.getenv("PG_PAGE_SIZE", "1000"))  # <= max-rows PostgREST (Supabase default 1000)
+PG_MAX_IN_FLIGHT = int(os.getenv("PG_MAX_IN_FLIGHT", "8"))  # request paralel per full scan
+COMPILED_MODEL_ENABLED = os.getenv("COMPILED_MODEL", "1") != "0"  # 0 = selalu pakai clf.predict
+# Compiled forest per model version sebagai .npy (di-mmap read-only oleh semua worker di host)
+COMPILED_MODEL_DIR = Path(os.getenv("COMPILED_MODEL_DIR", str(MODEL_DIR / "compiled")))
+
+# Connection pool HTTP bersama (PostgREST + Ollama)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "30"))
+OLLAMA_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_TIMEOUT_SECONDS", "60"))
+
+# Limiter Ollama: token bucket (rate + burst), batas in-flight, antrian tunggu terbatas
+OLLAMA_RATE_PER_SECOND = float(os.getenv("OLLAMA_RATE_PER_SECOND", "0.5"))  # 0 = tanpa rate limit
+OLLAMA_BURST = int(os.getenv("OLLAMA_BURST", "1"))
+OLLAMA_MAX_IN_FLIGHT = int(os.getenv("OLLAMA_MAX_IN_FLIGHT", "2"))
+OLLAMA_QUEUE_MAX = int(os.getenv("OLLAMA_QUEUE_MAX", "32"))  # lebih dari ini: fail-fast
+OLLAMA_QUEUE_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_QUEUE_TIMEOUT_SECONDS", "30"))
+
+# AI insight jobs (di-generate di background, /infer/analytic tidak menunggu LLM)
+INSIGHT_WORKERS = int(os.getenv("INSIGHT_WORKERS", "2"))
+INSIGHT_QUEUE_MAX = int(os.getenv("INSIGHT_QUEUE_MAX", "1000"))
+INSIGHT_JOB_TTL_SECONDS = float(os.getenv("INSIGHT_JOB_TTL_SECONDS", "900"))
+INSIGHT_POLL_MAX_WAIT_SECONDS = 30.0  # batas long-poll ?wait= di endpoint status job
+INSIGHT_SSE_KEEPALIVE_SECONDS = 15.0  # comment SSE supaya proxy tidak menutup koneksi idle
+
+# Cache teks LLM (memory LRU + TTL, opsional tier sqlite di disk)
+INSIGHT_CACHE_MAX = int(os.getenv("INSIGHT_CACHE_MAX", "5000"))
+INSIGHT_CACHE_TTL_SECONDS = float(os.getenv("INSIGHT_CACHE_TTL_SECONDS", "86400"))
+INSIGHT_CACHE_DB = os.getenv("INSIGHT_CACHE_DB", "")  # path file sqlite, kosong = hanya memory
 
 # ---------- FastAPI ----------
 app = FastAPI(title="Telvora Inference Service", version="0.1.0")
@@ -65,12 +140,24 @@ class AnalyticRequest(BaseModel):
     customer_id: str
     top_n: Optional[int] = TOP_N_DEFAULT
 
+class AnalyticBatchRequest(BaseModel):
+    customer_ids: List[str]
+    top_n: Optional[int] = TOP_N_DEFAULT
+
 class ProductSimulationRequest(BaseModel):
     product_name: str
     category: str
     price: float
     duration_days: Optional[int] = 30
 
+class ProductSweepRequest(BaseModel):
+    # Grid harga untuk satu kategori, atau daftar kandidat produk (salah satu)
+    category: Optional[str] = None
+    prices: Optional[List[float]] = None
+    product_name: Optional[str] = None
+    duration_days: Optional[int] = 30
+    products: Optional[List[ProductSimulationRequest]] = None
+
 class RecommendationItem(BaseModel):
     product_id: Optional[str] = None
     product_name: str
@@ -90,6 +177,29 @@ class AnalyticResponse(BaseModel):
     user_category: str
     generated_at: str
     ai_insights: Optional[Dict[str, str]] = None
+    insight_job_id: Optional[str] = None  # poll GET /infer/analytic/insights/{id}
+
+class InsightJobResponse(BaseModel):
+    job_id: str
+    status: Literal['pending', 'running', 'done', 'failed']
+    ai_insights: Optional[Dict[str, str]] = None
+    error: Optional[str] = None
+    created_at: str
+    completed_at: Optional[str] = None
+
+class AnalyticBatchItem(BaseModel):
+    customer_id: str
+    recommendations: Optional[Dict[str, Any]] = None
+    churn: Optional[ChurnResult] = None
+    user_category: Optional[str] = None
+    error: Optional[str] = None
+
+class AnalyticBatchResponse(BaseModel):
+    results: List[AnalyticBatchItem]
+    total: int
+    succeeded: int
+    failed: int
+    generated_at: str
 
 class ProductSimulationResponse(BaseModel):
     hits: int
@@ -98,12 +208,32 @@ class ProductSimulationResponse(BaseModel):
     segments: Dict[str, int]
     recommendation: str
     total_users: Optional[int] = None
+    addressable_spend: Optional[float] = None  # total monthly_spend user yang hit
+    generated_at: str
+
+class ProductSweepPoint(BaseModel):
+    product_name: str
+    category: str
+    price: float
+    hits: int
+    revenue: float
+    conversion_rate: float
+    segments: Dict[str, int]
+    recommendation: str
+    addressable_spend: float
+
+class ProductSweepResponse(BaseModel):
+    points: List[ProductSweepPoint]
+    total_users: int
     generated_at: str
 
 # ---------- Load artifacts ----------
-gemini_last_call_time = 0  # Track last API call to rate limit
-gemini_call_interval = 2  # Minimum seconds between calls
+clf: Any = None  # Pipeline sklearn; di-load lazy jika compiled forest berasal dari artifact mmap
+label_encoder: Any = None
 global_averages: Dict[str, float] | None = None
+model_version: Optional[str] = None  # artifact_version() dari model_dokter_rf.pkl
+compiled_model: Optional["CompiledForest"] = None  # clf yang di-compile (None = pakai clf.predict)
+_model_lock = threading.Lock()
 
 TARGET_TO_CATEGORY_MAP = {
     'Data Booster': 'Data',
@@ -127,99 +257,339 @@ CATEGORY_SORTING_LOGIC = {
     'SMS': ('price_per_sms', True, 'Rekomendasi Tambahan (SMS Best Value):'),
 }
 
+NUMERIC_FEATURES = [
+    'avg_data_usage_gb',
+    'pct_video_usage',
+    'avg_call_duration',
+    'sms_freq',
+    'monthly_spend',
+    'topup_freq',
+    'travel_score',
+    'complaint_count',
+]
+CATEGORICAL_FEATURES = ['plan_type', 'device_brand']
+MODEL_FEATURE_COLUMNS = CATEGORICAL_FEATURES + NUMERIC_FEATURES  # urutan fitur saat training
+COLS_FIX_NEGATIVE = ['avg_call_duration', 'monthly_spend']
+
+# Projection customer_profile per consumer (select kolom eksplisit, bukan '*')
+CUSTOMER_MODEL_COLUMNS = ['customer_id'] + MODEL_FEATURE_COLUMNS  # inference per customer + prompt LLM
+CUSTOMER_SNAPSHOT_COLUMNS = CUSTOMER_MODEL_COLUMNS + ['target_offer']  # snapshot full-base
+
 CALL_THRESHOLD = 10.0
 VOD_THRESHOLD = 0.4
 SMS_THRESHOLD = 15.0
 
-supabase: Optional[Client] = None
-gemini_last_call_time = 0  # Track last API call to rate limit
-gemini_call_interval = 2  # Minimum seconds between calls
-gemini_last_call_time = 0  # Track last API call to rate limit
-gemini_call_interval = 2  # Minimum seconds between calls
+# ---------- HTTP clients ----------
+def http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
 
 
-def fetch_all_users_paginated(page_size: int = 1000, max_attempts: int = 20) -> List[Dict[str, Any]]:
-    """Fetch all customer_profile rows with pagination (same pattern as simulate_product_impact)."""
-    if supabase is None:
-        raise HTTPException(status_code=503, detail='Database not configured')
+def pg_in(values: List[Any]) -> str:
+    """Filter PostgREST `in.(...)` dengan quoting (aman untuk nilai berisi koma/kurung)."""
+    quoted = ','.join('"' + str(v).replace('\\', '\\\\').replace('"', '\\"') + '"' for v in values)
+    return f'in.({quoted})'
 
-    all_users: List[Dict[str, Any]] = []
-    page = 0
-    attempt = 0
-    empty_batches = 0
 
-    while attempt < max_attempts:
-        start_range = len(all_users)
-        end_range = len(all_users) + page_size - 1
+class PostgrestClient:
+    """
+    Minimal async PostgREST client untuk tabel Supabase.
 
-        res = supabase.table('customer_profile').select('*').range(start_range, end_range).execute()
-        batch_size = len(res.data) if res.data else 0
+    Semua request memakai satu httpx.AsyncClient (connection pool + keep-alive),
+    sehingga handler tidak memblok worker thread selama round trip ke database.
+    """
 
-        if batch_size > 0:
-            all_users.extend(res.data)
-            empty_batches = 0
-        else:
-            empty_batches += 1
+    def __init__(self, base_url: str, api_key: str) -> None:
+        self.http = httpx.AsyncClient(
+            base_url=f"{base_url.rstrip('/')}/rest/v1",
+            headers={'apikey': api_key, 'Authorization': f'Bearer {api_key}'},
+            limits=http_limits(),
+            timeout=HTTP_TIMEOUT_SECONDS,
+        )
 
-        if empty_batches >= 2:
-            break
+    async def select(
+        self,
+        table: str,
+        columns: str = '*',
+        filters: Optional[Dict[str, str]] = None,
+        order: Optional[str] = None,
+        offset: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        params: Dict[str, str] = {'select': columns}
+        params.update(filters or {})
+        if order is not None:
+            params['order'] = order
+        if offset is not None:
+            params['offset'] = str(offset)
+        if limit is not None:
+            params['limit'] = str(limit)
+
+        resp = await self.http.get(f"/{table}", params=params)
+        self._raise_for_status(resp)
+        return resp.json()
+
+    async def count(self, table: str, filters: Optional[Dict[str, str]] = None) -> int:
+        """Exact row count (Prefer: count=exact, dibaca dari header Content-Range)."""
+        params: Dict[str, str] = {'select': '*', 'limit': '1'}
+        params.update(filters or {})
+        resp = await self.http.get(f"/{table}", params=params, headers={'Prefer': 'count=exact'})
+        self._raise_for_status(resp)
+        total = resp.headers.get('content-range', '').rsplit('/', 1)[-1]
+        if not total.isdigit():
+            raise HTTPException(status_code=502, detail=f'Database did not return an exact count for {table}')
+        return int(total)
+
+    @staticmethod
+    def _raise_for_status(resp: httpx.Response) -> None:
+        if resp.status_code >= 400:
+            raise HTTPException(status_code=502, detail=f'Database error ({resp.status_code}): {resp.text[:200]}')
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+
+
+supabase_rest: Optional[PostgrestClient] = None
+ollama_http: Optional[httpx.AsyncClient] = None
+_async_locks: Dict[str, asyncio.Lock] = {}
+
+
+def async_lock(name: str) -> asyncio.Lock:
+    """asyncio.Lock per nama, dibuat lazily di dalam event loop yang sedang berjalan."""
+    lock = _async_locks.get(name)
+    if lock is None:
+        lock = _async_locks[name] = asyncio.Lock()
+    return lock
+
+
+async def gather_bounded(factories: List[Callable[[], Awaitable[Any]]], limit: int) -> List[Any]:
+    """asyncio.gather dengan maksimal `limit` request in-flight; urutan hasil = urutan input."""
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(factory: Callable[[], Awaitable[Any]]) -> Any:
+        async with semaphore:
+            return await factory()
+
+    return await asyncio.gather(*(run(factory) for factory in factories))
+
+
+# ---------- LLM insight cache ----------
+# Naikkan versi saat isi prompt diubah supaya teks lama tidak terpakai lagi
+PRODUCT_INSIGHT_TEMPLATE_VERSION = 'product-v2'
+CHURN_INSIGHT_TEMPLATE_VERSION = 'churn-v2'
+
+# Batas bucket untuk signature profil (customer dengan bucket sama berbagi insight)
+SPEND_BUCKET_EDGES = (25000, 50000, 75000, 100000, 150000, 250000, 500000)
+DATA_GB_BUCKET_EDGES = (1, 3, 5, 10, 20, 40)
+VIDEO_PCT_BUCKET_EDGES = (0.1, 0.25, 0.5, 0.75)
+CALL_BUCKET_EDGES = (1, 3, 5, 10, 20, 40)
+COMPLAINT_BUCKET_EDGES = (0, 1, 2, 4)
+TOPUP_BUCKET_EDGES = (1, 2, 4, 8)
+TRAVEL_BUCKET_EDGES = (0.2, 0.4, 0.6, 0.8)
+
+
+def _bucket(user_profile: Dict[str, Any], col: str, edges: Tuple[float, ...]) -> int:
+    try:
+        value = float(user_profile.get(col) or 0)
+    except (TypeError, ValueError):
+        value = 0.0
+    return bisect_right(edges, value)
+
+
+def _insight_cache_key(template_version: str, signature: List[Any]) -> str:
+    raw = json.dumps([template_version, OLLAMA_MODEL, signature], default=str)
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
 
-        page += 1
-        attempt += 1
 
-    return all_users
+def product_insight_key(pred_label: str, user_profile: Dict[str, Any], recommendations: List[RecommendationItem]) -> str:
+    return _insight_cache_key(PRODUCT_INSIGHT_TEMPLATE_VERSION, [
+        pred_label,
+        _bucket(user_profile, 'monthly_spend', SPEND_BUCKET_EDGES),
+        _bucket(user_profile, 'avg_data_usage_gb', DATA_GB_BUCKET_EDGES),
+        _bucket(user_profile, 'pct_video_usage', VIDEO_PCT_BUCKET_EDGES),
+        _bucket(user_profile, 'avg_call_duration', CALL_BUCKET_EDGES),
+        [item.product_id for item in recommendations[:3]],
+    ])
+
+
+def churn_insight_key(churn_proba: float, user_profile: Dict[str, Any], pred_label: str) -> str:
+    return _insight_cache_key(CHURN_INSIGHT_TEMPLATE_VERSION, [
+        pred_label,
+        round(churn_proba, 2),
+        _bucket(user_profile, 'complaint_count', COMPLAINT_BUCKET_EDGES),
+        _bucket(user_profile, 'monthly_spend', SPEND_BUCKET_EDGES),
+        _bucket(user_profile, 'topup_freq', TOPUP_BUCKET_EDGES),
+        _bucket(user_profile, 'travel_score', TRAVEL_BUCKET_EDGES),
+    ])
+
+
+def is_llm_unavailable(text: str) -> bool:
+    """Fallback call_ollama_safe karena LLM tidak bisa dipakai (nonaktif, quota, error, limiter)."""
+    lowered = text.lower()
+    return "tidak tersedia" in lowered or "quota" in lowered
+
+
+def is_llm_error(text: str) -> bool:
+    """Teks fallback dari call_ollama_safe (tidak boleh di-cache), termasuk respons kosong."""
+    return is_llm_unavailable(text) or "tidak memberikan respons" in text.lower()
 
 
-def call_ollama_safe(prompt: str) -> str:
-    """Call Ollama API (Cloud or Local) with rate limiting and graceful fallbacks."""
-    global gemini_last_call_time
+insight_cache = InsightCache(INSIGHT_CACHE_MAX, INSIGHT_CACHE_TTL_SECONDS, INSIGHT_CACHE_DB)
+
+
+async def cached_llm_call(
+    key: str,
+    prompt: str,
+    on_delta: Optional[Callable[[str], None]] = None,
+    lookup: bool = True,
+) -> str:
+    """
+    call_ollama_safe lewat insight_cache; hanya respons sukses yang di-cache.
+    lookup=False: caller sudah mendapat miss untuk key ini, jangan cek (dan hitung) lagi.
+    """
+    text = await insight_cache.get(key) if lookup else None
+    if text is not None:
+        if on_delta is not None:
+            on_delta(text)
+        return text
+    text = await call_ollama_safe(prompt, on_delta)
+    if not is_llm_error(text):
+        await insight_cache.put(key, text)
+    return text
+
+
+ollama_limiter = OllamaLimiter(
+    OLLAMA_RATE_PER_SECOND, OLLAMA_BURST, OLLAMA_MAX_IN_FLIGHT, OLLAMA_QUEUE_MAX, OLLAMA_QUEUE_TIMEOUT_SECONDS
+)
+
+
+async def call_ollama_safe(
+    prompt: str,
+    on_delta: Optional[Callable[[str], None]] = None,
+    json_mode: bool = False,
+) -> str:
+    """
+    Panggil Ollama API (cloud atau lokal) lewat ollama_limiter, dengan teks fallback jika gagal.
 
+    on_delta diset: pakai mode streaming dan panggil on_delta per potongan teks;
+    return value tetap teks lengkap (atau teks fallback jika gagal).
+    json_mode: minta model mengembalikan satu object JSON.
+    """
     if not OLLAMA_MODEL:
         return "AI insights tidak tersedia (OLLAMA_MODEL tidak diset)."
 
     try:
-        # Rate limiting: minimum interval between calls
-        current_time = time.time()
-        time_since_last_call = current_time - gemini_last_call_time
-        if time_since_last_call < gemini_call_interval:
-            wait_time = gemini_call_interval - time_since_last_call
-            print(f"⏳ Rate limiting: waiting {wait_time:.1f}s before next Ollama call")
-            time.sleep(wait_time)
-
-        gemini_last_call_time = time.time()
-
-        # Prepare headers (include API key for cloud/auth endpoints)
-        headers = {"Content-Type": "application/json"}
-        if OLLAMA_API_KEY:
-            headers["Authorization"] = f"Bearer {OLLAMA_API_KEY}"
-
-        # Detect if using Ollama Cloud (API key present) or local
-        is_cloud = OLLAMA_API_KEY and ("ollama.com" in OLLAMA_BASE_URL.lower() or "api" in OLLAMA_BASE_URL.lower())
-        
-        if is_cloud:
-            # Ollama Cloud API endpoint format (OpenAI-compatible: /v1/chat/completions)
-            base_url = OLLAMA_BASE_URL.rstrip('/')
-            if base_url.endswith('/api'):
-                endpoint = f"{base_url}/v1/chat/completions"
-            else:
-                endpoint = f"{base_url}/v1/chat/completions"
-            payload = {
-                "model": OLLAMA_MODEL,
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.7,
-            }
-            print(f"📡 Calling Ollama Cloud (OpenAI format): {endpoint}")
-        else:
-            # Local Ollama API endpoint format (uses /api/generate)
-            endpoint = f"{OLLAMA_BASE_URL.rstrip('/')}/api/generate"
-            payload = {
-                "model": OLLAMA_MODEL,
-                "prompt": prompt,
-                "stream": False,
-            }
-            print(f"📡 Calling Local Ollama: {endpoint}")
+        async with ollama_limiter.slot() as waited:
+            if waited >= 0.5:
+                print(f"⏳ Rate limiting: waited {waited:.1f}s for an Ollama slot")
+            if on_delta is not None:
+                return await _stream_ollama(prompt, on_delta, json_mode)
+            return await _post_ollama(prompt, json_mode)
+    except LimiterRejected as e:
+        print(f"⚠️ Ollama limiter rejected call: {e}")
+        return f"AI tidak tersedia (limiter: {e})"
+
+
+def _ollama_request(prompt: str, stream: bool, json_mode: bool = False) -> Tuple[str, Dict[str, Any], Dict[str, str], bool]:
+    """Endpoint, payload, headers dan mode (cloud OpenAI-compatible vs local) untuk satu prompt."""
+    # Prepare headers (include API key for cloud/auth endpoints)
+    headers = {"Content-Type": "application/json"}
+    if OLLAMA_API_KEY:
+        headers["Authorization"] = f"Bearer {OLLAMA_API_KEY}"
+
+    # Detect if using Ollama Cloud (API key present) or local
+    is_cloud = bool(OLLAMA_API_KEY and ("ollama.com" in OLLAMA_BASE_URL.lower() or "api" in OLLAMA_BASE_URL.lower()))
+
+    if is_cloud:
+        # Ollama Cloud API endpoint format (OpenAI-compatible: /v1/chat/completions)
+        endpoint = f"{OLLAMA_BASE_URL.rstrip('/')}/v1/chat/completions"
+        payload = {
+            "model": OLLAMA_MODEL,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.7,
+        }
+        if stream:
+            payload["stream"] = True
+        if json_mode:
+            payload["response_format"] = {"type": "json_object"}
+        print(f"📡 Calling Ollama Cloud (OpenAI format): {endpoint}")
+    else:
+        # Local Ollama API endpoint format (uses /api/generate)
+        endpoint = f"{OLLAMA_BASE_URL.rstrip('/')}/api/generate"
+        payload = {
+            "model": OLLAMA_MODEL,
+            "prompt": prompt,
+            "stream": stream,
+        }
+        if json_mode:
+            payload["format"] = "json"
+        print(f"📡 Calling Local Ollama: {endpoint}")
+    return endpoint, payload, headers, is_cloud
+
+
+async def _stream_ollama(prompt: str, on_delta: Callable[[str], None], json_mode: bool = False) -> str:
+    """
+    Versi streaming _post_ollama. Local /api/generate mengirim NDJSON
+    ({"response": "...", "done": false} per baris); mode OpenAI-compatible mengirim
+    SSE `data: {"choices": [{"delta": {"content": "..."}}]}` diakhiri `data: [DONE]`.
+    Hanya sukses jika penanda akhir (`done` / finish_reason / [DONE]) diterima; stream
+    yang putus di tengah jadi teks "AI tidak tersedia" (tidak di-cache).
+    """
+    parts: List[str] = []
+    finished = False
+    try:
+        endpoint, payload, headers, is_cloud = _ollama_request(prompt, stream=True, json_mode=json_mode)
+        async with ollama_http.stream("POST", endpoint, json=payload, headers=headers) as resp:
+            if resp.status_code != 200:
+                body = (await resp.aread()).decode(errors='replace')
+                print(f"⚠️ Ollama API returned status {resp.status_code}: {body[:200]}")
+                return f"AI tidak tersedia (status {resp.status_code})"
+
+            async for line in resp.aiter_lines():
+                line = line.strip()
+                if not line:
+                    continue
+                if is_cloud:
+                    if not line.startswith("data:"):
+                        continue
+                    line = line[len("data:"):].strip()
+                    if line == "[DONE]":
+                        finished = True
+                        break
+                    chunk = json.loads(line)
+                    choices = chunk.get("choices") or [{}]
+                    delta = (choices[0].get("delta") or {}).get("content") or ""
+                    done = choices[0].get("finish_reason") is not None
+                else:
+                    chunk = json.loads(line)
+                    delta = chunk.get("response") or ""
+                    done = bool(chunk.get("done"))
+                if delta:
+                    parts.append(delta)
+                    on_delta(delta)
+                if done:
+                    finished = True
+                    break
+    except Exception as e:
+        error_msg = str(e)
+        print(f"⚠️ Ollama API error: {error_msg} (after {len(parts)} chunks)")
+        return f"AI tidak tersedia: {error_msg[:120]}"
+    if not finished:
+        print(f"⚠️ Ollama stream closed before done (after {len(parts)} chunks)")
+        return "AI tidak tersedia: stream terputus sebelum selesai"
+
+    text = "".join(parts)
+    return text if text else "AI tidak memberikan respons teks."
 
-        resp = requests.post(endpoint, json=payload, headers=headers, timeout=60)
+
+async def _post_ollama(prompt: str, json_mode: bool = False) -> str:
+    """Satu POST ke Ollama (tanpa limiter); error dikembalikan sebagai teks fallback."""
+    try:
+        endpoint, payload, headers, is_cloud = _ollama_request(prompt, stream=False, json_mode=json_mode)
+        resp = await ollama_http.post(endpoint, json=payload, headers=headers)
 
         if resp.status_code != 200:
             print(f"⚠️ Ollama API returned status {resp.status_code}: {resp.text[:200]}")
@@ -242,7 +612,13 @@ def call_ollama_safe(prompt: str) -> str:
         return f"AI tidak tersedia: {error_msg[:120]}"
 
 
-def gemini_user_product_insight(pred_label: str, user_profile: Dict[str, Any], recommendations: List[RecommendationItem]) -> str:
+async def gemini_user_product_insight(
+    pred_label: str,
+    user_profile: Dict[str, Any],
+    recommendations: List[RecommendationItem],
+    on_delta: Optional[Callable[[str], None]] = None,
+    lookup: bool = True,
+) -> str:
     """Generate product recommendation insights using Gemini AI"""
     # Format recommendations for prompt
     recs_text = "\n".join([
@@ -272,10 +648,16 @@ Buatkan deskripsi singkat (maksimal 3 kalimat) yang menjelaskan:
 
 Gunakan bahasa yang profesional namun mudah dipahami.
 """
-    return call_ollama_safe(prompt)
+    return await cached_llm_call(product_insight_key(pred_label, user_profile, recommendations), prompt, on_delta, lookup)
 
 
-def gemini_churn_analysis(churn_proba: float, user_profile: Dict[str, Any], pred_label: str) -> str:
+async def gemini_churn_analysis(
+    churn_proba: float,
+    user_profile: Dict[str, Any],
+    pred_label: str,
+    on_delta: Optional[Callable[[str], None]] = None,
+    lookup: bool = True,
+) -> str:
     """Generate churn risk analysis using Gemini AI"""
     churn_pct = churn_proba * 100
     risk_level = "TINGGI" if churn_proba > 0.5 else "SEDANG" if churn_proba > 0.2 else "RENDAH"
@@ -300,11 +682,451 @@ Buatkan analisis singkat (maksimal 3 kalimat) yang menjelaskan:
 
 Gunakan bahasa yang profesional dan actionable.
 """
-    return call_ollama_safe(prompt)
+    return await cached_llm_call(churn_insight_key(churn_proba, user_profile, pred_label), prompt, on_delta, lookup)
+
+
+INSIGHT_CHURN_PROBA = 0.0  # Not calculated anymore
+INSIGHT_SECTIONS = ('product_recommendation', 'churn_analysis')
+
+
+def combined_insight_prompt(
+    pred_label: str,
+    churn_proba: float,
+    user_profile: Dict[str, Any],
+    recommendations: List[RecommendationItem],
+) -> str:
+    """Satu prompt untuk kedua insight (product + churn), jawaban berupa object JSON."""
+    recs_text = "\n".join([
+        f"- {item.product_name} ({item.category}) - Rp {item.price:,.0f} / {item.duration_days} hari"
+        for item in recommendations[:3]
+    ])
+    churn_pct = churn_proba * 100
+    risk_level = "TINGGI" if churn_proba > 0.5 else "SEDANG" if churn_proba > 0.2 else "RENDAH"
+
+    return f"""
+Role: Senior Product Marketing & Customer Retention Analyst Telco.
+Konteks: Analisis rekomendasi produk dan risiko churn untuk pelanggan individual.
+
+Data Pelanggan:
+- Status Prediksi AI: {pred_label} (Kebutuhan utama pelanggan)
+- Pengeluaran Bulanan: Rp {user_profile.get('monthly_spend', 0):,.0f}
+- Penggunaan Data: {user_profile.get('avg_data_usage_gb', 0):.1f} GB/bulan
+- Video Streaming: {user_profile.get('pct_video_usage', 0):.1f}%
+- Durasi Panggilan: {user_profile.get('avg_call_duration', 0):.1f} menit
+- Probabilitas Churn: {churn_pct:.1f}% (Risiko: {risk_level})
+- Frekuensi Komplain: {user_profile.get('complaint_count', 0)} kali
+- Frekuensi Top-up: {user_profile.get('topup_freq', 0)}x/bulan
+- Travel Score: {user_profile.get('travel_score', 0):.2f}
+
+Produk yang Direkomendasikan:
+{recs_text}
+
+Tugas:
+1. "product_recommendation": deskripsi singkat (maksimal 3 kalimat) mengapa produk-produk ini
+   cocok untuk profil penggunaan pelanggan, benefit utamanya, dan saran cara menawarkan
+   produk dengan persuasif.
+2. "churn_analysis": analisis singkat (maksimal 3 kalimat) tentang faktor utama risiko churn,
+   insight perilaku pelanggan yang perlu diperhatikan, dan strategi retensi yang disarankan.
+
+Gunakan bahasa yang profesional, mudah dipahami dan actionable.
+Jawab HANYA dengan satu object JSON tanpa teks lain:
+{{"product_recommendation": "...", "churn_analysis": "..."}}
+"""
+
+
+def parse_insight_sections(text: str) -> Dict[str, str]:
+    """Ambil section dari jawaban JSON (boleh dibungkus code fence); section invalid/kosong di-skip."""
+    start, end = text.find('{'), text.rfind('}')
+    if start < 0 or end <= start:
+        return {}
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {
+        section: data[section].strip()
+        for section in INSIGHT_SECTIONS
+        if isinstance(data.get(section), str) and data[section].strip()
+    }
+
+
+def _partial_json_string(text: str, key: str) -> str:
+    """Isi string untuk `key` dari JSON yang belum lengkap (selama streaming)."""
+    marker = text.find(f'"{key}"')
+    if marker < 0:
+        return ''
+    pos = text.find(':', marker + len(key) + 2)
+    if pos < 0:
+        return ''
+    pos += 1
+    while pos < len(text) and text[pos] in ' \t\r\n':
+        pos += 1
+    if pos >= len(text) or text[pos] != '"':
+        return ''
+    start = end = pos + 1
+    while end < len(text):
+        ch = text[end]
+        if ch == '"':
+            break
+        if ch == '\\':
+            width = 6 if text[end + 1:end + 2] == 'u' else 2
+            if end + width > len(text):
+                break  # escape belum lengkap, tunggu potongan berikutnya
+            end += width
+            continue
+        end += 1
+    try:
+        return json.loads(f'"{text[start:end]}"')
+    except ValueError:
+        return ''
+
+
+class SectionStreamer:
+    """Ubah delta JSON mentah dari combined prompt menjadi delta teks per section untuk job."""
+
+    def __init__(self, job: InsightJob):
+        self.job = job
+        self.raw: List[str] = []
+        self.sent: Dict[str, int] = {section: 0 for section in INSIGHT_SECTIONS}
+
+    def __call__(self, delta: str) -> None:
+        self.raw.append(delta)
+        text = ''.join(self.raw)
+        for section in INSIGHT_SECTIONS:
+            value = _partial_json_string(text, section)
+            if len(value) > self.sent[section]:
+                self.job.append_delta(section, value[self.sent[section]:])
+                self.sent[section] = len(value)
+
+
+async def generate_ai_insights(
+    pred_label: str,
+    customer_row: Dict[str, Any],
+    items: List[RecommendationItem],
+    job: Optional[InsightJob] = None,
+) -> Dict[str, str]:
+    """
+    Kedua insight lewat satu call LLM (jawaban JSON). Section yang sudah ada di cache
+    tidak diminta ulang; section yang gagal di-parse di-generate ulang dengan prompt
+    per section. Jika job diberikan, teks di-stream ke job per potongan (dibaca endpoint SSE).
+    """
+    keys = {
+        'product_recommendation': product_insight_key(pred_label, customer_row, items),
+        'churn_analysis': churn_insight_key(INSIGHT_CHURN_PROBA, customer_row, pred_label),
+    }
+    sections: Dict[str, Optional[str]] = {section: await insight_cache.get(keys[section]) for section in INSIGHT_SECTIONS}
+
+    if any(text is None for text in sections.values()):
+        prompt = combined_insight_prompt(pred_label, INSIGHT_CHURN_PROBA, customer_row, items)
+        text = await call_ollama_safe(prompt, SectionStreamer(job) if job is not None else None, json_mode=True)
+        if is_llm_unavailable(text):
+            # LLM tidak tersedia: jangan coba fallback per section (sama seperti sebelumnya)
+            sections = {section: sections[section] or text for section in INSIGHT_SECTIONS}
+        else:
+            # Respons kosong / JSON rusak: section yang tidak ter-parse lewat fallback di bawah
+            parsed = parse_insight_sections(text)
+            for section, value in parsed.items():
+                if sections[section] is None:
+                    sections[section] = value
+                    await insight_cache.put(keys[section], value)
+            if len(parsed) < len(INSIGHT_SECTIONS):
+                print(f"⚠️ Combined insight JSON incomplete (got {sorted(parsed)}), falling back per section")
+
+    def on_delta(section: str) -> Optional[Callable[[str], None]]:
+        if job is None:
+            return None
+        # Buang delta parsial dari combined prompt sebelum fallback men-stream ke section yang sama
+        job.reset_section(section)
+        return lambda delta: job.append_delta(section, delta)
+
+    # Fallback per section (section yang gagal di-parse atau kosong); cache sudah dicek di atas
+    if sections['product_recommendation'] is None:
+        sections['product_recommendation'] = await gemini_user_product_insight(
+            pred_label, customer_row, items, on_delta('product_recommendation'), lookup=False
+        )
+    if job is not None:
+        job.complete_section('product_recommendation', sections['product_recommendation'])
+    if sections['churn_analysis'] is None:
+        product_insight = sections['product_recommendation']
+        if not is_llm_unavailable(product_insight):
+            sections['churn_analysis'] = await gemini_churn_analysis(
+                INSIGHT_CHURN_PROBA, customer_row, pred_label, on_delta('churn_analysis'), lookup=False
+            )
+        else:
+            sections['churn_analysis'] = product_insight
+    if job is not None:
+        job.complete_section('churn_analysis', sections['churn_analysis'])
+    return {
+        'product_recommendation': sections['product_recommendation'],
+        'churn_analysis': sections['churn_analysis'],
+    }
+
+
+def cached_ai_insights(pred_label: str, customer_row: Dict[str, Any], items: List[RecommendationItem]) -> Optional[Dict[str, str]]:
+    """Kedua insight dari memory cache tanpa I/O, atau None jika salah satu belum ada."""
+    product_insight = insight_cache.peek(product_insight_key(pred_label, customer_row, items))
+    if product_insight is None:
+        return None
+    churn_insight = insight_cache.peek(churn_insight_key(INSIGHT_CHURN_PROBA, customer_row, pred_label))
+    if churn_insight is None:
+        return None
+    return {
+        'product_recommendation': product_insight,
+        'churn_analysis': churn_insight,
+    }
+
+
+# ---------- AI insight jobs ----------
+class InsightJob:
+    """Satu job AI insight: dibuat oleh /infer/analytic, diproses worker, dibaca via polling."""
+
+    def __init__(self, pred_label: str, customer_row: Dict[str, Any], items: List[RecommendationItem]):
+        self.job_id = uuid.uuid4().hex
+        self.status = 'pending'
+        self.pred_label = pred_label
+        self.customer_row = customer_row
+        self.items = items
+        self.ai_insights: Optional[Dict[str, str]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.completed_at: Optional[float] = None
+        self.finished = asyncio.Event()
+        # Log event append-only untuk subscriber SSE: (event, data)
+        self.events: List[Tuple[str, Dict[str, Any]]] = []
+        self.changed = asyncio.Event()  # diganti baru setiap ada event
+
+    def _emit(self, event: str, data: Dict[str, Any]) -> None:
+        self.events.append((event, data))
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def append_delta(self, section: str, delta: str) -> None:
+        self._emit('delta', {'section': section, 'text': delta})
+
+    def complete_section(self, section: str, text: str) -> None:
+        """Teks final satu section (menggantikan delta, mis. jika stream putus di tengah)."""
+        self._emit('section', {'section': section, 'text': text})
+
+    def reset_section(self, section: str) -> None:
+        """Kosongkan section di client (event `section` teks kosong); delta berikutnya mulai dari awal."""
+        self._emit('section', {'section': section, 'text': '', 'reset': True})
+
+    def finish(self, ai_insights: Optional[Dict[str, str]] = None, error: Optional[str] = None) -> None:
+        self.status = 'failed' if error is not None else 'done'
+        self.ai_insights = ai_insights
+        self.error = error
+        self.completed_at = time.time()
+        self.customer_row, self.items = {}, []  # input tidak dibutuhkan lagi
+        completed = {data['section'] for event, data in self.events if event == 'section' and not data.get('reset')}
+        for section, text in (ai_insights or {}).items():
+            if section not in completed:
+                self.complete_section(section, text)
+        self._emit('done', {'status': self.status, 'ai_insights': ai_insights, 'error': error})
+        self.finished.set()
+
+    def to_response(self) -> InsightJobResponse:
+        return InsightJobResponse(
+            job_id=self.job_id,
+            status=self.status,
+            ai_insights=self.ai_insights,
+            error=self.error,
+            created_at=datetime.fromtimestamp(self.created_at, timezone.utc).isoformat(),
+            completed_at=(
+                datetime.fromtimestamp(self.completed_at, timezone.utc).isoformat()
+                if self.completed_at is not None else None
+            ),
+        )
+
+
+# Job store in-process: jalankan satu proses uvicorn per instance, atau sticky routing
+insight_jobs: Dict[str, InsightJob] = {}
+insight_queue: Optional[asyncio.Queue] = None
+insight_worker_tasks: List[asyncio.Task] = []
+
+
+def _purge_insight_jobs(now: float) -> None:
+    expired = [
+        job_id for job_id, job in insight_jobs.items()
+        if job.completed_at is not None and now - job.completed_at > INSIGHT_JOB_TTL_SECONDS
+    ]
+    for job_id in expired:
+        del insight_jobs[job_id]
+
+
+def submit_insight_job(pred_label: str, customer_row: Dict[str, Any], items: List[RecommendationItem]) -> Optional[str]:
+    """Antrikan job AI insight; None jika LLM nonaktif atau antrian penuh."""
+    if insight_queue is None:
+        return None
+    _purge_insight_jobs(time.time())
+    job = InsightJob(pred_label, customer_row, items)
+
+    # Cache hit di memory: job langsung selesai, tidak perlu lewat antrian
+    cached = cached_ai_insights(pred_label, customer_row, items)
+    if cached is not None:
+        job.finish(ai_insights=cached)
+        insight_jobs[job.job_id] = job
+        return job.job_id
+
+    try:
+        insight_queue.put_nowait(job)
+    except asyncio.QueueFull:
+        print(f"⚠️ Insight queue full ({INSIGHT_QUEUE_MAX}), skipping AI insights")
+        return None
+    insight_jobs[job.job_id] = job
+    return job.job_id
+
+
+async def insight_worker(worker_id: int) -> None:
+    while True:
+        job: InsightJob = await insight_queue.get()
+        job.status = 'running'
+        try:
+            job.finish(ai_insights=await generate_ai_insights(job.pred_label, job.customer_row, job.items, job))
+        except Exception as e:
+            print(f"Error generating AI insights (worker {worker_id}, job {job.job_id}): {e}")
+            job.finish(error=str(e)[:200])
+        finally:
+            insight_queue.task_done()
+
+
+def start_insight_workers() -> None:
+    global insight_queue
+    if not OLLAMA_MODEL or insight_worker_tasks:
+        return
+    insight_queue = asyncio.Queue(maxsize=INSIGHT_QUEUE_MAX)
+    for worker_id in range(max(1, INSIGHT_WORKERS)):
+        insight_worker_tasks.append(asyncio.create_task(insight_worker(worker_id)))
+    print(f"✅ AI insight workers started: {len(insight_worker_tasks)}")
+
+
+async def stop_insight_workers() -> None:
+    global insight_queue
+    for task in insight_worker_tasks:
+        task.cancel()
+    await asyncio.gather(*insight_worker_tasks, return_exceptions=True)
+    insight_worker_tasks.clear()
+    insight_queue = None
+
+
+# ---------- Compiled forest ----------
+def try_compile_model(model: Any) -> Optional[CompiledForest]:
+    if not COMPILED_MODEL_ENABLED:
+        return None
+    start_time = time.time()
+    try:
+        engine = compile_model(model, MODEL_FEATURE_COLUMNS)
+    except UnsupportedModel as e:
+        print(f"⚠️ Compiled forest disabled, using clf.predict: {e}")
+        return None
+    print(
+        f"✅ Compiled forest: {engine.n_estimators} trees, {engine.n_nodes} nodes, depth {engine.max_depth} "
+        f"({time.time() - start_time:.2f}s, parity OK)"
+    )
+    return engine
+
+
+def model_predict_row(features: Dict[str, Any]) -> Any:
+    """
+    clf.predict untuk satu profile dari FeatureEncoder.row: lewat compiled forest jika
+    tersedia (hasil identik, tanpa DataFrame), selain itu sklearn.
+    """
+    engine = compiled_model
+    if engine is not None:
+        # unknown category -> ValueError, sama seperti clf.predict
+        X32 = engine.encode_row(features)
+        # engine dari mmap tidak punya tree_ sklearn: routing NaN diserahkan ke clf
+        if engine.trees is not None or not np.isnan(X32).any():
+            return engine.predict_encoded(X32)[0]
+    return get_classifier().predict(pd.DataFrame([features], columns=MODEL_FEATURE_COLUMNS))[0]
+
+
+def model_predict_columns(columns: Dict[str, np.ndarray], n_rows: int) -> np.ndarray:
+    """Prediksi batch dari FeatureEncoder.columns; DataFrame hanya dibuat untuk fallback sklearn."""
+    engine = compiled_model
+    if engine is not None:
+        X32 = engine.encode_columns(columns, n_rows)
+        if engine.trees is not None or not np.isnan(X32).any():
+            return engine.predict_encoded(X32)
+    return get_classifier().predict(pd.DataFrame(columns, columns=MODEL_FEATURE_COLUMNS))
+
+
+def model_ready() -> bool:
+    return (clf is not None or compiled_model is not None) and label_encoder is not None
+
+
+def get_classifier() -> Any:
+    """clf sklearn; worker yang memakai compiled artifact baru unpickle saat benar-benar perlu."""
+    global clf
+    if clf is None:
+        with _model_lock:
+            if clf is None:
+                clf = joblib.load(MODEL_DIR / "model_dokter_rf.pkl")
+    return clf
+
+
+def artifact_version(path: Path) -> str:
+    """Versi artifact berdasarkan mtime + ukuran file (berubah saat pkl ditimpa)."""
+    st = path.stat()
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def compiled_artifact_path(version: str) -> Path:
+    return COMPILED_MODEL_DIR / f"{version}-v{CompiledForest.FORMAT_VERSION}"
+
+
+def load_compiled_artifact(version: str) -> Optional[CompiledForest]:
+    path = compiled_artifact_path(version)
+    if not COMPILED_MODEL_ENABLED or not path.is_dir():
+        return None
+    start_time = time.time()
+    try:
+        engine = CompiledForest.load(path, version)
+    except (OSError, ValueError, KeyError, UnsupportedModel) as e:
+        print(f"⚠️ Compiled artifact {path.name} unusable, recompiling: {e}")
+        return None
+    print(f"✅ Compiled forest mapped from {path.name}: {engine.n_nodes} nodes ({(time.time() - start_time) * 1000:.1f}ms)")
+    return engine
+
+
+def save_compiled_artifact(engine: CompiledForest, version: str) -> None:
+    """
+    Tulis ke directory sementara lalu rename (atomic): worker lain hanya pernah melihat
+    artifact yang lengkap. Jika worker lain menang duluan, hasil kita dibuang.
+    """
+    path = compiled_artifact_path(version)
+    tmp_path = COMPILED_MODEL_DIR / f".{path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        COMPILED_MODEL_DIR.mkdir(parents=True, exist_ok=True)
+        engine.save(tmp_path, version)
+        os.rename(tmp_path, path)
+    except (OSError, UnsupportedModel) as e:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not path.is_dir():
+            print(f"⚠️ Compiled artifact not saved ({e}); other workers will compile on their own")
+        return
+    # Versi lama: file yang masih di-mmap worker lain tetap valid sampai di-unmap (POSIX)
+    for old in COMPILED_MODEL_DIR.iterdir():
+        if old != path and old.is_dir() and not old.name.startswith('.'):
+            shutil.rmtree(old, ignore_errors=True)
+    print(f"💾 Compiled forest saved to {path}")
+
+
+def load_model(model_path: Path, version: str) -> Tuple[Any, Optional[CompiledForest]]:
+    """(clf, compiled) untuk versi ini: mmap artifact jika ada (clf lazy), selain itu unpickle + compile."""
+    engine = load_compiled_artifact(version)
+    if engine is not None:
+        return None, engine
+    model = joblib.load(model_path)
+    engine = try_compile_model(model)
+    if engine is not None:
+        save_compiled_artifact(engine, version)
+    return model, engine
 
 
 def load_artifacts() -> None:
-    global clf, label_encoder, global_averages, supabase
+    global clf, label_encoder, global_averages, supabase_rest, ollama_http, model_version, compiled_model
     model_path = MODEL_DIR / "model_dokter_rf.pkl"
     le_path = MODEL_DIR / "label_encoder.pkl"
     ga_path = MODEL_DIR / "global_averages.pkl"
@@ -312,148 +1134,153 @@ def load_artifacts() -> None:
     if not model_path.exists() or not le_path.exists() or not ga_path.exists():
         raise RuntimeError(f"Model artifacts not found in: {MODEL_DIR}")
 
-    clf = joblib.load(model_path)
+    model_version = artifact_version(model_path)
+    clf, compiled_model = load_model(model_path, model_version)
     label_encoder = joblib.load(le_path)
     global_averages = joblib.load(ga_path)
 
-    global supabase
     if VITE_SUPABASE_URL and VITE_SUPABASE_ANON_KEY:
-        supabase = create_client(VITE_SUPABASE_URL, VITE_SUPABASE_ANON_KEY)
-        print(f"✅ Supabase client initialized successfully ({VITE_SUPABASE_URL[:30]}...)")
+        supabase_rest = PostgrestClient(VITE_SUPABASE_URL, VITE_SUPABASE_ANON_KEY)
+        print(f"✅ Supabase REST client initialized successfully ({VITE_SUPABASE_URL[:30]}..., pool {HTTP_MAX_CONNECTIONS})")
     else:
         print("⚠️ VITE_SUPABASE_URL or VITE_SUPABASE_ANON_KEY not set - database features will be limited")
         print("   Set these in .env.local file or as environment variables")
-        supabase = None
+        supabase_rest = None
     
-    # Initialize Ollama (no client object needed; we call HTTP endpoint directly)
+    # Ollama: pooled HTTP client, endpoint dipanggil langsung
+    ollama_http = httpx.AsyncClient(limits=http_limits(), timeout=OLLAMA_TIMEOUT_SECONDS)
     if OLLAMA_MODEL:
         print(f"✅ Ollama client configured (model: {OLLAMA_MODEL}, base: {OLLAMA_BASE_URL})")
     else:
         print("⚠️ OLLAMA_MODEL not set - AI insights will be disabled")
 
 
-def clean_user_dataframe(df: pd.DataFrame) -> pd.DataFrame:
-    """
-    Data cleaning logic dari notebook Cell 1-2.
-    Konsisten dengan training process.
-    
-    Steps:
-    1. Konversi numeric dengan penanganan comma decimal
-    2. Fix nilai negatif untuk avg_call_duration dan monthly_spend
-    3. Fill NaN dengan 0
-    """
-    numeric_features_list = [
-        'avg_data_usage_gb',
-        'pct_video_usage',
-        'avg_call_duration',
-        'sms_freq',
-        'monthly_spend',
-        'topup_freq',
-        'travel_score',
-        'complaint_count',
-    ]
-
-    cols_fix_negative = ['avg_call_duration', 'monthly_spend']
-
-    for col in numeric_features_list:
-        if col not in df.columns:
-            continue
-
-        # Konversi ke numeric (handle comma decimal)
-        if df[col].dtype == 'object':
-            df[col] = pd.to_numeric(
-                df[col].astype(str).str.replace(',', '.'),
-                errors='coerce'
-            )
+async def close_http_clients() -> None:
+    global supabase_rest, ollama_http
+    if supabase_rest is not None:
+        await supabase_rest.aclose()
+        supabase_rest = None
+    if ollama_http is not None:
+        await ollama_http.aclose()
+        ollama_http = None
 
-        # Fix negatif
-        if col in cols_fix_negative:
-            df[col] = df[col].abs()
 
-        # Fill NaN dengan 0
-        if df[col].isnull().any():
-            df[col] = df[col].fillna(0)
+def reload_model_if_changed() -> None:
+    """Reload clf + label_encoder jika model_dokter_rf.pkl berubah di disk."""
+    global clf, label_encoder, model_version, compiled_model
+    model_path = MODEL_DIR / "model_dokter_rf.pkl"
+    if not model_path.exists():
+        return
+    with _model_lock:
+        current = artifact_version(model_path)
+        if current == model_version:
+            return
+        new_clf, new_engine = load_model(model_path, current)
+        compiled_model = None  # jangan pakai engine model lama untuk clf baru
+        clf = new_clf
+        compiled_model = new_engine
+        label_encoder = joblib.load(MODEL_DIR / "label_encoder.pkl")
+        model_version = current
+        print(f"🔄 Model artifacts reloaded (version {current})")
+
+
+class FeatureEncoder:
+    """
+    Profile dict / kolom mentah -> fitur model tanpa DataFrame perantara.
 
-    return df
+    Aturan cleaning notebook Cell 1-4 (konsisten dengan training): kolom numeric
+    yang berisi string di-parse sebagai teks (comma decimal, gagal -> NaN), abs untuk
+    COLS_FIX_NEGATIVE, NaN -> 0; kolom yang tidak ada diisi default ('Prepaid',
+    'Samsung', 0). Kolom categorical diteruskan apa adanya (None tetap None).
+    """
 
+    DEFAULTS: Dict[str, Any] = {'plan_type': 'Prepaid', 'device_brand': 'Samsung'}
 
-def prepare_features_for_model(df_input: pd.DataFrame, reference_cols: Optional[List[str]] = None) -> pd.DataFrame:
-    """
-    Prepare features dengan konsistensi feature order dari notebook Cell 3-4.
-    
-    Logic:
-    1. Drop customer_id dan target_offer
-    2. Pastikan urutan fitur konsisten
-    3. Fill missing columns dengan default value (median/mode)
-    """
-    df = df_input.copy()
-
-    # List fitur yang dipakai model (harus konsisten dengan training)
-    if reference_cols is None:
-        reference_cols = [
-            'plan_type',
-            'device_brand',
-            'avg_data_usage_gb',
-            'pct_video_usage',
-            'avg_call_duration',
-            'sms_freq',
-            'monthly_spend',
-            'topup_freq',
-            'travel_score',
-            'complaint_count',
+    def __init__(self, columns: List[str]):
+        self.columns = columns
+        # per fitur (urutan training): (column, numeric?, abs?, default jika kolom tidak ada)
+        self.plan = [
+            (col, col in NUMERIC_FEATURES, col in COLS_FIX_NEGATIVE, self.DEFAULTS.get(col, 0))
+            for col in columns
         ]
 
-    # Pastikan semua kolom yang dibutuhkan ada
-    # Jika tidak ada, use default value (0 untuk numeric, 'Prepaid' untuk categorical)
-    for col in reference_cols:
-        if col not in df.columns:
-            if col in ['plan_type']:
-                df[col] = 'Prepaid'
-            elif col == 'device_brand':
-                df[col] = 'Samsung'
+    @staticmethod
+    def _numeric_value(value: Any, fix_negative: bool) -> float:
+        if value is None:
+            number = np.nan
+        elif isinstance(value, str):
+            number = float(pd.to_numeric(value.replace(',', '.'), errors='coerce'))
+        else:
+            try:
+                number = float(value)
+            except (TypeError, ValueError):  # object lain: di DataFrame jadi kolom object -> str
+                number = float(pd.to_numeric(str(value).replace(',', '.'), errors='coerce'))
+        if fix_negative:
+            number = abs(number)
+        return 0.0 if number != number else number
+
+    def row(self, customer_row: Dict[str, Any]) -> Dict[str, Any]:
+        """Satu profile -> {fitur: nilai bersih} (input model_predict_row)."""
+        features: Dict[str, Any] = {}
+        for col, numeric, fix_negative, default in self.plan:
+            if col not in customer_row:
+                features[col] = default
+            elif numeric:
+                features[col] = self._numeric_value(customer_row[col], fix_negative)
             else:
-                df[col] = 0
-
-    # Return hanya kolom yang ada di reference_cols, dengan urutan yang sama
-    X = df[reference_cols]
-
-    return X
-
-
-def abs_if_needed(df: pd.DataFrame, col: str) -> None:
-    if col in df.columns:
-        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-        df[col] = df[col].abs()
-
+                features[col] = customer_row[col]
+        return features
+
+    def batch(self, columns: Dict[str, Any], n_rows: int) -> Dict[str, np.ndarray]:
+        """Batch: kolom mentah (list/array per fitur) -> kolom bersih (input model_predict_columns)."""
+        out: Dict[str, np.ndarray] = {}
+        for col, numeric, _, default in self.plan:
+            values = columns.get(col)
+            if values is None:
+                out[col] = np.full(n_rows, default, dtype=np.float64 if numeric else object)
+            elif numeric:
+                out[col] = _clean_numeric_column(values, col)
+            else:
+                out[col] = np.asarray(values, dtype=object)
+        return out
 
-def prepare_features(customer_row: Dict[str, Any]) -> pd.DataFrame:
-    # Build a single-row DataFrame with expected columns
-    # Columns inferred from training logic
-    df = pd.DataFrame([customer_row])
 
-    # Apply cleaning (comma decimal, negatives, NaN fill)
-    df = clean_user_dataframe(df)
+feature_encoder = FeatureEncoder(MODEL_FEATURE_COLUMNS)
 
-    # Prepare features with consistent order
-    X = prepare_features_for_model(df)
 
-    return X
+async def fetch_customer(customer_id: str, columns: List[str] = CUSTOMER_MODEL_COLUMNS) -> Dict[str, Any]:
+    if supabase_rest is None:
+        raise HTTPException(status_code=503, detail='Database not configured. Please set VITE_SUPABASE_URL and VITE_SUPABASE_ANON_KEY in .env.local')
+    data = await supabase_rest.select(
+        'customer_profile', columns=','.join(columns), filters={'customer_id': pg_in([customer_id])}, limit=1
+    )
+    if not data:
+        raise HTTPException(status_code=404, detail='Customer not found')
+    return data[0]
 
 
-def fetch_customer(customer_id: str) -> Dict[str, Any]:
-    if supabase is None:
+async def fetch_customers(customer_ids: List[str], columns: List[str] = CUSTOMER_MODEL_COLUMNS) -> List[Dict[str, Any]]:
+    """Fetch banyak customer sekaligus: satu query `in` per CUSTOMER_IN_CHUNK id."""
+    if supabase_rest is None:
         raise HTTPException(status_code=503, detail='Database not configured. Please set VITE_SUPABASE_URL and VITE_SUPABASE_ANON_KEY in .env.local')
-    res = supabase.table('customer_profile').select('*').eq('customer_id', customer_id).single().execute()
-    if res.data is None:
-        raise HTTPException(status_code=404, detail='Customer not found')
-    return res.data
+    chunks = [customer_ids[start:start + CUSTOMER_IN_CHUNK] for start in range(0, len(customer_ids), CUSTOMER_IN_CHUNK)]
+    pages = await gather_bounded(
+        [
+            lambda chunk=chunk: supabase_rest.select(
+                'customer_profile', columns=','.join(columns), filters={'customer_id': pg_in(chunk)}
+            )
+            for chunk in chunks
+        ],
+        PG_MAX_IN_FLIGHT,
+    )
+    return [row for page in pages for row in page]
 
 
-def fetch_products() -> pd.DataFrame:
-    if supabase is None:
+# ---------- Product catalog ----------
+async def _load_products_frame() -> pd.DataFrame:
+    if supabase_rest is None:
         raise HTTPException(status_code=503, detail='Database not configured. Please set VITE_SUPABASE_URL and VITE_SUPABASE_ANON_KEY in .env.local')
-    res = supabase.table('product_catalog').select('*').execute()
-    products = res.data or []
+    products = await supabase_rest.select('product_catalog')
     if not products:
         raise HTTPException(status_code=404, detail='No products found')
     df = pd.DataFrame(products)
@@ -466,76 +1293,650 @@ def fetch_products() -> pd.DataFrame:
     return df
 
 
-def compute_churn_bucket(pred_label: str, user_row: Dict[str, Any], global_avgs: Dict[str, float]) -> str:
+def _stable_order(values: np.ndarray, ascending: bool) -> np.ndarray:
     """
-    Compute churn risk bucket RULES-BASED (sesuai notebook Cell 5 logic).
-    Returns: risk_label ('high', 'medium', or 'low')
-    
-    Rules:
-    🔴 HIGH RISK:
-       - Prediksi model = 'Retention Offer'
-    
-    🟡 MEDIUM RISK:
-       - BUKAN Retention Offer
-       - ADA complaint
-       - MINIMAL 2 indikator usage (data/call/sms) di bawah rata-rata
-       - topup_freq di bawah rata-rata
-    
-    🟢 LOW RISK (multiple cases):
-       CASE A: no complaint + minimal 2 usage >= rata-rata
-       CASE B: ada complaint + topup >= rata-rata
-       CASE C: no complaint + semua usage >= rata-rata
-       CASE D: no complaint + topup <= rata-rata + minimal 1 usage >= rata-rata
-       CASE E: no complaint + topup >= rata-rata + semua usage >= rata-rata
+    Urutan naik/turun dengan NaN selalu di akhir (seperti pandas sort_values).
+
+    Nilai sama dipecah eksplisit oleh posisi baris (urutan katalog), baik ascending
+    maupun descending; sama dengan sort_values(kind='stable') di atas frame katalog.
     """
-    # Extract thresholds dari global_averages
-    avg_data = float(global_avgs.get('avg_data_usage_gb', 0))
-    avg_call = float(global_avgs.get('avg_call_duration', 0))
-    avg_sms = float(global_avgs.get('sms_freq', 0))
-    avg_topup = float(global_avgs.get('topup_freq', 0))
-    
-    # Extract user values
-    usage_data = float(user_row.get('avg_data_usage_gb') or 0)
-    usage_call = float(user_row.get('avg_call_duration') or 0)
-    usage_sms = float(user_row.get('sms_freq') or 0)
-    usage_topup = float(user_row.get('topup_freq') or 0)
-    complaints = float(user_row.get('complaint_count') or 0)
-    
-    has_complaint = complaints > 0
-    
-    # Below/above average masks
-    below_data = usage_data < avg_data
-    below_call = usage_call < avg_call
-    below_sms = usage_sms < avg_sms
-    below_topup = usage_topup < avg_topup
-    
-    aboveeq_data = usage_data >= avg_data
-    aboveeq_call = usage_call >= avg_call
-    aboveeq_sms = usage_sms >= avg_sms
-    aboveeq_topup = usage_topup >= avg_topup
-    
-    # Count indicators
-    num_below_usage = sum([below_data, below_call, below_sms])
-    num_above_usage = sum([aboveeq_data, aboveeq_call, aboveeq_sms])
-    all_usage_above = aboveeq_data and aboveeq_call and aboveeq_sms
-    
-    # === HIGH RISK ===
-    if pred_label == 'Retention Offer':
-        return 'high'
-    
-    # === MEDIUM RISK ===
-    # NOT Retention + HAS complaint + 2+ usage below avg + topup below avg
-    if (not (pred_label == 'Retention Offer') and 
-        has_complaint and 
-        num_below_usage >= 2 and 
-        below_topup):
-        return 'medium'
-    
-    # === LOW RISK (multiple cases) ===
-    # CASE A: no complaint + minimal 2 usage >= avg
-    if not has_complaint and num_above_usage >= 2:
-        return 'low'
-    
+    return np.lexsort((np.arange(len(values)), values if ascending else -values))
+
+
+def _count_le(sorted_prices: np.ndarray, limit: float) -> int:
+    """Jumlah harga <= limit pada array harga naik tanpa NaN (binary search)."""
+    if limit != limit:  # NaN budget: tidak ada produk yang lolos filter
+        return 0
+    return int(np.searchsorted(sorted_prices, limit, side='right'))
+
+
+class CategoryIndex:
+    """
+    Produk satu kategori dengan urutan yang sudah di-precompute.
+
+    Semua array berisi posisi baris di ProductCatalog.frame.
+    - price_asc / price_asc_values: harga naik (NaN di akhir), untuk searchsorted budget
+    - price_desc: harga turun (NaN di akhir); harga sama tetap urutan katalog
+    """
+
+    def __init__(self, name: str, rows: np.ndarray, frame: pd.DataFrame) -> None:
+        self.name = name
+        self.rows = rows
+        price = frame['price'].to_numpy(dtype=np.float64, na_value=np.nan)[rows]
+        self.price_asc = rows[_stable_order(price, ascending=True)]
+        self.price_desc = rows[_stable_order(price, ascending=False)]
+        self.n_priced = int((~np.isnan(price)).sum())
+        self.price_asc_values = price[_stable_order(price, ascending=True)][:self.n_priced]
+
+        # Urutan cross-sell: durasi pendek (<= 7 hari) dulu, lalu harga termurah.
+        # Disimpan per grup durasi supaya filter budget cukup binary search.
+        duration = frame['duration_days'].to_numpy(dtype=np.float64, na_value=np.nan)[rows]
+        is_short = np.where(duration <= 7, 1, 2)
+        self.short_first: List[Tuple[np.ndarray, np.ndarray]] = []
+        for group in (1, 2):
+            in_group = (is_short == group) & ~np.isnan(price)
+            order = np.argsort(price[in_group], kind='stable')
+            self.short_first.append((rows[in_group][order], price[in_group][order]))
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def count_affordable(self, budget: float) -> int:
+        """Jumlah produk dengan price <= budget (binary search)."""
+        return _count_le(self.price_asc_values, budget)
+
+    def most_expensive_affordable(self, budget: float) -> np.ndarray:
+        """Posisi produk dengan price <= budget, harga turun (termahal dulu)."""
+        k = self.count_affordable(budget)
+        return self.price_desc[self.n_priced - k:self.n_priced]
+
+
+class ProductCatalog:
+    """Cached product_catalog: DataFrame + derived columns + index per kategori."""
+
+    def __init__(self, frame: pd.DataFrame, loaded_at: Optional[float] = None) -> None:
+        self.frame = frame.reset_index(drop=True)
+        self.loaded_at = loaded_at if loaded_at is not None else time.time()
+        self.price = self.frame['price'].to_numpy(dtype=np.float64, na_value=np.nan)
+        self.price_asc = _stable_order(self.price, ascending=True)
+        self.n_priced = int((~np.isnan(self.price)).sum())
+        self.price_asc_values = self.price[self.price_asc][:self.n_priced]
+
+        # Field RecommendationItem per produk (dihitung sekali, bukan per request)
+        self.names = self.frame['product_name'].to_numpy(dtype=object)
+        self.items: List[Dict[str, Any]] = []
+        self.category_labels: List[str] = []
+        for row in self.frame.to_dict('records'):
+            duration = row.get('duration_days') or 30
+            self.items.append({
+                'product_id': str(row.get('product_id') or ''),
+                'product_name': str(row.get('product_name') or ''),
+                'category': str(row.get('category') or ''),
+                'price': float(row.get('price') or 0),
+                'duration_days': int(duration) if duration == duration else 30,
+            })
+            self.category_labels.append(f"{row.get('category')}")
+        self.version = hashlib.blake2b(
+            pd.util.hash_pandas_object(self.frame.astype(str), index=False).to_numpy().tobytes(),
+            digest_size=8,
+        ).hexdigest()
+
+        categories = self.frame['category'] if 'category' in self.frame.columns else pd.Series(dtype=object)
+        self.by_category: Dict[str, CategoryIndex] = {}
+        for cat, rows in categories.groupby(categories, sort=False).indices.items():
+            self.by_category[cat] = CategoryIndex(cat, np.asarray(rows, dtype=np.int64), self.frame)
+
+    def category(self, name: Optional[str]) -> Optional[CategoryIndex]:
+        return self.by_category.get(name) if name else None
+
+    def item(self, pos: int, reasons: List[str]) -> RecommendationItem:
+        return RecommendationItem(reasons=reasons, **self.items[pos])
+
+
+product_catalog: Optional[ProductCatalog] = None
+
+
+async def get_product_catalog(force_refresh: bool = False) -> ProductCatalog:
+    """Katalog produk dari cache, di-reload setelah PRODUCT_CATALOG_TTL_SECONDS (0 = tidak pernah)."""
+    global product_catalog
+
+    async with async_lock('product_catalog'):
+        catalog = product_catalog
+        expired = (
+            catalog is not None
+            and PRODUCT_CATALOG_TTL_SECONDS > 0
+            and time.time() - catalog.loaded_at > PRODUCT_CATALOG_TTL_SECONDS
+        )
+        if catalog is None or expired or force_refresh:
+            frame = await _load_products_frame()
+            catalog = await run_in_threadpool(ProductCatalog, frame)
+            if product_catalog is None or catalog.version != product_catalog.version:
+                print(f"   ✅ Product catalog {catalog.version} loaded: {len(catalog.frame)} products")
+            product_catalog = catalog
+        return catalog
+
+
+# ---------- Customer snapshot ----------
+def _clean_numeric_column(values: Any, col: str) -> np.ndarray:
+    """
+    Decode satu kolom numeric langsung ke float64 (abs, NaN -> 0).
+
+    PostgREST mengirim number/null sehingga cukup satu konversi numpy; repair string
+    (comma decimal, teks rusak -> NaN) hanya jalan jika kolom berisi string atau object
+    lain, sama seperti FeatureEncoder._numeric_value.
+    """
+    arr = None
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'biuf':
+        arr = values.astype(np.float64)
+    elif not any(issubclass(t, (str, bytes)) for t in set(map(type, values))):
+        try:
+            arr = np.array(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            arr = None
+    if arr is None:
+        series = pd.Series(values, dtype=object).astype(str).str.replace(',', '.')
+        arr = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    if col in COLS_FIX_NEGATIVE:
+        arr = np.abs(arr)
+    return np.where(np.isnan(arr), 0.0, arr)
+
+
+def _encode_categorical_column(values: Any) -> Tuple[np.ndarray, np.ndarray]:
+    """Encode kolom string ke int32 codes + array kategori (code -1 = NULL)."""
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    return codes.astype(np.int32), np.asarray(uniques, dtype=object)
+
+
+class CustomerSnapshot:
+    """
+    Snapshot columnar read-only dari customer_profile, dipakai bersama semua endpoint full-base.
+
+    - numeric[col]: float64, sudah dibersihkan (comma decimal, abs, NaN -> 0)
+    - codes[col] + categories[col]: kolom categorical sebagai code int32 (-1 = NULL)
+    - version: fingerprint isi, data identik => versi identik; snapshot hasil
+      with_delta() memakai versi turunan (versi lama + change_id change log)
+    """
+
+    CATEGORICAL_COLUMNS = CATEGORICAL_FEATURES + ['target_offer']
+
+    def __init__(
+        self,
+        customer_id: np.ndarray,
+        numeric: Dict[str, np.ndarray],
+        codes: Dict[str, np.ndarray],
+        categories: Dict[str, np.ndarray],
+        loaded_at: Optional[float] = None,
+        version: Optional[str] = None,
+    ) -> None:
+        self.customer_id = customer_id
+        self.numeric = numeric
+        self.codes = codes
+        self.categories = categories
+        self.loaded_at = loaded_at if loaded_at is not None else time.time()
+        self.version = version or self._fingerprint()
+        self.change_id: Optional[int] = None  # watermark customer_profile_changes yang sudah tercakup
+        self._id_order: Optional[np.ndarray] = None  # argsort customer_id (lazy, untuk locate)
+
+    @classmethod
+    def decode_page(cls, records: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        """Decode satu page JSON customer_profile ke kolom typed (belum di-encode categorical)."""
+        page = {'customer_id': np.asarray([str(r.get('customer_id') or '') for r in records], dtype=str)}
+        page.update(feature_encoder.batch({col: [r.get(col) for r in records] for col in MODEL_FEATURE_COLUMNS}, len(records)))
+        page['target_offer'] = np.asarray([r.get('target_offer') for r in records], dtype=object)
+        return page
+
+    @classmethod
+    def from_pages(cls, pages: List[Dict[str, np.ndarray]]) -> "CustomerSnapshot":
+        """Gabungkan page hasil decode_page (urutan page = urutan baris)."""
+        def concat(col: str, dtype: Any) -> np.ndarray:
+            return np.concatenate([page[col] for page in pages]) if pages else np.empty(0, dtype=dtype)
+
+        customer_id = concat('customer_id', str)
+        numeric = {col: concat(col, np.float64) for col in NUMERIC_FEATURES}
+        codes: Dict[str, np.ndarray] = {}
+        categories: Dict[str, np.ndarray] = {}
+        for col in cls.CATEGORICAL_COLUMNS:
+            codes[col], categories[col] = _encode_categorical_column(concat(col, object))
+        return cls(customer_id, numeric, codes, categories)
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> "CustomerSnapshot":
+        return cls.from_pages([cls.decode_page(records)])
+
+    def save(self, path: Path) -> None:
+        """Tulis kolom sebagai .npy (bisa di-mmap) + meta.json ke directory baru `path`."""
+        path.mkdir(parents=True)
+        np.save(path / 'customer_id.npy', self.customer_id, allow_pickle=False)
+        for col in NUMERIC_FEATURES:
+            np.save(path / f'{col}.npy', self.numeric[col], allow_pickle=False)
+        for col in self.CATEGORICAL_COLUMNS:
+            np.save(path / f'{col}.codes.npy', self.codes[col], allow_pickle=False)
+        meta = {
+            'version': self.version,
+            'rows': len(self),
+            'categories': {col: self.categories[col].tolist() for col in self.CATEGORICAL_COLUMNS},
+        }
+        (path / 'meta.json').write_text(json.dumps(meta), encoding='utf-8')
+
+    @classmethod
+    def load(cls, path: Path, loaded_at: float) -> "CustomerSnapshot":
+        """Map snapshot hasil save() read-only (page cache dipakai bersama antar proses)."""
+        meta = json.loads((path / 'meta.json').read_text(encoding='utf-8'))
+
+        def column(name: str) -> np.ndarray:
+            return np.load(path / f'{name}.npy', mmap_mode='r', allow_pickle=False)
+
+        return cls(
+            column('customer_id'),
+            {col: column(col) for col in NUMERIC_FEATURES},
+            {col: column(f'{col}.codes') for col in cls.CATEGORICAL_COLUMNS},
+            {col: np.asarray(meta['categories'][col], dtype=object) for col in cls.CATEGORICAL_COLUMNS},
+            loaded_at=loaded_at,
+            version=meta['version'],
+        )
+
+    def __len__(self) -> int:
+        return len(self.customer_id)
+
+    def slice(self, start: int, stop: int) -> "CustomerSnapshot":
+        """View baris [start, stop) tanpa copy (kategori dipakai bersama)."""
+        return CustomerSnapshot(
+            self.customer_id[start:stop],
+            {col: values[start:stop] for col, values in self.numeric.items()},
+            {col: values[start:stop] for col, values in self.codes.items()},
+            self.categories,
+            loaded_at=self.loaded_at,
+            version=f'{self.version}[{start}:{stop}]',
+        )
+
+    def take(self, rows: np.ndarray) -> "CustomerSnapshot":
+        """Copy baris terpilih (urutan = rows)."""
+        return CustomerSnapshot(
+            self.customer_id[rows],
+            {col: values[rows] for col, values in self.numeric.items()},
+            {col: values[rows] for col, values in self.codes.items()},
+            self.categories,
+            loaded_at=self.loaded_at,
+            version=f'{self.version}[take]',
+        )
+
+    def locate(self, customer_ids: np.ndarray) -> np.ndarray:
+        """Posisi baris tiap customer_id (-1 = tidak ada), binary search atas index id terurut."""
+        if self._id_order is None:
+            self._id_order = np.argsort(self.customer_id, kind='stable')
+        sorted_ids = self.customer_id[self._id_order]
+        if not len(sorted_ids):
+            return np.full(len(customer_ids), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(sorted_ids, customer_ids), len(sorted_ids) - 1)
+        return np.where(sorted_ids[pos] == customer_ids, self._id_order[pos], -1)
+
+    def with_delta(self, delta: "SnapshotDelta", page: Dict[str, np.ndarray], version: str) -> "CustomerSnapshot":
+        """
+        Snapshot baru = baris ini dengan delta change log diterapkan (update di tempat, delete
+        dibuang, insert di akhir). Hanya copy array; tidak ada decode/fingerprint ulang seluruh base.
+        """
+        codes: Dict[str, np.ndarray] = {}
+        categories: Dict[str, np.ndarray] = {}
+        for col in self.CATEGORICAL_COLUMNS:
+            lookup = {value: code for code, value in enumerate(self.categories[col].tolist())}
+            page_codes = np.empty(len(page[col]), dtype=np.int32)
+            for i, value in enumerate(page[col]):
+                if pd.isna(value):
+                    page_codes[i] = -1
+                else:
+                    page_codes[i] = lookup.setdefault(value, len(lookup))  # kategori baru di akhir
+            codes[col] = delta.apply(self.codes[col], page_codes)
+            categories[col] = np.asarray(list(lookup), dtype=object)
+        snap = CustomerSnapshot(
+            delta.apply(self.customer_id, page['customer_id']),
+            {col: delta.apply(self.numeric[col], page[col]) for col in NUMERIC_FEATURES},
+            codes,
+            categories,
+            loaded_at=self.loaded_at,  # umur (TTL) tetap dihitung dari full load terakhir
+            version=version,
+        )
+        if self._id_order is not None:
+            # Index id terurut di-update (bukan argsort ulang): baris lama bergeser karena delete,
+            # id baru disisipkan di posisi binary search-nya
+            new_pos = np.cumsum(delta.keep) - 1
+            order = new_pos[self._id_order[delta.keep[self._id_order]]]
+            inserted = page['customer_id'][delta.insert_src]
+            insert_order = np.argsort(inserted, kind='stable')
+            at = np.searchsorted(snap.customer_id[order], inserted[insert_order])
+            rows = int(delta.keep.sum()) + insert_order
+            snap._id_order = np.insert(order, at, rows)
+        return snap
+
+    def _fingerprint(self) -> str:
+        h = hashlib.blake2b(digest_size=8)
+        h.update(self.customer_id.tobytes())
+        for col in NUMERIC_FEATURES:
+            h.update(self.numeric[col].tobytes())
+        for col in self.CATEGORICAL_COLUMNS:
+            h.update(self.codes[col].tobytes())
+            h.update(repr(self.categories[col].tolist()).encode())
+        return h.hexdigest()
+
+    def categorical(self, col: str) -> np.ndarray:
+        """Decode categorical codes kembali ke object array (None untuk NULL)."""
+        lookup = np.append(self.categories[col], None)
+        return lookup[self.codes[col]]
+
+    def feature_columns(self) -> Dict[str, np.ndarray]:
+        """Kolom fitur model (bentuk FeatureEncoder.batch) untuk model_predict_columns."""
+        data: Dict[str, np.ndarray] = {col: self.categorical(col) for col in CATEGORICAL_FEATURES}
+        data.update({col: self.numeric[col] for col in NUMERIC_FEATURES})
+        return data
+
+    def record(self, i: int) -> Dict[str, Any]:
+        """Satu baris customer sebagai dict (nilai numeric sudah bersih)."""
+        row: Dict[str, Any] = {'customer_id': str(self.customer_id[i])}
+        for col in NUMERIC_FEATURES:
+            row[col] = float(self.numeric[col][i])
+        for col in self.CATEGORICAL_COLUMNS:
+            code = self.codes[col][i]
+            row[col] = self.categories[col][code] if code >= 0 else None
+        return row
+
+
+customer_snapshot: Optional[CustomerSnapshot] = None
+
+
+class SnapshotDelta:
+    """
+    Posisi baris yang berubah di snapshot untuk satu batch change log.
+
+    page_ids: customer_id hasil re-fetch (baris terbaru), changed_ids: semua id di change log;
+    id yang berubah tapi tidak lagi ada di customer_profile berarti sudah di-delete.
+    """
+
+    def __init__(self, snap: CustomerSnapshot, page_ids: np.ndarray, changed_ids: np.ndarray) -> None:
+        old_pos = snap.locate(page_ids)
+        self.update_rows = old_pos[old_pos >= 0]
+        self.update_src = np.flatnonzero(old_pos >= 0)  # index baris page untuk update_rows
+        self.insert_src = np.flatnonzero(old_pos < 0)
+        deleted_pos = snap.locate(np.setdiff1d(changed_ids, page_ids))
+        self.delete_rows = deleted_pos[deleted_pos >= 0]
+        self.keep = np.ones(len(snap), dtype=bool)
+        self.keep[self.delete_rows] = False
+        self.retract_rows = np.concatenate([self.update_rows, self.delete_rows])  # baris lama yang di-retract
+
+    def apply(self, old: np.ndarray, new: np.ndarray) -> np.ndarray:
+        """Kolom lama (urutan snapshot) + kolom page -> kolom snapshot baru."""
+        out = np.array(old)
+        if out.dtype.kind == 'U' and new.dtype.kind == 'U' and new.dtype.itemsize > out.dtype.itemsize:
+            out = out.astype(new.dtype)  # customer_id baru lebih panjang dari lebar array lama
+        out[self.update_rows] = new[self.update_src]
+        return np.concatenate([out[self.keep], new[self.insert_src]])
+
+
+shared_snapshot_store: Optional[SharedSnapshotStore] = (
+    SharedSnapshotStore(Path(SNAPSHOT_SHARED_DIR), SNAPSHOT_LOCK_TIMEOUT_SECONDS) if SNAPSHOT_SHARED_DIR else None
+)
+
+
+async def iter_customer_pages(page_size: int = PG_PAGE_SIZE) -> AsyncIterator[Dict[str, np.ndarray]]:
+    """
+    Scan customer_profile sebagai page kolom typed, berurutan per customer_id.
+
+    Satu request count=exact untuk jumlah baris, lalu range di-fetch paralel (maks
+    PG_MAX_IN_FLIGHT in-flight) dan langsung di-decode per page; hanya page yang
+    sedang in-flight yang ada di memory.
+    """
+    if supabase_rest is None:
+        raise HTTPException(status_code=503, detail='Database not configured')
+
+    total = await supabase_rest.count('customer_profile')
+    columns = ','.join(CUSTOMER_SNAPSHOT_COLUMNS)
+
+    async def fetch_page(offset: int) -> Dict[str, np.ndarray]:
+        want = min(page_size, total - offset)
+        # ORDER BY primary key: range paralel tanpa order tidak dijamin konsisten
+        rows = await supabase_rest.select(
+            'customer_profile', columns=columns, order='customer_id.asc', offset=offset, limit=want
+        )
+        # max-rows server bisa lebih kecil dari page_size: ambil sisa range-nya
+        while 0 < len(rows) < want:
+            more = await supabase_rest.select(
+                'customer_profile', columns=columns, order='customer_id.asc',
+                offset=offset + len(rows), limit=want - len(rows),
+            )
+            if not more:
+                break
+            rows.extend(more)
+        return await run_in_threadpool(CustomerSnapshot.decode_page, rows)
+
+    in_flight: deque = deque()
+    offsets = iter(range(0, total, page_size))
+    try:
+        for offset in offsets:
+            in_flight.append(asyncio.ensure_future(fetch_page(offset)))
+            if len(in_flight) >= PG_MAX_IN_FLIGHT:
+                yield await in_flight.popleft()
+        while in_flight:
+            yield await in_flight.popleft()
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+
+async def load_customer_pages(page_size: int = PG_PAGE_SIZE) -> List[Dict[str, np.ndarray]]:
+    """Load seluruh customer_profile sebagai list page (input CustomerSnapshot.from_pages)."""
+    return [page async for page in iter_customer_pages(page_size)]
+
+
+def snapshot_expired(loaded_at: float) -> bool:
+    return SNAPSHOT_TTL_SECONDS > 0 and time.time() - loaded_at > SNAPSHOT_TTL_SECONDS
+
+
+async def load_customer_snapshot() -> CustomerSnapshot:
+    start_time = time.time()
+    # Watermark diambil sebelum scan: perubahan selama scan di-apply ulang (idempotent)
+    change_id = await latest_change_id() if changelog_enabled() else None
+    pages = await load_customer_pages()
+    snap = await run_in_threadpool(CustomerSnapshot.from_pages, pages)
+    snap.change_id = change_id
+    print(f"   ✅ Customer snapshot {snap.version} loaded: {len(snap)} users ({time.time() - start_time:.2f}s)")
+    return snap
+
+
+async def get_customer_snapshot(force_refresh: bool = False) -> CustomerSnapshot:
+    """
+    Snapshot customer bersama; di-reload jika TTL habis (SNAPSHOT_TTL_SECONDS,
+    0 = tidak pernah) atau force_refresh diset.
+    """
+    global customer_snapshot
+
+    async with async_lock('customer_snapshot'):
+        if shared_snapshot_store is not None:
+            customer_snapshot = await get_shared_snapshot(shared_snapshot_store, force_refresh)
+            return customer_snapshot
+        snap = customer_snapshot
+        if snap is None or snapshot_expired(snap.loaded_at) or force_refresh:
+            snap = await load_customer_snapshot()
+            customer_snapshot = snap
+        return snap
+
+
+def _map_shared_snapshot(store: SharedSnapshotStore, version: str, loaded_at: float) -> Optional[CustomerSnapshot]:
+    snap = customer_snapshot
+    if snap is not None and snap.version == version:
+        snap.loaded_at = loaded_at  # isi sama, refresh hanya memperbarui umur snapshot
+        return snap
+    try:
+        snap = CustomerSnapshot.load(store.path(version), loaded_at)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Shared snapshot {version} unreadable, reloading: {e}")
+        return None
+    print(f"   ✅ Customer snapshot {version} mapped from {store.root}: {len(snap)} users")
+    return snap
+
+
+async def get_shared_snapshot(store: SharedSnapshotStore, force_refresh: bool) -> CustomerSnapshot:
+    """
+    Snapshot dari SharedSnapshotStore: map versi CURRENT jika masih fresh; jika tidak,
+    satu worker (pemegang lock) me-reload dari database dan worker lain menunggu
+    CURRENT berganti, maksimal SNAPSHOT_LOCK_TIMEOUT_SECONDS.
+    """
+    requested_at = time.time()
+    deadline = requested_at + SNAPSHOT_LOCK_TIMEOUT_SECONDS
+
+    def usable(current: Optional[Tuple[str, float]]) -> bool:
+        # force_refresh: hanya terima snapshot yang di-load setelah request ini
+        return current is not None and not snapshot_expired(current[1]) and not (force_refresh and current[1] < requested_at)
+
+    while True:
+        current = store.current()
+        if usable(current):
+            snap = _map_shared_snapshot(store, *current)
+            if snap is not None:
+                return snap
+        if store.try_lock():
+            try:
+                current = store.current()  # worker lain mungkin baru selesai refresh
+                if usable(current):
+                    snap = _map_shared_snapshot(store, *current)
+                    if snap is not None:
+                        return snap
+                fresh = await load_customer_snapshot()
+                await run_in_threadpool(store.publish, fresh)
+            finally:
+                store.unlock()
+            # Pakai versi mmap juga di worker ini supaya hanya ada satu salinan di host
+            return _map_shared_snapshot(store, fresh.version, fresh.loaded_at) or fresh
+        if time.time() > deadline:
+            if current is not None:
+                snap = _map_shared_snapshot(store, *current)
+                if snap is not None:
+                    return snap  # refresh worker lain macet: layani versi lama
+            raise HTTPException(status_code=503, detail='Customer snapshot refresh in progress')
+        await asyncio.sleep(0.2)
+
+
+# ---------- Prediction store ----------
+_prediction_cache: Dict[Tuple[Optional[str], str], Tuple[np.ndarray, np.ndarray]] = {}
+_prediction_lock = threading.Lock()
+
+
+def predict_snapshot(snap: CustomerSnapshot) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Predicted label index + decoded label untuk semua customer di snapshot.
+
+    Hasil di-cache per (model version, snapshot version): clf.predict hanya
+    dijalankan ulang saat data customer atau model_dokter_rf.pkl berubah.
+    """
+    reload_model_if_changed()
+    key = (model_version, snap.version)
+
+    with _prediction_lock:
+        cached = _prediction_cache.get(key)
+        if cached is not None:
+            return cached
+
+        start_time = time.time()
+        if len(snap) > 0:
+            # Per chunk: matrix fitur sementara tidak tumbuh dengan ukuran base
+            pred_idx = np.concatenate([
+                np.asarray(model_predict_columns(chunk.feature_columns(), len(chunk)))
+                for chunk in snapshot_chunks(snap)
+            ])
+            labels = np.asarray(label_encoder.inverse_transform(pred_idx), dtype=object)
+        else:
+            pred_idx = np.empty(0, dtype=np.int64)
+            labels = np.empty(0, dtype=object)
+        pred_idx.setflags(write=False)
+        labels.setflags(write=False)
+
+        # Simpan hanya versi terbaru
+        _prediction_cache.clear()
+        _prediction_cache[key] = (pred_idx, labels)
+        print(f"   ✅ Predictions cached for snapshot {snap.version}: {len(snap)} users ({time.time() - start_time:.2f}s)")
+        return pred_idx, labels
+
+
+def snapshot_chunks(snap: CustomerSnapshot, rows: int = ANALYTICS_CHUNK_ROWS) -> Iterator[CustomerSnapshot]:
+    for start in range(0, len(snap), rows):
+        yield snap.slice(start, min(start + rows, len(snap)))
+
+
+def predict_labels(chunk: CustomerSnapshot) -> np.ndarray:
+    """Label prediksi (decoded) untuk satu chunk tanpa cache (mode stream)."""
+    if len(chunk) == 0:
+        return np.empty(0, dtype=object)
+    pred_idx = model_predict_columns(chunk.feature_columns(), len(chunk))
+    return np.asarray(label_encoder.inverse_transform(pred_idx), dtype=object)
+
+
+def compute_churn_bucket(pred_label: str, user_row: Dict[str, Any], global_avgs: Dict[str, float]) -> str:
+    """
+    Compute churn risk bucket RULES-BASED (sesuai notebook Cell 5 logic).
+    Returns: risk_label ('high', 'medium', or 'low')
+    
+    Rules:
+    🔴 HIGH RISK:
+       - Prediksi model = 'Retention Offer'
+    
+    🟡 MEDIUM RISK:
+       - BUKAN Retention Offer
+       - ADA complaint
+       - MINIMAL 2 indikator usage (data/call/sms) di bawah rata-rata
+       - topup_freq di bawah rata-rata
+    
+    🟢 LOW RISK (multiple cases):
+       CASE A: no complaint + minimal 2 usage >= rata-rata
+       CASE B: ada complaint + topup >= rata-rata
+       CASE C: no complaint + semua usage >= rata-rata
+       CASE D: no complaint + topup <= rata-rata + minimal 1 usage >= rata-rata
+       CASE E: no complaint + topup >= rata-rata + semua usage >= rata-rata
+    """
+    # Extract thresholds dari global_averages
+    avg_data = float(global_avgs.get('avg_data_usage_gb', 0))
+    avg_call = float(global_avgs.get('avg_call_duration', 0))
+    avg_sms = float(global_avgs.get('sms_freq', 0))
+    avg_topup = float(global_avgs.get('topup_freq', 0))
+    
+    # Extract user values
+    usage_data = float(user_row.get('avg_data_usage_gb') or 0)
+    usage_call = float(user_row.get('avg_call_duration') or 0)
+    usage_sms = float(user_row.get('sms_freq') or 0)
+    usage_topup = float(user_row.get('topup_freq') or 0)
+    complaints = float(user_row.get('complaint_count') or 0)
+    
+    has_complaint = complaints > 0
+    
+    # Below/above average masks
+    below_data = usage_data < avg_data
+    below_call = usage_call < avg_call
+    below_sms = usage_sms < avg_sms
+    below_topup = usage_topup < avg_topup
+    
+    aboveeq_data = usage_data >= avg_data
+    aboveeq_call = usage_call >= avg_call
+    aboveeq_sms = usage_sms >= avg_sms
+    aboveeq_topup = usage_topup >= avg_topup
+    
+    # Count indicators
+    num_below_usage = sum([below_data, below_call, below_sms])
+    num_above_usage = sum([aboveeq_data, aboveeq_call, aboveeq_sms])
+    all_usage_above = aboveeq_data and aboveeq_call and aboveeq_sms
+    
+    # === HIGH RISK ===
+    if pred_label == 'Retention Offer':
+        return 'high'
+    
+    # === MEDIUM RISK ===
+    # NOT Retention + HAS complaint + 2+ usage below avg + topup below avg
+    if (not (pred_label == 'Retention Offer') and 
+        has_complaint and 
+        num_below_usage >= 2 and 
+        below_topup):
+        return 'medium'
+    
+    # === LOW RISK (multiple cases) ===
+    # CASE A: no complaint + minimal 2 usage >= avg
+    if not has_complaint and num_above_usage >= 2:
+        return 'low'
+    
     # CASE B: ada complaint + topup >= avg (loyal tapi cerewet)
     if has_complaint and aboveeq_topup:
         return 'low'
@@ -556,46 +1957,100 @@ def compute_churn_bucket(pred_label: str, user_row: Dict[str, Any], global_avgs:
     return 'medium'
 
 
-def recommend_products(pred_label: str, user_row: Dict[str, Any], products_df: pd.DataFrame, total_recommendations: int) -> List[RecommendationItem]:
-    """Notebook-inspired recommendation v16 (max wallet share, filler murah)."""
+CHURN_BUCKETS = ('low', 'medium', 'high')  # index = bucket code dari compute_churn_buckets
+
+
+def compute_churn_buckets(
+    pred_labels: np.ndarray,
+    columns: Dict[str, np.ndarray],
+    global_avgs: Dict[str, float],
+) -> Tuple[np.ndarray, float]:
+    """
+    Versi array dari compute_churn_bucket (rules HIGH/MEDIUM/LOW + CASE A-E yang sama).
+
+    columns berisi array avg_data_usage_gb, avg_call_duration, sms_freq, topup_freq,
+    complaint_count dan monthly_spend (mis. CustomerSnapshot.numeric).
+    Returns: (code bucket int8 -> CHURN_BUCKETS, revenue at risk = total spend HIGH).
+    """
+    avg_data = float(global_avgs.get('avg_data_usage_gb', 0))
+    avg_call = float(global_avgs.get('avg_call_duration', 0))
+    avg_sms = float(global_avgs.get('sms_freq', 0))
+    avg_topup = float(global_avgs.get('topup_freq', 0))
+
+    usage_topup = columns['topup_freq']
+    has_complaint = columns['complaint_count'] > 0
+    no_complaint = ~has_complaint
+
+    aboveeq_data = columns['avg_data_usage_gb'] >= avg_data
+    aboveeq_call = columns['avg_call_duration'] >= avg_call
+    aboveeq_sms = columns['sms_freq'] >= avg_sms
+    aboveeq_topup = usage_topup >= avg_topup
+
+    # below_* dihitung terpisah (bukan ~aboveeq_*) supaya NaN tetap konsisten dengan versi scalar
+    num_below_usage = (
+        (columns['avg_data_usage_gb'] < avg_data).astype(np.int8)
+        + (columns['avg_call_duration'] < avg_call)
+        + (columns['sms_freq'] < avg_sms)
+    )
+    num_above_usage = aboveeq_data.astype(np.int8) + aboveeq_call + aboveeq_sms
+    all_usage_above = num_above_usage == 3
+
+    high = np.asarray(pred_labels == 'Retention Offer', dtype=bool)
+    medium = has_complaint & (num_below_usage >= 2) & (usage_topup < avg_topup)
+    low = (
+        (no_complaint & (num_above_usage >= 2))                              # CASE A
+        | (has_complaint & aboveeq_topup)                                    # CASE B
+        | (no_complaint & all_usage_above)                                   # CASE C
+        | (no_complaint & (usage_topup <= avg_topup) & (num_above_usage >= 1))  # CASE D
+        | (no_complaint & aboveeq_topup & all_usage_above)                   # CASE E
+    )
+
+    # Default MEDIUM, lalu LOW, HIGH menimpa sesuai prioritas rules
+    codes = np.full(len(high), CHURN_BUCKETS.index('medium'), dtype=np.int8)
+    codes[low & ~medium] = CHURN_BUCKETS.index('low')
+    codes[high] = CHURN_BUCKETS.index('high')
+
+    revenue_at_risk = float(columns['monthly_spend'][high].sum())
+    return codes, revenue_at_risk
+
+
+def recommend_products(pred_label: str, user_row: Dict[str, Any], catalog: ProductCatalog, total_recommendations: int) -> List[RecommendationItem]:
+    """
+    Notebook-inspired recommendation v16 (max wallet share, filler murah).
+
+    Berjalan di atas index ProductCatalog (array per kategori yang sudah terurut),
+    filter budget pakai binary search; tanpa filter/sort DataFrame per request.
+    Harga sama diurutkan menurut baris katalog (lihat _stable_order). Versi DataFrame
+    sebelumnya memakai quicksort pandas (tidak stabil), jadi urutan produk dengan harga
+    kembar bisa berbeda dari versi itu; tanpa harga kembar hasilnya identik.
+    """
     recs: List[RecommendationItem] = []
     seen = set()
 
     budget = float(user_row.get('monthly_spend') or 0.0)
     primary_category = TARGET_TO_CATEGORY_MAP.get(pred_label)
 
-    def add_items(df: pd.DataFrame, desc: str, take: int) -> None:
-        nonlocal recs, seen
-        for _, row in df.head(take).iterrows():
-            recs.append(RecommendationItem(
-                product_id=str(row.get('product_id') or ''),
-                product_name=str(row.get('product_name') or ''),
-                category=str(row.get('category') or ''),
-                price=float(row.get('price') or 0),
-                duration_days=int(row.get('duration_days') or 30),
-                reasons=[desc, f"Sesuai prediksi model: {pred_label}"]
-            ))
-            seen.add(row.get('product_name'))
+    def add_items(positions: np.ndarray, desc: str, take: int) -> None:
+        for pos in positions[:take]:
+            recs.append(catalog.item(pos, [desc, f"Sesuai prediksi model: {pred_label}"]))
+            seen.add(catalog.names[pos])
 
     # Primary
-    if primary_category:
-        base = products_df[products_df['category'] == primary_category].copy()
-
+    base = catalog.category(primary_category)
+    if base is not None:
         if primary_category == 'Retention Offer':
-            top = base[base['price'] <= budget * 0.8].sort_values('price', ascending=True)
-            if top.empty:
-                top = base.sort_values('price', ascending=True)
+            k = base.count_affordable(budget * 0.8)
+            top = base.price_asc[:k] if k else base.price_asc
             add_items(top, "Rekomendasi Utama (Retensi Hemat):", 3)
 
         elif primary_category == 'DeviceBundle':
-            top = base[base['price'] <= budget].sort_values('price', ascending=False)
-            if top.empty:
-                top = base.sort_values('price', ascending=True)
+            budget_ok = base.most_expensive_affordable(budget)
+            top = budget_ok if len(budget_ok) else base.price_asc
             add_items(top, "Rekomendasi Utama (Upgrade Gadget):", 3)
 
         else:
-            budget_ok = base[base['price'] <= budget].sort_values('price', ascending=False)
-            top = budget_ok if not budget_ok.empty else base.sort_values('price', ascending=True)
+            budget_ok = base.most_expensive_affordable(budget)
+            top = budget_ok if len(budget_ok) else base.price_asc
             add_items(top, f"Rekomendasi Utama ({primary_category} - Premium):", 3)
 
     remaining = total_recommendations - len(recs)
@@ -618,131 +2073,40 @@ def recommend_products(pred_label: str, user_row: Dict[str, Any], products_df: p
             if primary_category and cat == primary_category:
                 continue
 
-            filtered = products_df[
-                (products_df['category'] == cat) &
-                (products_df['price'] <= budget * 0.5) &
-                (~products_df['product_name'].isin(seen))
-            ].copy()
-            filtered['is_short'] = filtered['duration_days'].apply(lambda x: 1 if x <= 7 else 2)
-            top_sec = filtered.sort_values(by=['is_short', 'price'], ascending=[True, True])
-
-            if not top_sec.empty:
-                add_items(top_sec, f"Rekomendasi Sekunder ({cat})", 1)
+            cat_index = catalog.category(cat)
+            if cat_index is None:
+                continue
+            pick = None
+            for positions, prices in cat_index.short_first:
+                for pos in positions[:_count_le(prices, budget * 0.5)]:
+                    if catalog.names[pos] not in seen:
+                        pick = pos
+                        break
+                if pick is not None:
+                    break
+
+            if pick is not None:
+                add_items(np.array([pick]), f"Rekomendasi Sekunder ({cat})", 1)
                 remaining = total_recommendations - len(recs)
 
     # Fallback fillers
     if len(recs) < total_recommendations:
-        remaining = total_recommendations - len(recs)
-        fillers = products_df[(~products_df['product_name'].isin(seen)) & (products_df['price'] <= budget * 0.5)]
-        fillers = fillers.sort_values('price', ascending=True)
-        for _, row in fillers.head(remaining).iterrows():
-            recs.append(RecommendationItem(
-                product_id=str(row.get('product_id') or ''),
-                product_name=str(row.get('product_name') or ''),
-                category=str(row.get('category') or ''),
-                price=float(row.get('price') or 0),
-                duration_days=int(row.get('duration_days') or 30),
-                reasons=[f"{row.get('category')}", "Filler value"]
-            ))
+        for pos in catalog.price_asc[:_count_le(catalog.price_asc_values, budget * 0.5)]:
             if len(recs) >= total_recommendations:
                 break
+            if catalog.names[pos] not in seen:
+                recs.append(catalog.item(pos, [catalog.category_labels[pos], "Filler value"]))
 
     return recs[:total_recommendations]
 
 
-def simulate_product_impact(new_product: Dict[str, Any]) -> Dict[str, Any]:
-    """Simulate product impact across all customers (notebook logic)."""
-    if supabase is None:
-        raise HTTPException(status_code=503, detail='Database not configured')
-    if clf is None or label_encoder is None:
-        raise HTTPException(status_code=500, detail='Model not loaded')
-
-    # Fetch ALL customers using pagination (Supabase max ~1000 per request)
-    all_users = []
-    page = 0
-    page_size = 1000
-    max_attempts = 20  # Safety limit untuk prevent infinite loop
-    attempt = 0
-    empty_batches = 0  # Counter untuk batches kosong berturut-turut
-
-    while attempt < max_attempts:
-        # Gunakan len(all_users) sebagai offset yang akurat (bukan page * page_size)
-        # Karena data mungkin tidak selalu eksak 1000 per batch
-        start_range = len(all_users)
-        end_range = len(all_users) + page_size - 1
-        
-        print(f"   📥 Fetching batch {page + 1} (rows {start_range}-{end_range})...")
-        res = supabase.table('customer_profile').select('*').range(start_range, end_range).execute()
-        
-        batch_size = len(res.data) if res.data else 0
-        print(f"   ✅ Got {batch_size} users | Total collected: {len(all_users) + batch_size}")
-        
-        # Tambahkan data ke list JIKA ada
-        if batch_size > 0:
-            all_users.extend(res.data)
-            empty_batches = 0  # Reset counter saat ada data
-        else:
-            empty_batches += 1
-        
-        # Jika dapat 2+ batches kosong berturut-turut, STOP (truly no more data)
-        if empty_batches >= 2:
-            print(f"   🛑 No data in {empty_batches} consecutive batches - pagination complete")
-            break
-        
-        # Selalu lanjut ke batch berikutnya
-        page += 1
-        attempt += 1
-    
-    print(f"   ✅ Pagination complete after {page} batches")
-
-    # Build features DataFrame properly (batch processing)
-    df_users = pd.DataFrame(all_users)
-    
-    # Prepare features using same logic as prepare_features but for multiple rows
-    numeric_features_list = [
-        'avg_data_usage_gb', 'pct_video_usage', 'avg_call_duration', 'sms_freq',
-        'monthly_spend', 'topup_freq', 'travel_score', 'complaint_count'
-    ]
-    
-    X = df_users.copy()
-    
-    # Replace comma decimal and coerce for numeric columns
-    for col in numeric_features_list:
-        if col in X.columns:
-            X[col] = X[col].astype(str).str.replace(',', '.')
-            X[col] = pd.to_numeric(X[col], errors='coerce').fillna(0)
-    
-    # Apply abs fix for negatives
-    if 'avg_call_duration' in X.columns:
-        X['avg_call_duration'] = X['avg_call_duration'].abs()
-    if 'monthly_spend' in X.columns:
-        X['monthly_spend'] = X['monthly_spend'].abs()
-    
-    # Drop ID and target-like cols
-    for drop_col in ('customer_id', 'target_offer', 'target_encoded'):
-        if drop_col in X.columns:
-            X = X.drop(columns=[drop_col])
-
-
-    # Predict all users
-    all_preds_idx = clf.predict(X)
-    all_labels = label_encoder.inverse_transform(all_preds_idx)
-
-    hits = 0
-    revenue = 0.0
-    segments = {}
+def simulate_product_impact(sim: "SimulationAggregate") -> Dict[str, Any]:
+    """Simulate product impact across all customers (notebook logic) dari agregat hits per label."""
+    total_users = sim.total
+    hits = sim.hits
+    revenue = sim.revenue
+    segments = sim.segments
 
-    for i, label in enumerate(all_labels):
-        budget = float(all_users[i].get('monthly_spend') or 0)
-        cat = TARGET_TO_CATEGORY_MAP.get(label)
-        
-        if cat == new_product['category']:
-            if new_product['price'] <= budget:
-                hits += 1
-                revenue += new_product['price']
-                segments[label] = segments.get(label, 0) + 1
-
-    total_users = len(all_users)
     conversion_rate = (hits / total_users * 100) if total_users > 0 else 0
 
     # Generate recommendation text
@@ -759,54 +2123,802 @@ def simulate_product_impact(new_product: Dict[str, Any]) -> Dict[str, Any]:
         'conversion_rate': conversion_rate,
         'segments': segments,
         'recommendation': recommendation,
-        'total_users': total_users
+        'total_users': total_users,
+        'addressable_spend': sim.spend
     }
 
 
+def analyze_customer(customer_row: Dict[str, Any], catalog: ProductCatalog, top_n: int) -> Tuple[str, str, List[RecommendationItem]]:
+    """
+    Prediksi label + churn bucket + rekomendasi untuk satu customer (CPU-bound).
+
+    Churn rules dan rekomendasi memakai nilai numeric yang sudah bersih (abs, comma
+    decimal, NaN -> 0), sama seperti CustomerSnapshot.record di /infer/analytic/batch.
+    """
+    features = feature_encoder.row(customer_row)
+    profile = {**customer_row, **features}
+
+    # Predict label (PURE ML - ignore DB target_offer)
+    pred_idx = model_predict_row(features)
+    pred_label = label_encoder.inverse_transform([pred_idx])[0]
+
+    # Churn calculation using RULE-BASED logic (label only, no probability)
+    churn_label = compute_churn_bucket(pred_label, profile, global_averages)
+
+    # Products + recommendations
+    items = recommend_products(pred_label, profile, catalog, top_n)
+    return pred_label, churn_label, items
+
+
+# ---------- Chunked analytics ----------
+def quantile_sketch() -> QuantileSketch:
+    """QuantileSketch dengan threshold exact dan k dari config (ANALYTICS_SKETCH_*)."""
+    return QuantileSketch(ANALYTICS_SKETCH_EXACT_MAX, ANALYTICS_SKETCH_K)
+
+
+class ChurnAggregate:
+    """Jumlah per churn bucket + revenue at risk; partial per chunk digabung dengan merge()."""
+
+    def __init__(self) -> None:
+        self.total = 0
+        self.counts = np.zeros(len(CHURN_BUCKETS), dtype=np.int64)
+        self.revenue_at_risk = 0.0
+
+    def add(self, chunk: CustomerSnapshot, labels: np.ndarray) -> None:
+        codes, revenue_at_risk = compute_churn_buckets(labels, chunk.numeric, global_averages)
+        self.total += len(chunk)
+        self.counts += np.bincount(codes, minlength=len(CHURN_BUCKETS))
+        self.revenue_at_risk += revenue_at_risk
+
+    def empty(self) -> "ChurnAggregate":
+        return ChurnAggregate()
+
+    def merge(self, other: "ChurnAggregate", sign: int = 1) -> None:
+        """sign=-1: retract partial (baris lama customer yang berubah)."""
+        self.total += sign * other.total
+        self.counts += sign * other.counts
+        self.revenue_at_risk += sign * other.revenue_at_risk
+
+
+class SimulationAggregate:
+    """Hits, revenue dan segment per label untuk satu produk simulasi."""
+
+    def __init__(self, new_product: Dict[str, Any]) -> None:
+        self.product = new_product
+        self.total = 0
+        self.hits = 0
+        self.spend = 0.0  # total monthly_spend user yang hit (addressable spend)
+        self.segments: Dict[str, int] = {}  # urutan = kemunculan pertama, seperti loop per user
+
+    def add(self, chunk: CustomerSnapshot, labels: np.ndarray) -> None:
+        self.total += len(chunk)
+        target_labels = [label for label, cat in TARGET_TO_CATEGORY_MAP.items() if cat == self.product['category']]
+        hit = np.isin(labels, target_labels) & (self.product['price'] <= chunk.numeric['monthly_spend'])
+        codes, uniques = pd.factorize(labels[hit])
+        for label, count in zip(uniques, np.bincount(codes, minlength=len(uniques))):
+            self.segments[label] = self.segments.get(label, 0) + int(count)
+        self.hits += int(hit.sum())
+        self.spend += float(chunk.numeric['monthly_spend'][hit].sum())
+
+    def merge(self, other: "SimulationAggregate") -> None:
+        self.total += other.total
+        self.hits += other.hits
+        self.spend += other.spend
+        for label, count in other.segments.items():
+            self.segments[label] = self.segments.get(label, 0) + count
+
+    @property
+    def revenue(self) -> float:
+        return float(self.hits * self.product['price'])
+
+
+class BudgetAggregate:
+    """
+    monthly_spend per label prediksi (+ posisi baris) untuk simulasi banyak harga sekaligus.
+
+    Setelah semua chunk di-merge, budget per label di-sort sekali (+ prefix sum); tiap
+    (kategori, harga) cukup binary search: hits label = jumlah budget >= harga, spend =
+    selisih prefix sum. Posisi baris menjaga urutan segments sama dengan
+    SimulationAggregate (kemunculan pertama di scan). Sebagai maintained aggregate index
+    ini dipakai ulang selama snapshot/model sama dan di-rebuild saat snapshot berubah.
+    """
+
+    INCREMENTAL = False  # posisi baris bergeser oleh delta change log: rebuild, bukan retract/insert
+
+    def __init__(self) -> None:
+        self.total = 0
+        self.parts: Dict[Any, List[Tuple[np.ndarray, np.ndarray]]] = {}  # label -> [(budget, baris)]
+        self._index: Optional[Dict[Any, Tuple[np.ndarray, np.ndarray]]] = None
+
+    def empty(self) -> "BudgetAggregate":
+        return BudgetAggregate()
+
+    def add(self, chunk: CustomerSnapshot, labels: np.ndarray) -> None:
+        codes, uniques = pd.factorize(labels)
+        budgets = chunk.numeric['monthly_spend']
+        rows = np.arange(len(chunk)) + self.total
+        for code, label in enumerate(uniques):
+            mask = codes == code
+            self.parts.setdefault(label, []).append((budgets[mask], rows[mask]))
+        self.total += len(chunk)
+        self._index = None
+
+    def merge(self, other: "BudgetAggregate") -> None:
+        for label, parts in other.parts.items():
+            self.parts.setdefault(label, []).extend((budgets, rows + self.total) for budgets, rows in parts)
+        self.total += other.total
+        self._index = None
+
+    def index(self) -> Dict[Any, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        label -> (budget naik, baris pertama di scan dengan budget >= budget[i], prefix sum
+        budget dengan 0 di depan); dibangun sekali.
+        """
+        if self._index is None:
+            index = {}
+            for label, parts in self.parts.items():
+                budgets = np.concatenate([part[0] for part in parts])
+                rows = np.concatenate([part[1] for part in parts])
+                order = np.argsort(budgets, kind='stable')
+                budgets = budgets[order]
+                index[label] = (
+                    budgets,
+                    np.minimum.accumulate(rows[order][::-1])[::-1],
+                    np.concatenate([[0.0], np.cumsum(budgets)]),
+                )
+            self._index = index
+        return self._index
+
+    def simulate(self, new_product: Dict[str, Any]) -> "SimulationAggregate":
+        """Hasil sama dengan SimulationAggregate atas seluruh scan, tanpa scan ulang."""
+        sim = SimulationAggregate(new_product)
+        sim.total = self.total
+        index = self.index()
+        found = []
+        for label, cat in TARGET_TO_CATEGORY_MAP.items():
+            if cat != new_product['category'] or label not in index:
+                continue
+            budgets, first_row, prefix = index[label]
+            pos = int(np.searchsorted(budgets, new_product['price'], side='left'))  # price <= budget
+            if pos < len(budgets):
+                found.append((int(first_row[pos]), label, len(budgets) - pos))
+                sim.spend += float(prefix[-1] - prefix[pos])
+        for _, label, count in sorted(found):
+            sim.segments[label] = count
+        sim.hits = sum(sim.segments.values())
+        return sim
+
+
+class OverviewAggregate:
+    """
+    Semua angka /analytics/overview sebagai agregat mergeable: count, sum, Counter
+    top products dan QuantileSketch untuk threshold berbasis quantile.
+    """
+
+    def __init__(
+        self, catalog: ProductCatalog, top_products: Optional[Dict[str, Tuple[List[str], np.ndarray, np.ndarray]]] = None
+    ) -> None:
+        self.catalog = catalog
+        if top_products is None:
+            # Pre-compute products per category (sekali per scan, bukan per-user), sorted by price.
+            # sort_values yang sama dengan versi loop -> urutan produk berharga sama tidak berubah
+            products_df = catalog.frame
+            top_products = {}
+            for cat in TARGET_TO_CATEGORY_MAP.values():
+                cat_prods = products_df[products_df['category'] == cat].sort_values('price', ascending=False)
+                prices = cat_prods['price'].to_numpy(dtype=np.float64, na_value=np.nan)
+                top_products[cat] = (
+                    [label for label, target_cat in TARGET_TO_CATEGORY_MAP.items() if target_cat == cat],
+                    prices[:int((~np.isnan(prices)).sum())][::-1].copy(),  # harga naik tanpa NaN (di akhir)
+                    cat_prods['product_name'].to_numpy(dtype=object),  # urutan harga turun
+                )
+        self.top_products = top_products
+        self.class_set = set(label_encoder.classes_)
+        self.total = 0
+        self.str_valid = self.str_correct = 0
+        self.num_valid = self.num_correct = 0
+        self.num_failed = False
+        self.data_usage = quantile_sketch()
+        self.call_duration = quantile_sketch()
+        self.low_video_call_duration = quantile_sketch()  # call duration user dengan pct_video <= 0.4
+        self.video_lovers = 0
+        self.plan_spend = {'Prepaid': 0.0, 'Postpaid': 0.0}
+        self.plan_counts = {'Prepaid': 0, 'Postpaid': 0}
+        self.product_counter: Counter = Counter()
+
+    def empty(self) -> "OverviewAggregate":
+        """Partial kosong dengan index produk yang sama (untuk agregasi per chunk)."""
+        return OverviewAggregate(self.catalog, self.top_products)
+
+    def add(self, chunk: CustomerSnapshot, labels: np.ndarray) -> None:
+        self.total += len(chunk)
+        self._add_accuracy(chunk, labels)
+
+        self.data_usage.add(chunk.numeric['avg_data_usage_gb'])
+        plan_types = chunk.categorical('plan_type')
+        spend = chunk.numeric['monthly_spend']
+        for plan in self.plan_spend:
+            plan_mask = plan_types == plan
+            self.plan_counts[plan] += int(plan_mask.sum())
+            self.plan_spend[plan] += float(spend[plan_mask].sum())
+
+        video_pct = chunk.numeric['pct_video_usage']
+        call_dur = chunk.numeric['avg_call_duration']
+        self.call_duration.add(call_dur)
+        self.low_video_call_duration.add(call_dur[video_pct <= 0.4])
+        self.video_lovers += int((video_pct >= 0.6).sum())
+
+        self._add_top_products(chunk, labels)
+
+    def _add_accuracy(self, chunk: CustomerSnapshot, labels: np.ndarray) -> None:
+        y_raw = pd.Series(chunk.categorical('target_offer'))
+        if not y_raw.notna().any():
+            return
+
+        # 1) String match (trim, case-sensitive to preserve class names)
+        y_str = y_raw.astype(str).str.strip()
+        mask_valid_str = y_str.isin(self.class_set).to_numpy()
+        self.str_valid += int(mask_valid_str.sum())
+        self.str_correct += int((y_str.to_numpy()[mask_valid_str] == labels[mask_valid_str]).sum())
+
+        # 2) Numeric decode -> inverse label_encoder (dipakai hanya jika tidak ada string match sama sekali)
+        y_num = pd.to_numeric(y_raw, errors='coerce')
+        mask_num = y_num.notna().to_numpy()
+        if mask_num.any():
+            try:
+                y_true_decoded = label_encoder.inverse_transform(y_num[mask_num].astype(int).values)
+                self.num_correct += int((y_true_decoded == labels[mask_num]).sum())
+            except Exception:
+                self.num_failed = True
+            self.num_valid += int(mask_num.sum())
+
+    def _add_top_products(self, chunk: CustomerSnapshot, labels: np.ndarray) -> None:
+        """
+        Per user: top 3 termahal dalam budget di kategori label prediksinya, fallback produk
+        termurah. Vectorized per kategori: produk dalam budget = suffix array harga turun,
+        panjangnya dari searchsorted; count per posisi produk dengan bincount.
+        """
+        budgets = chunk.numeric['monthly_spend']
+        counts: Dict[Any, int] = {}
+        first_seen: Dict[Any, int] = {}  # urutan kemunculan pertama (row * 3 + slot) seperti loop per user
+        for cat_labels, prices_asc, names in self.top_products.values():
+            rows = np.flatnonzero(np.isin(labels, cat_labels))
+            if not len(rows) or not len(names):
+                continue
+            n_priced = len(prices_asc)
+            affordable = np.searchsorted(prices_asc, budgets[rows], side='right')
+            start = n_priced - affordable  # posisi termahal dalam budget di array harga turun
+
+            positions: List[np.ndarray] = []
+            order: List[np.ndarray] = []
+            has_affordable = affordable > 0
+            for slot in range(3):
+                # Ambil top 3 termahal dalam budget (sudah sorted descending)
+                take = has_affordable & (start + slot < n_priced)
+                positions.append(start[take] + slot)
+                order.append(rows[take] * 3 + slot)
+            # Fallback: ambil yang termurah (baris terakhir, termasuk produk tanpa harga)
+            positions.append(np.full(int((~has_affordable).sum()), len(names) - 1))
+            order.append(rows[~has_affordable] * 3)
+
+            positions_all = np.concatenate(positions)
+            product_counts = np.bincount(positions_all, minlength=len(names))
+            first = np.full(len(names), np.iinfo(np.int64).max)
+            np.minimum.at(first, positions_all, np.concatenate(order))
+            for pos in np.flatnonzero(product_counts):
+                name = names[pos]
+                counts[name] = counts.get(name, 0) + int(product_counts[pos])
+                first_seen[name] = min(first_seen.get(name, first[pos]), int(first[pos]))
+        self.product_counter.update({name: counts[name] for name in sorted(first_seen, key=first_seen.__getitem__)})
+
+    def merge(self, other: "OverviewAggregate", sign: int = 1) -> None:
+        """sign=-1: retract partial (baris lama customer yang berubah)."""
+        self.total += sign * other.total
+        self.str_valid += sign * other.str_valid
+        self.str_correct += sign * other.str_correct
+        self.num_valid += sign * other.num_valid
+        self.num_correct += sign * other.num_correct
+        self.num_failed |= other.num_failed  # sticky sampai rebuild penuh
+        self.data_usage.merge(other.data_usage, sign)
+        self.call_duration.merge(other.call_duration, sign)
+        self.low_video_call_duration.merge(other.low_video_call_duration, sign)
+        self.video_lovers += sign * other.video_lovers
+        for plan in self.plan_spend:
+            self.plan_spend[plan] += sign * other.plan_spend[plan]
+            self.plan_counts[plan] += sign * other.plan_counts[plan]
+        if sign < 0:
+            self.product_counter.subtract(other.product_counter)
+            self.product_counter = +self.product_counter  # buang count <= 0
+        else:
+            # Counter.update menjaga urutan kemunculan pertama -> tie-break most_common sama.
+            # Produk yang baru muncul lewat delta masuk di akhir, jadi tie-break bisa beda
+            # dari rescan penuh sampai snapshot di-reload.
+            self.product_counter.update(other.product_counter)
+
+    def result(self) -> Dict[str, Any]:
+        total_users = self.total
+        model_performance = {
+            'accuracy': None,
+            'total_classes': len(label_encoder.classes_),
+            'classes': label_encoder.classes_.tolist()
+        }
+        if self.str_valid:
+            model_performance['accuracy'] = round(self.str_correct / self.str_valid * 100, 2)
+        elif self.num_valid and not self.num_failed:
+            model_performance['accuracy'] = round(self.num_correct / self.num_valid * 100, 2)
+
+        q75_usage = self.data_usage.quantile(0.75)
+        high_data_threshold = max(10.0, q75_usage)
+        high_data_users = self.data_usage.count_ge(high_data_threshold)
+
+        median_call = self.call_duration.median() if len(self.call_duration) else 0.0
+        voice_lovers = self.low_video_call_duration.count_ge(median_call)
+        video_voice = {
+            'video_lovers': self.video_lovers,
+            'voice_lovers': voice_lovers,
+            'balanced': total_users - self.video_lovers - voice_lovers,
+            'median_call': median_call
+        }
+
+        plan_spend = {
+            plan: self.plan_spend[plan] / self.plan_counts[plan] if self.plan_counts[plan] else 0.0
+            for plan in self.plan_spend
+        }
+
+        # Hitung top 10 produk yang paling sering direkomendasikan
+        total_recs = sum(self.product_counter.values())
+        top_products = [
+            {
+                'product_name': prod_name,
+                'count': cnt,
+                'percentage': round((cnt / total_recs) * 100, 1) if total_recs else 0.0
+            }
+            for prod_name, cnt in self.product_counter.most_common(10)
+        ]
+
+        return {
+            'total_users': total_users,
+            'model_performance': model_performance,
+            'high_data': {
+                'count': high_data_users,
+                'percentage': round((high_data_users / total_users) * 100, 1) if total_users else 0.0,
+                'threshold': high_data_threshold,
+                'q75_usage': q75_usage
+            },
+            'plan_spend': plan_spend,
+            'plan_counts': dict(self.plan_counts),
+            'video_voice': video_voice,
+            'top_products': top_products,
+            'generated_at': datetime.now(timezone.utc).isoformat()
+        }
+
+
+class PercentileAggregate:
+    """QuantileSketch per kolom numeric (nilai bersih) untuk percentile dashboard."""
+
+    def __init__(self) -> None:
+        self.total = 0
+        self.sketches = {col: quantile_sketch() for col in NUMERIC_FEATURES}
+
+    def empty(self) -> "PercentileAggregate":
+        return PercentileAggregate()
+
+    def add(self, chunk: CustomerSnapshot, labels: np.ndarray) -> None:
+        self.total += len(chunk)
+        for col, sketch in self.sketches.items():
+            sketch.add(chunk.numeric[col])
+
+    def merge(self, other: "PercentileAggregate", sign: int = 1) -> None:
+        self.total += sign * other.total
+        for col, sketch in self.sketches.items():
+            sketch.merge(other.sketches[col], sign)
+
+    def result(self, quantiles: List[float], columns: List[str]) -> Dict[str, Any]:
+        return {
+            'total_users': self.total,
+            'percentiles': {
+                col: {f'p{q * 100:g}': self.sketches[col].quantile(q) for q in quantiles}
+                for col in columns
+            },
+            'rank_error': {col: self.sketches[col].rank_error() for col in columns},
+            'generated_at': datetime.now(timezone.utc).isoformat()
+        }
+
+
+def aggregate_snapshot(snap: CustomerSnapshot, aggregate: Any, make_part: Callable[[], Any]) -> Any:
+    """Chunk snapshot -> partial aggregate -> merge (CPU-bound, jalan di threadpool)."""
+    _, all_labels = predict_snapshot(snap)
+    start = 0
+    for chunk in snapshot_chunks(snap):
+        part = make_part()
+        part.add(chunk, all_labels[start:start + len(chunk)])
+        aggregate.merge(part)
+        start += len(chunk)
+    return aggregate
+
+
+def aggregate_page(page: Dict[str, np.ndarray], make_part: Callable[[], Any]) -> Any:
+    """Satu page PostgREST: clean (sudah di decode_page) -> predict -> partial aggregate."""
+    chunk = CustomerSnapshot.from_pages([page])
+    part = make_part()
+    part.add(chunk, predict_labels(chunk))
+    return part
+
+
+async def aggregate_customers(
+    aggregate: Any, make_part: Callable[[], Any], maintain: Optional[Tuple[str, Any]] = None
+) -> Any:
+    """
+    Jalankan aggregate atas seluruh customer_profile.
+
+    ANALYTICS_SOURCE=stream: page di-scan langsung dari PostgREST dan dibuang setelah
+    digabung, jadi memory tidak bergantung pada jumlah customer. Selain itu chunk
+    diambil dari snapshot bersama (prediksi di-cache per snapshot/model version);
+    maintain=(name, extra version) memakai agregat yang di-maintain per snapshot.
+    """
+    if ANALYTICS_SOURCE != 'stream':
+        snap = await get_customer_snapshot()
+        if maintain is not None:
+            return await run_in_threadpool(maintained_aggregate, snap, *maintain, aggregate)
+        return await run_in_threadpool(aggregate_snapshot, snap, aggregate, make_part)
+    reload_model_if_changed()
+    async for page in iter_customer_pages():
+        aggregate.merge(await run_in_threadpool(aggregate_page, page, make_part))
+    return aggregate
+
+
+# ---------- Incremental dashboard ----------
+# Agregat dashboard terakhir per nama: name -> ((model_version, snapshot version, extra), aggregate)
+_maintained_aggregates: Dict[str, Tuple[Tuple[Optional[str], str, Any], Any]] = {}
+_maintained_lock = threading.Lock()
+changelog_task: Optional[asyncio.Task] = None
+# ANALYTICS_SOURCE=stream: change_id terakhir yang terlihat (versi data tanpa snapshot)
+customer_change_cursor: Optional[int] = None
+
+
+def maintained_aggregate(snap: CustomerSnapshot, name: str, extra: Any, aggregate: Any) -> Any:
+    """
+    Agregat full-base untuk snapshot, disimpan per (model, snapshot, extra) version.
+
+    Jika change log aktif, apply_snapshot_delta memindahkan entry ke snapshot baru dengan
+    retract/insert per customer yang berubah, jadi request dashboard tidak rescan base.
+    Entry yang sudah dipublish tidak pernah diubah (delta membuat copy baru).
+    """
+    reload_model_if_changed()
+    key = (model_version, snap.version, extra)
+    with _maintained_lock:
+        entry = _maintained_aggregates.get(name)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+    aggregate = aggregate_snapshot(snap, aggregate, aggregate.empty)
+    with _maintained_lock:
+        if snap is customer_snapshot:  # jangan timpa entry yang sudah di-maintain ke snapshot lebih baru
+            _maintained_aggregates[name] = (key, aggregate)
+    return aggregate
+
+
+def _maintain_aggregates(
+    old_version: str,
+    new_version: str,
+    retract: CustomerSnapshot,
+    retract_labels: np.ndarray,
+    insert: CustomerSnapshot,
+    insert_labels: np.ndarray,
+) -> None:
+    with _maintained_lock:
+        for name, (key, aggregate) in list(_maintained_aggregates.items()):
+            if key[:2] != (model_version, old_version) or not getattr(aggregate, 'INCREMENTAL', True):
+                del _maintained_aggregates[name]  # dibangun ulang saat request berikutnya
+                continue
+            fresh = aggregate.empty()
+            fresh.merge(aggregate)
+            for chunk, labels, sign in ((retract, retract_labels, -1), (insert, insert_labels, 1)):
+                if len(chunk):
+                    part = aggregate.empty()
+                    part.add(chunk, labels)
+                    fresh.merge(part, sign)
+            _maintained_aggregates[name] = ((key[0], new_version, key[2]), fresh)
+
+
+def apply_snapshot_delta(
+    snap: CustomerSnapshot, records: List[Dict[str, Any]], changed_ids: np.ndarray, change_id: int
+) -> CustomerSnapshot:
+    """
+    Satu batch change log -> snapshot baru. Hanya customer yang berubah yang di-decode dan
+    di-rescore; prediksi cache dan agregat dashboard di-patch (retract baris lama, insert
+    baris baru). Jalan di threadpool.
+    """
+    page = CustomerSnapshot.decode_page(records)
+    delta = SnapshotDelta(snap, page['customer_id'], changed_ids)
+    version = hashlib.blake2b(f'{snap.version}:{change_id}'.encode(), digest_size=8).hexdigest()
+    new_snap = snap.with_delta(delta, page, version)
+    new_snap.change_id = change_id
+
+    with _prediction_lock:
+        cached = _prediction_cache.get((model_version, snap.version))
+        if cached is None:
+            return new_snap  # prediksi/agregat belum pernah dihitung: dihitung penuh saat dibutuhkan
+        chunk = CustomerSnapshot.from_pages([page])
+        if len(chunk):
+            pred_idx = np.asarray(model_predict_columns(chunk.feature_columns(), len(chunk)))
+            labels = np.asarray(label_encoder.inverse_transform(pred_idx), dtype=object)
+        else:
+            pred_idx = np.empty(0, dtype=cached[0].dtype)
+            labels = np.empty(0, dtype=object)
+        patched = (delta.apply(cached[0], pred_idx), delta.apply(cached[1], labels))
+        for values in patched:
+            values.setflags(write=False)
+        _prediction_cache.clear()
+        _prediction_cache[(model_version, version)] = patched
+
+    _maintain_aggregates(
+        snap.version, version, snap.take(delta.retract_rows), cached[1][delta.retract_rows], chunk, labels
+    )
+    return new_snap
+
+
+def changelog_enabled() -> bool:
+    # Snapshot mmap bersama (SNAPSHOT_SHARED_DIR) read-only: tidak di-update lewat delta
+    return CHANGELOG_POLL_SECONDS > 0 and supabase_rest is not None and shared_snapshot_store is None
+
+
+async def latest_change_id() -> Optional[int]:
+    """change_id terakhir di customer_profile_changes (0 = kosong, None = tabel tidak tersedia)."""
+    try:
+        rows = await supabase_rest.select(
+            'customer_profile_changes', columns='change_id', order='change_id.desc', limit=1
+        )
+    except HTTPException as e:
+        print(f"⚠️ Change log unavailable, snapshot will only refresh by full reload: {e.detail}")
+        return None
+    return int(rows[0]['change_id']) if rows else 0
+
+
+async def fetch_customer_changes(after: int, max_ids: int) -> Tuple[List[str], int, bool]:
+    """
+    customer_id unik yang berubah setelah change_id `after`.
+
+    Return (ids, change_id terakhir, full_reload); full_reload jika ada TRUNCATE atau
+    lebih dari max_ids customer berubah (rescan lebih murah dari delta sebesar itu).
+    """
+    ids: Dict[str, None] = {}
+    last = after
+    while True:
+        rows = await supabase_rest.select(
+            'customer_profile_changes', columns='change_id,customer_id,op',
+            filters={'change_id': f'gt.{last}'}, order='change_id.asc', limit=PG_PAGE_SIZE,
+        )
+        for row in rows:
+            if row['op'] == 'T':
+                return [], int(row['change_id']), True
+            ids[str(row['customer_id'])] = None
+        if rows:
+            last = int(rows[-1]['change_id'])
+        if len(ids) > max_ids:
+            return [], last, True
+        if len(rows) < PG_PAGE_SIZE:
+            return list(ids), last, False
+
+
+async def apply_customer_changes() -> int:
+    """Satu poll change log -> delta ke customer_snapshot; return jumlah customer yang di-rescore."""
+    global customer_snapshot
+
+    snap = customer_snapshot
+    if snap is None or snap.change_id is None:
+        return 0  # snapshot belum di-load (lazy) atau change log tidak tersedia
+    max_ids = max(1, int(len(snap) * CHANGELOG_MAX_DELTA_FRACTION))
+    ids, last, full_reload = await fetch_customer_changes(snap.change_id, max_ids)
+    if full_reload:
+        print(f"   🔄 Change log up to {last}: too many changes, reloading customer snapshot")
+        await get_customer_snapshot(force_refresh=True)
+        return 0
+    if not ids:
+        return 0
+
+    start_time = time.time()
+    async with async_lock('customer_snapshot'):
+        if customer_snapshot is not snap:
+            return 0  # snapshot di-reload paralel; poll berikutnya mulai dari watermark-nya
+        records = await fetch_customers(ids, CUSTOMER_SNAPSHOT_COLUMNS)
+        customer_snapshot = await run_in_threadpool(
+            apply_snapshot_delta, snap, records, np.asarray(ids, dtype=str), last
+        )
+    print(f"   🔄 Applied {len(ids)} customer changes (change_id <= {last}) in {time.time() - start_time:.2f}s")
+    return len(ids)
+
+
+async def refresh_change_cursor() -> bool:
+    """Mode stream (tanpa snapshot): simpan change_id terakhir sebagai versi data customer."""
+    global customer_change_cursor
+    cursor = await latest_change_id()
+    if cursor is None:
+        return False  # change log tidak tersedia: response analytics hanya kadaluarsa lewat TTL
+    customer_change_cursor = cursor
+    return True
+
+
+async def changelog_worker() -> None:
+    while True:
+        await asyncio.sleep(CHANGELOG_POLL_SECONDS)
+        try:
+            if ANALYTICS_SOURCE == 'stream':
+                if not await refresh_change_cursor():
+                    return
+                continue
+            await apply_customer_changes()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Change log poll failed: {getattr(e, 'detail', e)}")
+
+
+def start_changelog_poller() -> None:
+    global changelog_task
+    if not changelog_enabled() or changelog_task is not None:
+        return
+    changelog_task = asyncio.create_task(changelog_worker())
+    print(f"✅ Customer change log poller started (every {CHANGELOG_POLL_SECONDS:g}s)")
+
+
+async def stop_changelog_poller() -> None:
+    global changelog_task
+    if changelog_task is None:
+        return
+    changelog_task.cancel()
+    await asyncio.gather(changelog_task, return_exceptions=True)
+    changelog_task = None
+
+
+# ---------- Analytics response cache ----------
+class CachedResponse:
+    """Body JSON yang sudah di-serialize + weak ETag dari key versi data."""
+
+    def __init__(self, key: Tuple[Any, ...], body: bytes) -> None:
+        self.key = key
+        self.body = body
+        self.etag = 'W/"%s"' % hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest()
+        self.created_at = time.time()
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or any((tag[2:] if tag.startswith('W/') else tag) == self.etag[2:] for tag in tags)
+
+    def response(self, if_none_match: Optional[str]) -> Response:
+        headers = {'ETag': self.etag, 'Cache-Control': 'no-cache'}
+        if self.matches(if_none_match):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type='application/json', headers=headers)
+
+
+class AnalyticsResponseCache:
+    """
+    Stale-while-revalidate cache untuk response analytics full-base.
+
+    Entry fresh selama key (model version, data version, extra) sama dan umurnya
+    < ttl: request hanya lookup dict. Entry dengan key sama tapi umur >= ttl tetap
+    dilayani sementara satu task background menghitung ulang. Key berbeda (model
+    reload, snapshot/change log baru) = miss: request menunggu task yang sama seperti
+    saat belum ada entry, jadi client tidak menerima data lama atau 304.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self.entries: Dict[str, CachedResponse] = {}
+        self.tasks: Dict[str, asyncio.Future] = {}
+        self.hits = self.stale = self.misses = 0
+
+    async def get(
+        self,
+        name: str,
+        key: Callable[[], Tuple[Any, ...]],
+        compute: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> CachedResponse:
+        entry = self.entries.get(name)
+        if entry is not None and self.ttl > 0 and entry.key == key():
+            if time.time() - entry.created_at < self.ttl:
+                self.hits += 1
+                return entry
+            self._refresh(name, key, compute)
+            self.stale += 1
+            return entry
+        self.misses += 1
+        # shield: client yang disconnect tidak membatalkan refresh yang juga ditunggu request lain
+        return await asyncio.shield(self._refresh(name, key, compute))
+
+    def _refresh(
+        self,
+        name: str,
+        key: Callable[[], Tuple[Any, ...]],
+        compute: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> asyncio.Future:
+        task = self.tasks.get(name)
+        if task is not None:
+            return task
+
+        async def run() -> CachedResponse:
+            try:
+                before = key()
+                result = await compute()
+                # Key dari sebelum compute: data yang berubah selama compute memicu refresh
+                # berikutnya. Tanpa versi data (snapshot baru di-load oleh compute): baca ulang.
+                entry_key = before if before[1] is not None else key()
+                entry = CachedResponse(entry_key, JSONResponse(content=jsonable_encoder(result)).body)
+                self.entries[name] = entry
+                return entry
+            finally:
+                self.tasks.pop(name, None)
+
+        def log_failure(done: asyncio.Future) -> None:
+            if not done.cancelled() and done.exception() is not None:
+                print(f"⚠️ Analytics refresh {name} failed: {getattr(done.exception(), 'detail', done.exception())}")
+
+        task = self.tasks[name] = asyncio.ensure_future(run())
+        task.add_done_callback(log_failure)
+        return task
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self.entries),
+            'refreshing': len(self.tasks),
+            'hits': self.hits,
+            'stale': self.stale,
+            'misses': self.misses,
+        }
+
+
+analytics_response_cache = AnalyticsResponseCache(ANALYTICS_CACHE_TTL_SECONDS)
+
+
+def customer_data_version() -> Optional[str]:
+    """
+    Versi data customer_profile yang dipakai aggregate_customers: snapshot version, atau
+    cursor change log di mode stream. None = belum diketahui, hanya TTL yang meng-invalidate.
+    """
+    if ANALYTICS_SOURCE == 'stream':
+        return f'changes:{customer_change_cursor}' if customer_change_cursor is not None else None
+    snap = customer_snapshot
+    return snap.version if snap is not None else None
+
+
+def analytics_cache_key(data_version: Optional[str], extra: Any) -> Tuple[Any, ...]:
+    return (model_version, data_version, extra)
+
+
 @app.on_event("startup")
-def _startup():
+async def _startup():
     load_artifacts()
+    start_insight_workers()
+    start_changelog_poller()
+
+
+@app.on_event("shutdown")
+async def _shutdown():
+    await stop_changelog_poller()
+    await stop_insight_workers()
+    await close_http_clients()
+    insight_cache.close()
 
 
 @app.post("/infer/analytic", response_model=AnalyticResponse)
-def infer_analytic(payload: AnalyticRequest):
-    if clf is None or label_encoder is None or global_averages is None:
+async def infer_analytic(payload: AnalyticRequest):
+    if not model_ready() or global_averages is None:
         raise HTTPException(status_code=500, detail='Artifacts not loaded')
 
-    customer_row = fetch_customer(payload.customer_id)
-    X = prepare_features(customer_row)
+    customer_row = await fetch_customer(payload.customer_id)
+    catalog = await get_product_catalog()
 
-    # Predict label (PURE ML - ignore DB target_offer)
-    pred_idx = clf.predict(X)
-    pred_label = label_encoder.inverse_transform(pred_idx)[0]
+    # ML (predict + churn rules + rekomendasi) di threadpool, I/O tetap async
+    pred_label, churn_label, items = await run_in_threadpool(
+        analyze_customer, customer_row, catalog, payload.top_n or TOP_N_DEFAULT
+    )
     user_category = TARGET_TO_CATEGORY_MAP.get(pred_label, "Unknown")
-
-    # Churn calculation using RULE-BASED logic (label only, no probability)
-    churn_label = compute_churn_bucket(pred_label, customer_row, global_averages)
     churn_proba = 0.0  # Not calculated anymore
 
-    # Products + recommendations
-    products_df = fetch_products()
-    items = recommend_products(pred_label, customer_row, products_df, payload.top_n or TOP_N_DEFAULT)
-
-    # Generate AI insights if Gemini is available
-    ai_insights = None
-    if OLLAMA_MODEL:
-        try:
-            product_insight = gemini_user_product_insight(pred_label, customer_row, items)
-            # Only call churn analysis if product insight succeeded
-            if "tidak tersedia" not in product_insight.lower() and "quota" not in product_insight.lower():
-                churn_insight = gemini_churn_analysis(churn_proba, customer_row, pred_label)
-            else:
-                churn_insight = product_insight
-            
-            ai_insights = {
-                'product_recommendation': product_insight,
-                'churn_analysis': churn_insight
-            }
-        except Exception as e:
-            print(f"Error generating AI insights: {e}")
-            # Don't fail the whole request, just skip AI insights
+    # AI insights di-generate worker background; client poll insight_job_id
+    insight_job_id = submit_insight_job(pred_label, customer_row, items)
 
     return AnalyticResponse(
         recommendations={
@@ -816,12 +2928,150 @@ def infer_analytic(payload: AnalyticRequest):
         churn=ChurnResult(probability=churn_proba, label=churn_label, raw_label=pred_label),
         user_category=user_category,
         generated_at=datetime.now(timezone.utc).isoformat(),
-        ai_insights=ai_insights,
+        insight_job_id=insight_job_id,
+    )
+
+
+@app.get("/infer/analytic/insights/{job_id}", response_model=InsightJobResponse)
+async def get_insight_job(job_id: str, wait: float = 0.0):
+    """
+    Status + hasil AI insight untuk insight_job_id dari /infer/analytic.
+
+    wait > 0: long-poll, tahan response sampai job selesai atau `wait` detik
+    (maks INSIGHT_POLL_MAX_WAIT_SECONDS).
+    """
+    job = insight_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail='Insight job not found or expired')
+    if wait > 0 and not job.finished.is_set():
+        try:
+            await asyncio.wait_for(job.finished.wait(), timeout=min(wait, INSIGHT_POLL_MAX_WAIT_SECONDS))
+        except asyncio.TimeoutError:
+            pass
+    return job.to_response()
+
+
+@app.get("/infer/analytic/insights/{job_id}/stream")
+async def stream_insight_job(job_id: str):
+    """
+    Server-Sent Events untuk satu insight job: `delta` per potongan teks LLM,
+    `section` berisi teks final per section, lalu `done` (status + ai_insights).
+    Subscriber yang tersambung belakangan tetap menerima seluruh event dari awal.
+    """
+    job = insight_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail='Insight job not found or expired')
+
+    async def event_source():
+        sent = 0
+        while True:
+            changed = job.changed
+            while sent < len(job.events):
+                event, data = job.events[sent]
+                sent += 1
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                if event == 'done':
+                    return
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=INSIGHT_SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(
+        event_source(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@app.post("/infer/analytic/batch", response_model=AnalyticBatchResponse)
+async def infer_analytic_batch(payload: AnalyticBatchRequest):
+    """
+    Versi batch dari /infer/analytic untuk campaign list (tanpa AI insights).
+
+    Satu fetch per chunk id, satu clf.predict, satu pass churn bucket dan satu katalog
+    untuk semua customer. Error per customer (mis. ID tidak ditemukan) dilaporkan
+    di item masing-masing tanpa menggagalkan seluruh batch.
+    """
+    if not model_ready() or global_averages is None:
+        raise HTTPException(status_code=500, detail='Artifacts not loaded')
+    if len(payload.customer_ids) > ANALYTIC_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f'Maksimal {ANALYTIC_BATCH_MAX} customer_ids per batch')
+
+    rows = await fetch_customers(list(dict.fromkeys(payload.customer_ids)))
+    catalog = await get_product_catalog()
+    return await run_in_threadpool(
+        analyze_customer_batch, payload.customer_ids, rows, catalog, payload.top_n or TOP_N_DEFAULT
+    )
+
+
+def analyze_customer_batch(
+    customer_ids: List[str],
+    rows: List[Dict[str, Any]],
+    catalog: ProductCatalog,
+    top_n: int,
+) -> AnalyticBatchResponse:
+    """Bagian CPU dari /infer/analytic/batch (predict, churn bucket, rekomendasi)."""
+    batch = CustomerSnapshot.from_records(rows)
+
+    # Predict semua sekaligus; jika gagal (mis. kategori tak dikenal) ulangi per baris
+    labels: List[Optional[str]] = [None] * len(batch)
+    row_errors: Dict[int, str] = {}
+    if len(batch) > 0:
+        columns = batch.feature_columns()
+        try:
+            labels = list(label_encoder.inverse_transform(model_predict_columns(columns, len(batch))))
+        except ValueError:
+            for i in range(len(batch)):
+                try:
+                    row = {col: values[i:i + 1] for col, values in columns.items()}
+                    labels[i] = label_encoder.inverse_transform(model_predict_columns(row, 1))[0]
+                except ValueError as e:
+                    row_errors[i] = f'Invalid input: {str(e)}'
+
+    scored = [i for i in range(len(batch)) if i not in row_errors]
+    bucket_codes, _ = compute_churn_buckets(
+        np.asarray([labels[i] for i in scored], dtype=object),
+        {col: values[scored] for col, values in batch.numeric.items()},
+        global_averages,
+    )
+    buckets = dict(zip(scored, bucket_codes))
+
+    by_id: Dict[str, AnalyticBatchItem] = {}
+    for i in range(len(batch)):
+        cid = str(batch.customer_id[i])
+        if i in row_errors:
+            by_id[cid] = AnalyticBatchItem(customer_id=cid, error=row_errors[i])
+            continue
+        try:
+            pred_label = labels[i]
+            items = recommend_products(pred_label, batch.record(i), catalog, top_n)
+            by_id[cid] = AnalyticBatchItem(
+                customer_id=cid,
+                recommendations={'topN': top_n, 'items': [item.model_dump() for item in items]},
+                churn=ChurnResult(probability=0.0, label=CHURN_BUCKETS[buckets[i]], raw_label=pred_label),
+                user_category=TARGET_TO_CATEGORY_MAP.get(pred_label, "Unknown"),
+            )
+        except Exception as e:
+            print(f"Error in infer_analytic_batch ({cid}): {e}")
+            by_id[cid] = AnalyticBatchItem(customer_id=cid, error=f'Analysis failed: {str(e)}')
+
+    results = [
+        by_id.get(cid) or AnalyticBatchItem(customer_id=cid, error='Customer not found')
+        for cid in customer_ids
+    ]
+    failed = sum(1 for item in results if item.error)
+    return AnalyticBatchResponse(
+        results=results,
+        total=len(results),
+        succeeded=len(results) - failed,
+        failed=failed,
+        generated_at=datetime.now(timezone.utc).isoformat(),
     )
 
 
 @app.post("/infer/predict-user")
-def predict_new_user(payload: AnalyticRequest):
+async def predict_new_user(payload: AnalyticRequest):
     """
     Predict target offer untuk user BARU (tanpa ID di database).
     
@@ -851,35 +3101,18 @@ def predict_new_user(payload: AnalyticRequest):
         "churn_risk_level": "low"
     }
     """
-    if clf is None or label_encoder is None or global_averages is None:
+    if not model_ready() or global_averages is None:
         raise HTTPException(status_code=500, detail='Model not loaded')
 
+    catalog = await get_product_catalog()
     try:
-        # Prepare features dari request payload
         # Payload berisi dict dengan customer profile (bukan customer_id dari DB)
         user_profile = payload.dict()  # Convert Pydantic model to dict
         
-        # Buat DataFrame 1 baris
-        df_new = pd.DataFrame([user_profile])
-        
-        # Cleaning (konsisten dengan training)
-        df_new = clean_user_dataframe(df_new)
-        
-        # Prepare X dengan feature order konsisten
-        X_new = prepare_features_for_model(df_new)
-        
-        # Prediksi
-        pred_idx = clf.predict(X_new)
-        pred_label = label_encoder.inverse_transform(pred_idx)[0]
-        
-        # Churn calculation using RULE-BASED logic (label only, no probability)
-        churn_risk = compute_churn_bucket(pred_label, user_profile, global_averages)
+        # Cleaning + feature order + prediksi + churn rules + rekomendasi (konsisten dengan training)
+        pred_label, churn_risk, items = await run_in_threadpool(analyze_customer, user_profile, catalog, 5)
         churn_proba = 0.0  # Not calculated anymore
         
-        # Rekomendasi produk
-        products_df = fetch_products()
-        items = recommend_products(pred_label, user_profile, products_df, 5)
-        
         return {
             'pred_target_offer': pred_label,
             'user_category': TARGET_TO_CATEGORY_MAP.get(pred_label, "Unknown"),
@@ -897,7 +3130,7 @@ def predict_new_user(payload: AnalyticRequest):
 
 
 @app.post("/infer/simulate-product", response_model=ProductSimulationResponse)
-def simulate_product(payload: ProductSimulationRequest):
+async def simulate_product(payload: ProductSimulationRequest):
     """Simulate product impact across customer base using ML model."""
     new_product = {
         'product_name': payload.product_name,
@@ -906,7 +3139,12 @@ def simulate_product(payload: ProductSimulationRequest):
         'duration_days': payload.duration_days or 30
     }
     
-    result = simulate_product_impact(new_product)
+    if not model_ready():
+        raise HTTPException(status_code=500, detail='Model not loaded')
+
+    # Index budget per label (maintained per snapshot/model version) -> binary search per label
+    budgets = await aggregate_customers(BudgetAggregate(), BudgetAggregate, maintain=('budgets', None))
+    result = simulate_product_impact(await run_in_threadpool(budgets.simulate, new_product))
     
     return ProductSimulationResponse(
         hits=result['hits'],
@@ -915,255 +3153,123 @@ def simulate_product(payload: ProductSimulationRequest):
         segments=result['segments'],
         recommendation=result['recommendation'],
         total_users=result.get('total_users'),
+        addressable_spend=result['addressable_spend'],
         generated_at=datetime.now(timezone.utc).isoformat()
     )
 
 
-@app.get("/analytics/overview")
-def analytics_overview():
-    """Global analytics: behaviour trends + product effectiveness (rule-based, no AI)."""
-    if clf is None or label_encoder is None:
+@app.post("/infer/simulate-product/sweep", response_model=ProductSweepResponse)
+async def simulate_product_sweep(payload: ProductSweepRequest):
+    """
+    Demand curve: hits, revenue dan conversion untuk banyak harga / kandidat produk
+    dari satu scan base (budget per label di-sort sekali, tiap titik = binary search).
+    """
+    if payload.products:
+        products = [
+            {
+                'product_name': item.product_name,
+                'category': item.category,
+                'price': item.price,
+                'duration_days': item.duration_days or 30
+            }
+            for item in payload.products
+        ]
+    elif payload.category and payload.prices:
+        products = [
+            {
+                'product_name': payload.product_name or payload.category,
+                'category': payload.category,
+                'price': price,
+                'duration_days': payload.duration_days or 30
+            }
+            for price in payload.prices
+        ]
+    else:
+        raise HTTPException(status_code=400, detail='Provide either products or category with prices')
+    if len(products) > PRODUCT_SWEEP_MAX_POINTS:
+        raise HTTPException(status_code=400, detail=f'Max {PRODUCT_SWEEP_MAX_POINTS} points per sweep')
+    if not model_ready():
         raise HTTPException(status_code=500, detail='Model not loaded')
 
-    # 1) Ambil semua user
-    all_users = fetch_all_users_paginated()
-    if not all_users:
-        raise HTTPException(status_code=404, detail='No users found')
-
-    # 2) Siapkan DataFrame dan features (re-use logic dari simulate_product_impact)
-    df_users = pd.DataFrame(all_users)
-    numeric_features_list = [
-        'avg_data_usage_gb', 'pct_video_usage', 'avg_call_duration', 'sms_freq',
-        'monthly_spend', 'topup_freq', 'travel_score', 'complaint_count'
-    ]
-
-    X = df_users.copy()
-    for col in numeric_features_list:
-        if col in X.columns:
-            X[col] = X[col].astype(str).str.replace(',', '.')
-            X[col] = pd.to_numeric(X[col], errors='coerce').fillna(0)
-
-    if 'avg_call_duration' in X.columns:
-        X['avg_call_duration'] = X['avg_call_duration'].abs()
-    if 'monthly_spend' in X.columns:
-        X['monthly_spend'] = X['monthly_spend'].abs()
-
-    for drop_col in ('customer_id', 'target_offer', 'target_encoded'):
-        if drop_col in X.columns:
-            X = X.drop(columns=[drop_col])
+    budgets = await aggregate_customers(BudgetAggregate(), BudgetAggregate, maintain=('budgets', None))
+
+    def sweep() -> List[ProductSweepPoint]:
+        points = []
+        for product in products:
+            result = simulate_product_impact(budgets.simulate(product))
+            points.append(ProductSweepPoint(
+                product_name=product['product_name'],
+                category=product['category'],
+                price=product['price'],
+                hits=result['hits'],
+                revenue=result['revenue'],
+                conversion_rate=result['conversion_rate'],
+                segments=result['segments'],
+                recommendation=result['recommendation'],
+                addressable_spend=result['addressable_spend']
+            ))
+        return points
 
-    # 3) Prediksi label
-    all_preds_idx = clf.predict(X)
-    all_labels = label_encoder.inverse_transform(all_preds_idx)
+    return ProductSweepResponse(
+        points=await run_in_threadpool(sweep),
+        total_users=budgets.total,
+        generated_at=datetime.now(timezone.utc).isoformat()
+    )
 
-    total_users = len(df_users)
-    
-    # 3.5) Model Performance Metrics (sesuai notebook cell 9)
-    model_performance = {
-        'accuracy': None,
-        'total_classes': len(label_encoder.classes_),
-        'classes': label_encoder.classes_.tolist()
-    }
 
-    if 'target_offer' in df_users.columns:
-        from sklearn.metrics import accuracy_score
+@app.get("/analytics/overview")
+async def analytics_overview(if_none_match: Optional[str] = Header(None)):
+    """Global analytics: behaviour trends + product effectiveness (rule-based, no AI)."""
+    if not model_ready():
+        raise HTTPException(status_code=500, detail='Model not loaded')
 
-        y_raw = df_users['target_offer']
-        if y_raw.notna().any():
-            class_set = set(label_encoder.classes_)
+    entry = await analytics_response_cache.get(
+        'overview',
+        lambda: analytics_cache_key(
+            customer_data_version(), product_catalog.version if product_catalog is not None else None
+        ),
+        compute_analytics_overview,
+    )
+    return entry.response(if_none_match)
 
-            # 1) String match (trim, case-sensitive to preserve class names)
-            y_str = y_raw.astype(str).str.strip()
-            mask_valid_str = y_str.isin(class_set)
-            if mask_valid_str.any():
-                acc = accuracy_score(y_str[mask_valid_str].values, np.array(all_labels)[mask_valid_str])
-                model_performance['accuracy'] = round(acc * 100, 2)
-            else:
-                # 2) Numeric decode -> inverse label_encoder
-                y_num = pd.to_numeric(y_raw, errors='coerce')
-                mask_num = y_num.notna()
-                if mask_num.any():
-                    try:
-                        y_int = y_num[mask_num].astype(int).values
-                        y_true_decoded = label_encoder.inverse_transform(y_int)
-                        acc = accuracy_score(y_true_decoded, np.array(all_labels)[mask_num])
-                        model_performance['accuracy'] = round(acc * 100, 2)
-                    except Exception:
-                        model_performance['accuracy'] = None
-
-    # 4) Behaviour trends
-    high_data_threshold = None
-    high_data_users = 0
-    q75_usage = None
-    if 'avg_data_usage_gb' in df_users.columns:
-        q75_usage = df_users['avg_data_usage_gb'].quantile(0.75)
-        high_data_threshold = max(10.0, q75_usage)
-        high_data_users = int((df_users['avg_data_usage_gb'] >= high_data_threshold).sum())
-
-    plan_spend = {'Prepaid': 0.0, 'Postpaid': 0.0}
-    plan_counts = {'Prepaid': 0, 'Postpaid': 0}
-    if 'plan_type' in df_users.columns:
-        spend_by_plan = df_users.groupby('plan_type')['monthly_spend'].mean().to_dict()
-        plan_spend['Prepaid'] = float(spend_by_plan.get('Prepaid', 0))
-        plan_spend['Postpaid'] = float(spend_by_plan.get('Postpaid', 0))
-        counts = df_users['plan_type'].value_counts().to_dict()
-        plan_counts['Prepaid'] = int(counts.get('Prepaid', 0))
-        plan_counts['Postpaid'] = int(counts.get('Postpaid', 0))
-
-    video_voice = {
-        'video_lovers': 0,
-        'voice_lovers': 0,
-        'balanced': 0,
-        'median_call': 0.0
-    }
-    if 'pct_video_usage' in df_users.columns and 'avg_call_duration' in df_users.columns:
-        video_pct = df_users['pct_video_usage'].values
-        call_dur = df_users['avg_call_duration'].values
-        median_call = float(np.median(call_dur)) if len(call_dur) else 0.0
-        video_lovers_mask = video_pct >= 0.6
-        voice_lovers_mask = (video_pct <= 0.4) & (call_dur >= median_call)
-        balanced_mask = ~(video_lovers_mask | voice_lovers_mask)
 
-        video_voice = {
-            'video_lovers': int(video_lovers_mask.sum()),
-            'voice_lovers': int(voice_lovers_mask.sum()),
-            'balanced': int(balanced_mask.sum()),
-            'median_call': median_call
-        }
-
-    # 5) Top products - OPTIMIZED: Pre-compute & vectorized operations (sesuai notebook cell 11)
-    products_df = fetch_products()
-    all_recs = []
-    
-    print(f"   📊 Menghitung top products dari {total_users} user (optimized)...")
-    
-    # OPTIMIZATION 1: Pre-compute products per category (sekali saja, bukan per-user)
-    products_by_cat = {}
-    for cat in TARGET_TO_CATEGORY_MAP.values():
-        cat_products = products_df[products_df['category'] == cat].copy()
-        # Pre-sort by price untuk setiap kategori
-        products_by_cat[cat] = cat_products.sort_values('price', ascending=False)
-    
-    # OPTIMIZATION 2: Vectorized budget array
-    budgets = df_users['monthly_spend'].values
-    
-    # OPTIMIZATION 3: Batch processing dengan minimal pandas operations
+async def compute_analytics_overview() -> Dict[str, Any]:
+    # Semua user (chunk snapshot bersama atau stream PostgREST) + katalog produk
+    catalog = await get_product_catalog()
     start_time = time.time()
-    
-    for idx in range(total_users):
-        pred_label = all_labels[idx]
-        user_budget = budgets[idx]
-        
-        # Get primary category
-        cat_primer = TARGET_TO_CATEGORY_MAP.get(pred_label)
-        
-        if cat_primer and cat_primer in products_by_cat:
-            cat_prods = products_by_cat[cat_primer]
-            
-            # Quick filtering: hanya ambil produk dalam budget
-            affordable = cat_prods[cat_prods['price'] <= user_budget]
-            
-            if not affordable.empty:
-                # Ambil top 3 termahal dalam budget (sudah sorted descending)
-                top_recs = affordable.head(3)['product_name'].tolist()
-                all_recs.extend(top_recs)
-            else:
-                # Fallback: ambil yang termurah
-                if not cat_prods.empty:
-                    all_recs.append(cat_prods.iloc[-1]['product_name'])
-        
-        # Progress log setiap 2500 user
-        if (idx + 1) % 2500 == 0:
-            elapsed = time.time() - start_time
-            print(f"   ... processed {idx + 1}/{total_users} users ({elapsed:.1f}s)")
-    
-    elapsed_total = time.time() - start_time
-    print(f"   ✅ Completed in {elapsed_total:.2f} seconds")
-    
-    # Hitung top 10 produk yang paling sering direkomendasikan
-    product_counter = Counter(all_recs)
-    total_recs = len(all_recs)
-    top_products = []
-    for prod_name, cnt in product_counter.most_common(10):
-        top_products.append({
-            'product_name': prod_name,
-            'count': cnt,
-            'percentage': round((cnt / total_recs) * 100, 1) if total_recs else 0.0
-        })
-
-    return {
-        'total_users': total_users,
-            'model_performance': model_performance,
-        'high_data': {
-            'count': high_data_users,
-            'percentage': round((high_data_users / total_users) * 100, 1) if total_users else 0.0,
-            'threshold': high_data_threshold,
-            'q75_usage': q75_usage
-        },
-        'plan_spend': plan_spend,
-        'plan_counts': plan_counts,
-        'video_voice': video_voice,
-        'top_products': top_products,
-        'generated_at': datetime.now(timezone.utc).isoformat()
-    }
+    overview = OverviewAggregate(catalog)
+    overview = await aggregate_customers(overview, overview.empty, maintain=('overview', catalog.version))
+    if overview.total == 0:
+        raise HTTPException(status_code=404, detail='No users found')
+    print(f"   📊 Overview dari {overview.total} user selesai dalam {time.time() - start_time:.2f} seconds")
+    return overview.result()
 
 
 @app.get("/analytics/churn-composition")
-def get_churn_composition():
+async def get_churn_composition(if_none_match: Optional[str] = Header(None)):
     """
     Compute churn risk composition untuk ALL customers (10k users).
     Menghitung: Low Risk, Medium Risk, High Risk distribution.
     Output: data untuk pie chart dashboard.
     """
-    if supabase is None:
-        raise HTTPException(status_code=503, detail='Database not configured')
-    if clf is None or label_encoder is None:
+    if not model_ready():
         raise HTTPException(status_code=500, detail='Model not loaded')
 
+    entry = await analytics_response_cache.get(
+        'churn-composition', lambda: analytics_cache_key(customer_data_version(), None), compute_churn_composition
+    )
+    return entry.response(if_none_match)
+
+
+async def compute_churn_composition() -> Dict[str, Any]:
     try:
         print("⏳ Menghitung Churn Composition untuk ALL customers...")
         
-        # 1. Fetch all customers with pagination (Supabase ~1000 per batch)
-        all_users = []
-        page = 0
-        page_size = 1000
-        max_attempts = 20  # Safety limit untuk prevent infinite loop
-        attempt = 0
-        empty_batches = 0  # Counter untuk batches kosong berturut-turut
-
-        while attempt < max_attempts:
-            # Gunakan len(all_users) sebagai offset yang akurat (bukan page * page_size)
-            # Karena data mungkin tidak selalu eksak 1000 per batch
-            start_range = len(all_users)
-            end_range = len(all_users) + page_size - 1
-            
-            print(f"   📥 Fetching batch {page + 1} (rows {start_range}-{end_range})...")
-            
-            # JANGAN GUNAKAN .limit() - biarkan Supabase return sesuai range
-            res = supabase.table('customer_profile').select('*').range(start_range, end_range).execute()
-            
-            batch_size = len(res.data) if res.data else 0
-            print(f"   ✅ Got {batch_size} users | Total collected: {len(all_users) + batch_size}")
-            
-            # Tambahkan data ke list JIKA ada
-            if batch_size > 0:
-                all_users.extend(res.data)
-                empty_batches = 0  # Reset counter saat ada data
-            else:
-                empty_batches += 1
-            
-            # Jika dapat 2+ batches kosong berturut-turut, STOP (truly no more data)
-            if empty_batches >= 2:
-                print(f"   🛑 No data in {empty_batches} consecutive batches - pagination complete")
-                break
-            
-            # Selalu lanjut ke batch berikutnya
-            page += 1
-            attempt += 1
-        
-        print(f"   ✅ Pagination complete after {page} batches")
+        # 1-4. Chunk customer -> predict (cached untuk snapshot) -> churn buckets RULES-BASED (vectorized)
+        churn = await aggregate_customers(ChurnAggregate(), ChurnAggregate, maintain=('churn', None))
+        total_users = churn.total
 
-        if not all_users:
+        if total_users == 0:
             return {
                 "total_users": 0,
                 "composition": {"high": {"count": 0, "percentage": 0}, "medium": {"count": 0, "percentage": 0}, "low": {"count": 0, "percentage": 0}},
@@ -1172,67 +3278,14 @@ def get_churn_composition():
                 "generated_at": datetime.now(timezone.utc).isoformat()
             }
 
-        print(f"✅ Fetched {len(all_users)} customers")
-
-        # 2. Build features DataFrame
-        df_users = pd.DataFrame(all_users)
-        numeric_features_list = [
-            'avg_data_usage_gb', 'pct_video_usage', 'avg_call_duration', 'sms_freq',
-            'monthly_spend', 'topup_freq', 'travel_score', 'complaint_count'
-        ]
-        
-        X = df_users.copy()
-        
-        # Clean numeric columns
-        for col in numeric_features_list:
-            if col in X.columns:
-                X[col] = X[col].astype(str).str.replace(',', '.')
-                X[col] = pd.to_numeric(X[col], errors='coerce').fillna(0)
-        
-        # Fix negatives
-        if 'avg_call_duration' in X.columns:
-            X['avg_call_duration'] = X['avg_call_duration'].abs()
-        if 'monthly_spend' in X.columns:
-            X['monthly_spend'] = X['monthly_spend'].abs()
-        
-        # Drop ID and target cols
-        for drop_col in ('customer_id', 'target_offer', 'target_encoded'):
-            if drop_col in X.columns:
-                X = X.drop(columns=[drop_col])
-
-        # 3. Predict all users
-        all_preds_idx = clf.predict(X)
-        all_labels = label_encoder.inverse_transform(all_preds_idx)
-
-        # 4. Compute churn risk buckets untuk ALL users menggunakan RULES-BASED logic (sesuai notebook)
-        churn_buckets = {'high': 0, 'medium': 0, 'low': 0}
-        user_churn_data = []
-        
-        for i, label in enumerate(all_labels):
-            bucket = compute_churn_bucket(label, all_users[i], global_averages)
-            churn_buckets[bucket] += 1
-            
-            # Simpan per-user data untuk revenue at risk calculation
-            user_churn_data.append({
-                'customer_id': all_users[i].get('customer_id'),
-                'risk_level': bucket,
-                'monthly_spend': float(all_users[i].get('monthly_spend') or 0)
-            })
-
-        total_users = len(all_users)
+        churn_buckets = {bucket: int(churn.counts[code]) for code, bucket in enumerate(CHURN_BUCKETS)}
+        revenue_at_risk = churn.revenue_at_risk
         
         # 5. Calculate percentages
         churn_rate_pct = (churn_buckets['high'] / total_users * 100) if total_users > 0 else 0.0
         medium_pct = (churn_buckets['medium'] / total_users * 100) if total_users > 0 else 0.0
         low_pct = (churn_buckets['low'] / total_users * 100) if total_users > 0 else 0.0
 
-        # 6. Calculate revenue at risk (HIGH risk users only)
-        revenue_at_risk = sum(
-            item['monthly_spend']
-            for item in user_churn_data 
-            if item['risk_level'] == 'high'
-        )
-
         print(f"✅ Churn Composition Analysis Results:")
         print(f"   📊 Total Users Analyzed: {total_users}")
         print(f"   🔴 High Risk: {churn_buckets['high']} users ({churn_rate_pct:.1f}%)")
@@ -1268,6 +3321,66 @@ def get_churn_composition():
         raise HTTPException(status_code=500, detail=f'Error calculating churn composition: {str(e)}')
 
 
+@app.get("/analytics/percentiles")
+async def analytics_percentiles(q: str = '0.25,0.5,0.75,0.9', columns: Optional[str] = None):
+    """
+    Percentile kolom numeric customer (nilai bersih) dari QuantileSketch per kolom.
+
+    q: daftar quantile 0..1 dipisah koma; columns: subset NUMERIC_FEATURES (default semua).
+    rank_error per kolom: 0 = exact, selain itu batas error rank normalized KLL.
+    """
+    try:
+        quantiles = [float(value) for value in q.split(',') if value.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail='q must be comma-separated numbers between 0 and 1')
+    if not quantiles or any(not 0.0 <= value <= 1.0 for value in quantiles):
+        raise HTTPException(status_code=400, detail='q must be comma-separated numbers between 0 and 1')
+    selected = [col.strip() for col in columns.split(',') if col.strip()] if columns else list(NUMERIC_FEATURES)
+    unknown = [col for col in selected if col not in NUMERIC_FEATURES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f'Unknown columns: {unknown}')
+    if not model_ready():
+        raise HTTPException(status_code=500, detail='Model not loaded')
+
+    percentiles = await aggregate_customers(PercentileAggregate(), PercentileAggregate, maintain=('percentiles', None))
+    if percentiles.total == 0:
+        raise HTTPException(status_code=404, detail='No users found')
+    return percentiles.result(quantiles, selected)
+
+
+@app.post("/analytics/snapshot/refresh")
+async def refresh_customer_snapshot():
+    """Paksa reload snapshot customer (mis. setelah import data baru)."""
+    snap = await get_customer_snapshot(force_refresh=True)
+    return {
+        'version': snap.version,
+        'total_users': len(snap),
+        'loaded_at': datetime.fromtimestamp(snap.loaded_at, timezone.utc).isoformat()
+    }
+
+
+@app.post("/products/catalog/refresh")
+async def refresh_product_catalog():
+    """Paksa reload product catalog (mis. setelah produk ditambah/diubah)."""
+    catalog = await get_product_catalog(force_refresh=True)
+    return {
+        'version': catalog.version,
+        'total_products': len(catalog.frame),
+        'categories': {cat: len(idx) for cat, idx in catalog.by_category.items()},
+        'loaded_at': datetime.fromtimestamp(catalog.loaded_at, timezone.utc).isoformat()
+    }
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+
+@app.get("/metrics")
+def metrics():
+    """Counter operasional in-process (per worker uvicorn)."""
+    return {
+        'insight_cache': insight_cache.stats(),
+        'ollama_limiter': ollama_limiter.stats(),
+        'analytics_cache': analytics_response_cache.stats(),
+    }
@@ -0,0 +1,113 @@
+"""Limiter bersama untuk call Ollama: token bucket, batas in-flight dan antrian terbatas."""
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+class LimiterRejected(Exception):
+    """Slot limiter tidak didapat (antrian penuh atau menunggu terlalu lama)."""
+
+
+class OllamaLimiter:
+    """
+    Limiter bersama untuk semua call Ollama: token bucket (rate + burst) untuk laju
+    call baru, semaphore untuk maksimal request in-flight, dan antrian tunggu
+    terbatas. Caller ke-(max_waiting + 1) langsung ditolak (fail-fast) dan caller
+    yang menunggu lebih dari max_wait_seconds menyerah, sehingga burst tidak
+    menumpuk coroutine yang menunggu tanpa batas.
+    """
+
+    def __init__(self, rate_per_second: float, burst: int, max_in_flight: int, max_waiting: int, max_wait_seconds: float):
+        self.rate_per_second = rate_per_second
+        self.burst = max(1, burst)
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_waiting = max_waiting
+        self.max_wait_seconds = max_wait_seconds
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+        self.in_flight = 0
+        self.waiting = 0  # menunggu semaphore
+        self.waiting_for_token = 0  # sudah pegang semaphore, menunggu token rate limit
+        self.acquired = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seen = 0.0
+        self._semaphore: Optional[asyncio.Semaphore] = None  # dibuat lazily di event loop
+
+    def _take_token(self) -> float:
+        """Ambil satu token jika ada (return 0), atau return detik sampai token berikutnya."""
+        if self.rate_per_second <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate_per_second
+
+    def queue_depth(self) -> int:
+        """
+        Caller yang benar-benar antre: penunggu semaphore di luar yang sebentar lagi
+        dapat slot kosong, ditambah pemegang semaphore yang masih menunggu token.
+        """
+        free_slots = self.max_in_flight - self.in_flight - self.waiting_for_token
+        return max(0, self.waiting - free_slots) + self.waiting_for_token
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.queue_depth() >= self.max_waiting:
+            self.rejected += 1
+            raise LimiterRejected(f'antrian penuh ({self.queue_depth()} menunggu)')
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        started = time.monotonic()
+        deadline = started + self.max_wait_seconds
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise LimiterRejected(f'menunggu slot > {self.max_wait_seconds:.0f}s')
+        finally:
+            self.waiting -= 1
+
+        self.waiting_for_token += 1
+        try:
+            while (delay := self._take_token()) > 0:
+                if time.monotonic() + delay > deadline:
+                    self.timeouts += 1
+                    raise LimiterRejected(f'menunggu rate limit > {self.max_wait_seconds:.0f}s')
+                await asyncio.sleep(delay)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        finally:
+            self.waiting_for_token -= 1
+
+        waited = time.monotonic() - started
+        self.acquired += 1
+        self.total_wait_seconds += waited
+        self.max_wait_seen = max(self.max_wait_seen, waited)
+        self.in_flight += 1
+        try:
+            yield waited
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth(),
+            'waiting_for_token': self.waiting_for_token,
+            'acquired': self.acquired,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            'avg_wait_ms': 1000 * self.total_wait_seconds / self.acquired if self.acquired else 0.0,
+            'max_wait_ms': 1000 * self.max_wait_seen,
+        }
@@ -0,0 +1,88 @@
+"""Snapshot customer bersama antar worker: versi .npy di disk, CURRENT atomic dan lock refresh."""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+
+class SharedSnapshotStore:
+    """
+    Snapshot customer bersama untuk semua worker di satu host.
+
+    <root>/<version>/ berisi kolom .npy (ditulis ke directory sementara lalu rename),
+    <root>/CURRENT menunjuk versi aktif + loaded_at dan di-swap atomic dengan os.replace.
+    Refresh dari database dijaga lock file O_EXCL sehingga hanya satu worker per host
+    yang men-download; worker lain menunggu CURRENT berganti lalu me-mmap versi baru.
+    Lock yang lebih tua dari lock_timeout detik dianggap basi (pemegangnya mati).
+    """
+
+    CURRENT = 'CURRENT'
+    LOCK = '.refresh.lock'
+
+    def __init__(self, root: Path, lock_timeout: float):
+        self.root = root
+        self.lock_timeout = lock_timeout
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def current(self) -> Optional[Tuple[str, float]]:
+        """(version, loaded_at) snapshot aktif, None jika belum ada."""
+        try:
+            data = json.loads((self.root / self.CURRENT).read_text(encoding='utf-8'))
+            return str(data['version']), float(data['loaded_at'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def path(self, version: str) -> Path:
+        """Directory kolom .npy untuk versi ini (dibaca dengan CustomerSnapshot.load)."""
+        return self.root / version
+
+    def publish(self, snap: Any) -> None:
+        """
+        Tulis snapshot (jika versi ini belum ada di disk) lalu swap CURRENT. snap cukup
+        punya version, loaded_at dan save(path), seperti CustomerSnapshot.
+        """
+        path = self.path(snap.version)
+        if not path.is_dir():
+            tmp_path = self.root / f'.{snap.version}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp'
+            try:
+                snap.save(tmp_path)
+                os.rename(tmp_path, path)
+            except OSError:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                if not path.is_dir():
+                    raise
+        tmp_current = self.root / f'.{self.CURRENT}.{os.getpid()}.tmp'
+        tmp_current.write_text(json.dumps({'version': snap.version, 'loaded_at': snap.loaded_at}), encoding='utf-8')
+        os.replace(tmp_current, self.root / self.CURRENT)
+        # Versi lama: worker yang masih me-mmap tetap bisa membaca sampai pindah ke versi baru (POSIX)
+        for old in self.root.iterdir():
+            if old.is_dir() and old != path and not old.name.startswith('.'):
+                shutil.rmtree(old, ignore_errors=True)
+
+    def try_lock(self) -> bool:
+        lock_path = self.root / self.LOCK
+        for _ in range(2):
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    stale = time.time() - lock_path.stat().st_mtime > self.lock_timeout
+                except FileNotFoundError:
+                    continue  # baru dilepas, coba lagi
+                if not stale:
+                    return False
+                print(f"⚠️ Removing stale snapshot lock {lock_path}")
+                lock_path.unlink(missing_ok=True)
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(str(os.getpid()))
+            return True
+        return False
+
+    def unlock(self) -> None:
+        (self.root / self.LOCK).unlink(missing_ok=True)
@@ -0,0 +1,108 @@
+"""/infer/analytic/batch (analyze_customer_batch) harus sama dengan /infer/analytic per customer."""
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import LabelEncoder, OneHotEncoder
+
+import main
+
+GLOBAL_AVERAGES = {
+    'avg_data_usage_gb': 12.0,
+    'avg_call_duration': 15.0,
+    'pct_video_usage': 0.4,
+    'sms_freq': 18.0,
+    'topup_freq': 3.5,
+}
+PLANS = ['Prepaid', 'Postpaid']
+BRANDS = ['Samsung', 'Apple', 'Xiaomi']
+CATEGORIES = ['Data', 'Voice', 'VOD', 'SMS', 'Combo', 'Roaming', 'DeviceBundle', 'Retention Offer']
+# nilai mentah yang dibersihkan FeatureEncoder / _clean_numeric_column
+DIRTY_SPEND = [-150000, '150000,5', None, 'abc', float('nan'), '-20000', 0, 1000000]
+
+
+def make_records(rng: np.random.Generator, n: int) -> List[Dict[str, Any]]:
+    records = []
+    for i in range(n):
+        record: Dict[str, Any] = {
+            'customer_id': f"C{i:04d}",
+            'plan_type': PLANS[int(rng.integers(len(PLANS)))],
+            'device_brand': BRANDS[int(rng.integers(len(BRANDS)))],
+        }
+        for col in main.NUMERIC_FEATURES:
+            record[col] = float(rng.gamma(2.0, 10.0))
+        record['monthly_spend'] = float(rng.choice([8000, 20000, 50000, 150000, 500000]))
+        if i % 3 == 0:
+            record['monthly_spend'] = DIRTY_SPEND[(i // 3) % len(DIRTY_SPEND)]
+        if i % 5 == 0:
+            record['avg_call_duration'] = -record['avg_call_duration']
+        if i % 7 == 0:
+            record['sms_freq'] = f"{record['sms_freq']:.1f}".replace('.', ',')
+        records.append(record)
+    return records
+
+
+@pytest.fixture
+def artifacts(monkeypatch):
+    rng = np.random.default_rng(0)
+    train = pd.DataFrame(
+        main.feature_encoder.batch(
+            {col: [r[col] for r in make_records(rng, 400)] for col in main.MODEL_FEATURE_COLUMNS}, 400
+        ),
+        columns=main.MODEL_FEATURE_COLUMNS,
+    )
+    encoder = LabelEncoder().fit(list(main.TARGET_TO_CATEGORY_MAP))
+    y = (train['avg_data_usage_gb'] // 6 + train['device_brand'].map(BRANDS.index)).astype(int) % len(encoder.classes_)
+    model = Pipeline([
+        ('preprocess', ColumnTransformer([
+            ('cat', OneHotEncoder(handle_unknown='ignore'), main.CATEGORICAL_FEATURES),
+            ('num', 'passthrough', main.NUMERIC_FEATURES),
+        ])),
+        ('model', RandomForestClassifier(n_estimators=8, max_depth=6, random_state=0)),
+    ]).fit(train, y)
+
+    monkeypatch.setattr(main, 'clf', model)
+    monkeypatch.setattr(main, 'compiled_model', main.compile_model(model))
+    monkeypatch.setattr(main, 'label_encoder', encoder)
+    monkeypatch.setattr(main, 'global_averages', GLOBAL_AVERAGES)
+
+
+def make_catalog(rng: np.random.Generator, n: int = 160) -> main.ProductCatalog:
+    return main.ProductCatalog(pd.DataFrame({
+        'product_id': [f"P{i:04d}" for i in range(n)],
+        'product_name': [f"Produk {i}" for i in range(n)],
+        'category': rng.choice(CATEGORIES, size=n),
+        'price': rng.permutation(np.arange(1, n + 1) * 2500.0),
+        'duration_days': rng.choice([1, 7, 30], size=n),
+    }))
+
+
+def test_batch_matches_single_customer(artifacts):
+    rng = np.random.default_rng(1)
+    records = make_records(rng, 120)
+    catalog = make_catalog(rng)
+    ids = [r['customer_id'] for r in records] + ['missing']
+
+    response = main.analyze_customer_batch(ids, records, catalog, 5)
+    assert response.failed == 1 and response.results[-1].error == 'Customer not found'
+
+    for record, item in zip(records, response.results):
+        pred_label, churn_label, items = main.analyze_customer(record, catalog, 5)
+        assert item.error is None
+        assert item.churn.raw_label == pred_label
+        assert item.churn.label == churn_label
+        assert item.user_category == main.TARGET_TO_CATEGORY_MAP.get(pred_label, "Unknown")
+        assert item.recommendations['items'] == [rec.model_dump() for rec in items], record
+
+
+def test_dirty_spend_is_cleaned(artifacts):
+    catalog = make_catalog(np.random.default_rng(2))
+    base = make_records(np.random.default_rng(3), 1)[0]
+    clean = main.analyze_customer({**base, 'monthly_spend': 150000.0}, catalog, 3)
+    # -150000 dan '150000,0' sama dengan 150000 (abs, comma decimal), bukan [] / ValueError
+    assert main.analyze_customer({**base, 'monthly_spend': -150000}, catalog, 3) == clean
+    assert main.analyze_customer({**base, 'monthly_spend': '150000,0'}, catalog, 3) == clean
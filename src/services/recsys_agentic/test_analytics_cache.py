@@ -0,0 +1,64 @@
+"""AnalyticsResponseCache: fresh hit, stale-while-revalidate dan key berubah (miss)."""
+import asyncio
+import json
+from typing import Any, Dict, List
+
+import main
+
+
+class Source:
+    """compute() palsu: hasil = versi data saat compute dipanggil."""
+
+    def __init__(self) -> None:
+        self.version = 'v1'
+        self.calls: List[str] = []
+
+    def key(self):
+        return ('model', self.version, None)
+
+    async def compute(self) -> Dict[str, Any]:
+        self.calls.append(self.version)
+        await asyncio.sleep(0.01)
+        return {'version': self.version}
+
+
+def body(entry: main.CachedResponse) -> Dict[str, Any]:
+    return json.loads(entry.body)
+
+
+def test_key_change_is_a_miss():
+    async def scenario():
+        cache = main.AnalyticsResponseCache(ttl=60.0)
+        source = Source()
+        first = await cache.get('overview', source.key, source.compute)
+        assert body(first) == {'version': 'v1'}
+        assert await cache.get('overview', source.key, source.compute) is first
+
+        # model reload / snapshot baru: jangan layani entry lama (atau 304 dengan ETag lama)
+        source.version = 'v2'
+        second = await cache.get('overview', source.key, source.compute)
+        assert body(second) == {'version': 'v2'}
+        assert second.etag != first.etag
+        assert not second.matches(first.etag)
+        assert source.calls == ['v1', 'v2']
+        assert (cache.hits, cache.stale, cache.misses) == (1, 0, 2)
+
+    asyncio.run(scenario())
+
+
+def test_expired_entry_with_same_key_is_served_stale():
+    async def scenario():
+        cache = main.AnalyticsResponseCache(ttl=60.0)
+        source = Source()
+        first = await cache.get('overview', source.key, source.compute)
+        first.created_at -= 120.0  # lewat TTL, key sama
+
+        stale = await asyncio.gather(*(cache.get('overview', source.key, source.compute) for _ in range(5)))
+        assert all(entry is first for entry in stale)
+        await cache.tasks['overview']
+        assert source.calls == ['v1', 'v1']  # satu refresh untuk lima request
+        refreshed = await cache.get('overview', source.key, source.compute)
+        assert refreshed is not first and refreshed.etag == first.etag
+        assert (cache.hits, cache.stale, cache.misses) == (1, 5, 1)
+
+    asyncio.run(scenario())
@@ -0,0 +1,80 @@
+"""Parity compute_churn_buckets (array) vs compute_churn_bucket (per row)."""
+import numpy as np
+import pytest
+
+import main
+
+AVGS = {
+    'avg_data_usage_gb': 12.0,
+    'avg_call_duration': 15.0,
+    'sms_freq': 18.0,
+    'topup_freq': 3.5,
+}
+LABELS = np.array(list(main.TARGET_TO_CATEGORY_MAP), dtype=object)
+
+
+def make_columns(rng: np.random.Generator, n: int, avgs: dict) -> dict:
+    """Nilai tepat di rata-rata, +-1, nol dan NaN supaya semua cabang rules terpakai."""
+    cols = {}
+    for col in ('avg_data_usage_gb', 'avg_call_duration', 'sms_freq', 'topup_freq'):
+        avg = avgs.get(col, 0.0)
+        cols[col] = rng.choice([avg, avg - 1, avg + 1, 0.0, np.nan], size=n)
+    cols['complaint_count'] = rng.choice([0.0, 1.0, 2.0, np.nan], size=n)
+    cols['monthly_spend'] = rng.uniform(0, 1e5, size=n)
+    return cols
+
+
+def assert_parity(labels: np.ndarray, cols: dict, avgs: dict) -> None:
+    codes, revenue_at_risk = main.compute_churn_buckets(labels, cols, avgs)
+    expected = [
+        main.compute_churn_bucket(labels[i], {k: v[i] for k, v in cols.items()}, avgs)
+        for i in range(len(labels))
+    ]
+    got = [main.CHURN_BUCKETS[c] for c in codes]
+    mismatch = [i for i, (a, b) in enumerate(zip(got, expected)) if a != b]
+    assert not mismatch, f"{len(mismatch)} rows differ, first {mismatch[:5]}"
+
+    high = np.array([b == 'high' for b in expected])
+    assert revenue_at_risk == pytest.approx(float(cols['monthly_spend'][high].sum()))
+
+
+@pytest.mark.parametrize('avgs', [
+    AVGS,
+    {k: 0.0 for k in AVGS},                               # rata-rata nol
+    {},                                                   # global_averages kosong
+    {'avg_data_usage_gb': 12.0, 'topup_freq': 3.5},       # sebagian key hilang
+], ids=['averages', 'zero', 'missing', 'partial'])
+def test_buckets_match_scalar_rules(avgs):
+    rng = np.random.default_rng(3)
+    n = 5000
+    assert_parity(rng.choice(LABELS, size=n), make_columns(rng, n, avgs), avgs)
+
+
+def test_values_equal_to_averages():
+    # >= rata-rata dihitung "above", < rata-rata "below"
+    n = len(LABELS)
+    cols = {k: np.full(n, v) for k, v in AVGS.items()}
+    cols['complaint_count'] = np.zeros(n)
+    cols['monthly_spend'] = np.ones(n)
+    assert_parity(LABELS, cols, AVGS)
+
+    cols['complaint_count'] = np.ones(n)
+    assert_parity(LABELS, cols, AVGS)
+
+
+def test_all_nan_row():
+    cols = {k: np.full(2, np.nan) for k in (*AVGS, 'complaint_count')}
+    cols['monthly_spend'] = np.array([10.0, 20.0])
+    labels = np.array(['Retention Offer', 'Data Booster'], dtype=object)
+    assert_parity(labels, cols, AVGS)
+
+    codes, revenue_at_risk = main.compute_churn_buckets(labels, cols, AVGS)
+    assert [main.CHURN_BUCKETS[c] for c in codes] == ['high', 'medium']
+    assert revenue_at_risk == 10.0
+
+
+def test_empty_population():
+    cols = {k: np.empty(0) for k in (*AVGS, 'complaint_count', 'monthly_spend')}
+    codes, revenue_at_risk = main.compute_churn_buckets(np.empty(0, dtype=object), cols, AVGS)
+    assert len(codes) == 0
+    assert revenue_at_risk == 0.0
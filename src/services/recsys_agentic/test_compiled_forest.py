@@ -0,0 +1,165 @@
+"""Parity CompiledForest vs clf.predict pada pipeline kecil yang di-fit di sini."""
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+import pytest
+import sklearn
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder
+
+import main
+from compiled_forest import CompiledForest, UnsupportedModel, compile_model
+
+PLANS = ['Prepaid', 'Postpaid']
+BRANDS = ['Samsung', 'Apple', 'Xiaomi', 'Oppo']
+N_CLASSES = len(main.TARGET_TO_CATEGORY_MAP)
+SKLEARN_NAN_SUPPORT = tuple(int(p) for p in sklearn.__version__.split('.')[:2]) >= (1, 4)
+
+
+def make_frame(rng: np.random.Generator, n: int, plans: List[Any], brands: List[Any], nan_fraction: float = 0.0) -> pd.DataFrame:
+    data: Dict[str, Any] = {
+        'plan_type': np.asarray(plans, dtype=object)[rng.integers(0, len(plans), n)],
+        'device_brand': np.asarray(brands, dtype=object)[rng.integers(0, len(brands), n)],
+    }
+    for col in main.NUMERIC_FEATURES:
+        values = rng.gamma(2.0, 10.0, n).round(1)
+        values[rng.random(n) < nan_fraction] = np.nan
+        data[col] = values
+    return pd.DataFrame(data, columns=main.MODEL_FEATURE_COLUMNS)
+
+
+def fit_pipeline(handle_unknown: str = 'ignore', train_nan: bool = False) -> Pipeline:
+    rng = np.random.default_rng(7)
+    X = make_frame(rng, 600, PLANS, BRANDS, nan_fraction=0.1 if train_nan else 0.0)
+    # target sudah di-encode LabelEncoder seperti model produksi (classes_ int)
+    y = (X['avg_data_usage_gb'].fillna(0) // 8 + X['device_brand'].map(BRANDS.index)).astype(int) % N_CLASSES
+    ordinal = (
+        OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1)
+        if handle_unknown == 'ignore' else OrdinalEncoder()
+    )
+    preprocessor = ColumnTransformer([
+        ('plan', OneHotEncoder(handle_unknown=handle_unknown), ['plan_type']),
+        ('brand', ordinal, ['device_brand']),
+        ('num', 'passthrough', main.NUMERIC_FEATURES),
+    ])
+    model = Pipeline([
+        ('preprocess', preprocessor),
+        ('model', RandomForestClassifier(n_estimators=12, max_depth=9, random_state=0)),
+    ])
+    return model.fit(X, y)
+
+
+@pytest.fixture(scope='module')
+def fitted():
+    model = fit_pipeline()
+    return model, compile_model(model)
+
+
+@pytest.fixture
+def use_engine(monkeypatch, fitted):
+    model, engine = fitted
+    monkeypatch.setattr(main, 'clf', model)
+    monkeypatch.setattr(main, 'compiled_model', engine)
+    return model, engine
+
+
+def test_batch_matches_clf_predict(fitted):
+    model, engine = fitted
+    rng = np.random.default_rng(1)
+    # kecil -> traversal vektor, besar -> tree_.apply
+    for n in (1, 17, engine.TRAVERSAL_MAX_ROWS + 1, 3000):
+        X = make_frame(rng, n, PLANS, BRANDS)
+        np.testing.assert_array_equal(engine.predict_encoded(engine.encode(X)), model.predict(X))
+
+
+def test_unknown_categories(fitted):
+    model, engine = fitted
+    X = make_frame(np.random.default_rng(2), 400, PLANS + ['Hybrid', None], BRANDS + ['Nokia', None])
+    np.testing.assert_array_equal(engine.predict_encoded(engine.encode(X)), model.predict(X))
+    np.testing.assert_array_equal(engine.predict_encoded(engine.encode(X[:5])), model.predict(X[:5]))
+
+
+def test_unknown_category_raises_like_clf():
+    model = fit_pipeline(handle_unknown='error')
+    engine = compile_model(model)
+    X = make_frame(np.random.default_rng(3), 3, PLANS, BRANDS)
+    X.loc[1, 'device_brand'] = 'Nokia'
+    with pytest.raises(ValueError):
+        model.predict(X)
+    with pytest.raises(ValueError, match='unknown categories'):
+        engine.encode(X)
+    with pytest.raises(ValueError, match='unknown categories'):
+        engine.encode_row(X.iloc[1].to_dict())
+
+
+def test_forest_fitted_without_feature_names():
+    rng = np.random.default_rng(7)
+    X = make_frame(rng, 300, PLANS, BRANDS)[main.NUMERIC_FEATURES].to_numpy()
+    y = (X[:, 0] // 8).astype(int) % N_CLASSES
+    forest = RandomForestClassifier(n_estimators=6, max_depth=6, random_state=0).fit(X, y)
+    with pytest.raises(UnsupportedModel, match='kolom input'):
+        compile_model(forest)
+
+    engine = compile_model(forest, main.NUMERIC_FEATURES)
+    features = dict(zip(main.NUMERIC_FEATURES, X[:50].T))
+    np.testing.assert_array_equal(engine.predict_encoded(engine.encode_columns(features, 50)), forest.predict(X[:50]))
+
+
+@pytest.mark.skipif(not SKLEARN_NAN_SUPPORT, reason='RandomForest < 1.4 menolak NaN')
+@pytest.mark.parametrize('train_nan', [False, True], ids=['no-nan-in-train', 'nan-in-train'])
+def test_nan_numeric(train_nan):
+    model = fit_pipeline(train_nan=train_nan)
+    engine = compile_model(model)
+    X = make_frame(np.random.default_rng(4), 1000, PLANS, BRANDS, nan_fraction=0.2)
+    np.testing.assert_array_equal(engine.predict_encoded(engine.encode(X)), model.predict(X))
+    for i in range(20):
+        row = X.iloc[[i]]
+        assert engine.predict_encoded(engine.encode_row(row.iloc[0].to_dict()))[0] == model.predict(row)[0]
+
+
+def test_single_row_matches_batch(use_engine):
+    model, engine = use_engine
+    rng = np.random.default_rng(5)
+    raw = make_frame(rng, 300, PLANS + ['Hybrid'], BRANDS + ['Nokia'])
+    features = main.feature_encoder.batch({col: raw[col].to_numpy() for col in raw.columns}, len(raw))
+
+    batch = main.model_predict_columns(features, len(raw))
+    np.testing.assert_array_equal(batch, model.predict(pd.DataFrame(features, columns=main.MODEL_FEATURE_COLUMNS)))
+    for i, record in enumerate(raw.to_dict('records')):
+        assert main.model_predict_row(main.feature_encoder.row(record)) == batch[i]
+
+
+@pytest.mark.skipif(SKLEARN_NAN_SUPPORT, reason='RandomForest >= 1.4 merutekan NaN')
+def test_nan_rejected_like_clf(fitted):
+    model, engine = fitted
+    assert not engine.allow_nan
+    X = make_frame(np.random.default_rng(4), 20, PLANS, BRANDS)
+    X.loc[3, 'monthly_spend'] = np.nan
+    with pytest.raises(ValueError, match='contains NaN'):
+        model.predict(X)
+    with pytest.raises(ValueError, match='contains NaN'):
+        engine.predict_encoded(engine.encode(X))
+    with pytest.raises(ValueError, match='contains NaN'):
+        engine.predict_encoded(engine.encode_row(X.iloc[3].to_dict()))
+    # juga di jalur tree_.apply (batch besar)
+    big = make_frame(np.random.default_rng(4), engine.TRAVERSAL_MAX_ROWS + 1, PLANS, BRANDS)
+    big.loc[7, 'monthly_spend'] = np.nan
+    with pytest.raises(ValueError, match='contains NaN'):
+        engine.predict_encoded(engine.encode(big))
+
+
+def test_memory_mapped_engine(tmp_path, fitted):
+    model, engine = fitted
+    engine.save(tmp_path / 'engine', 'v-test')
+    mapped = CompiledForest.load(tmp_path / 'engine', 'v-test')
+    assert mapped.trees is None
+    assert mapped.allow_nan == engine.allow_nan
+
+    X = make_frame(np.random.default_rng(6), 2000, PLANS + ['Hybrid'], BRANDS)
+    expected = model.predict(X)
+    # tanpa tree_ sklearn: traversal (N kecil) dan compacted traversal (N besar)
+    np.testing.assert_array_equal(mapped.predict_encoded(mapped.encode(X)), expected)
+    np.testing.assert_array_equal(mapped.predict_encoded(mapped.encode(X[:40])), expected[:40])
@@ -0,0 +1,185 @@
+"""Agregat dashboard yang di-maintain lewat change log vs rebuild penuh dari snapshot."""
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import LabelEncoder, OneHotEncoder
+
+import main
+
+GLOBAL_AVERAGES = {
+    'avg_data_usage_gb': 12.0,
+    'avg_call_duration': 15.0,
+    'pct_video_usage': 0.4,
+    'sms_freq': 18.0,
+    'topup_freq': 3.5,
+}
+PLANS = ['Prepaid', 'Postpaid']
+BRANDS = ['Samsung', 'Apple', 'Xiaomi']
+CATEGORIES = ['Data', 'Voice', 'VOD', 'SMS', 'Combo', 'Roaming', 'DeviceBundle', 'Retention Offer']
+QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+
+def make_record(rng: np.random.Generator, customer_id: str, labels: List[str]) -> Dict[str, Any]:
+    record: Dict[str, Any] = {
+        'customer_id': customer_id,
+        'plan_type': PLANS[int(rng.integers(len(PLANS)))],
+        'device_brand': BRANDS[int(rng.integers(len(BRANDS)))],
+        'target_offer': str(labels[int(rng.integers(len(labels)))]),
+    }
+    for col in main.NUMERIC_FEATURES:
+        record[col] = round(float(rng.gamma(2.0, 10.0)), 1)
+    record['pct_video_usage'] = float(rng.uniform(0, 1))
+    record['monthly_spend'] = float(rng.choice([8000, 20000, 50000, 150000, 500000]))
+    return record
+
+
+@pytest.fixture
+def artifacts(monkeypatch, tmp_path):
+    rng = np.random.default_rng(0)
+    encoder = LabelEncoder().fit(list(main.TARGET_TO_CATEGORY_MAP))
+    train = pd.DataFrame(
+        [make_record(rng, f"T{i}", list(encoder.classes_)) for i in range(400)], columns=main.MODEL_FEATURE_COLUMNS
+    )
+    y = (train['avg_data_usage_gb'] // 6 + train['device_brand'].map(BRANDS.index)).astype(int) % len(encoder.classes_)
+    model = Pipeline([
+        ('preprocess', ColumnTransformer([
+            ('cat', OneHotEncoder(handle_unknown='ignore'), main.CATEGORICAL_FEATURES),
+            ('num', 'passthrough', main.NUMERIC_FEATURES),
+        ])),
+        ('model', RandomForestClassifier(n_estimators=8, max_depth=6, random_state=0)),
+    ]).fit(train, y)
+
+    monkeypatch.setattr(main, 'MODEL_DIR', tmp_path)  # tanpa pkl: reload_model_if_changed tidak load apa-apa
+    monkeypatch.setattr(main, 'clf', model)
+    monkeypatch.setattr(main, 'compiled_model', main.compile_model(model))
+    monkeypatch.setattr(main, 'label_encoder', encoder)
+    monkeypatch.setattr(main, 'model_version', 'test-model')
+    monkeypatch.setattr(main, 'global_averages', GLOBAL_AVERAGES)
+    monkeypatch.setattr(main, '_prediction_cache', {})
+    monkeypatch.setattr(main, '_maintained_aggregates', {})
+    return list(encoder.classes_)
+
+
+def make_catalog(rng: np.random.Generator, n: int = 120) -> main.ProductCatalog:
+    return main.ProductCatalog(pd.DataFrame({
+        'product_id': [f"P{i:04d}" for i in range(n)],
+        'product_name': [f"Produk {i}" for i in range(n)],
+        'category': rng.choice(CATEGORIES, size=n),
+        'price': rng.permutation(np.arange(1, n + 1) * 2500.0),
+        'duration_days': rng.choice([1, 7, 30], size=n),
+    }))
+
+
+def overview_result(aggregate: main.OverviewAggregate) -> Dict[str, Any]:
+    result = aggregate.result()
+    del result['generated_at']
+    # tie-break most_common boleh beda setelah delta (lihat OverviewAggregate.merge): bandingkan count saja
+    result['top_products'] = sorted((p['product_name'], p['count']) for p in result['top_products'])
+    return result
+
+
+def assert_results_equal(maintained: Dict[str, Any], rebuilt: Dict[str, Any]) -> None:
+    assert maintained.keys() == rebuilt.keys()
+    for key, value in rebuilt.items():
+        if isinstance(value, dict):
+            assert_results_equal(maintained[key], value)
+        elif isinstance(value, float):
+            assert maintained[key] == pytest.approx(value, rel=1e-12, abs=1e-6), key
+        else:
+            assert maintained[key] == value, key
+
+
+def test_change_log_matches_full_rebuild(monkeypatch, artifacts):
+    labels = artifacts
+    rng = np.random.default_rng(1)
+    catalog = make_catalog(rng)
+    ids = [f"C{i:05d}" for i in range(600)]
+    snap = main.CustomerSnapshot.from_records([make_record(rng, cid, labels) for cid in ids])
+    monkeypatch.setattr(main, 'customer_snapshot', snap)
+
+    builders = {
+        'churn': main.ChurnAggregate,
+        'overview': lambda: main.OverviewAggregate(catalog),
+        'percentiles': main.PercentileAggregate,
+    }
+    for name, make in builders.items():
+        main.maintained_aggregate(snap, name, 'v1', make())
+
+    # Change log sintetis: update, insert dan delete dalam beberapa batch
+    next_id = len(ids)
+    for change_id in range(1, 6):
+        live = list(main.customer_snapshot.customer_id)
+        updated = list(rng.choice(live, size=25, replace=False))
+        deleted = [cid for cid in rng.choice(live, size=8, replace=False) if cid not in updated]
+        inserted = [f"C{next_id + i:05d}" for i in range(12)]
+        next_id += len(inserted)
+        records = [make_record(rng, cid, labels) for cid in updated + inserted]
+        changed = np.asarray(updated + deleted + inserted, dtype=str)
+        new_snap = main.apply_snapshot_delta(main.customer_snapshot, records, changed, change_id)
+        monkeypatch.setattr(main, 'customer_snapshot', new_snap)
+
+    snap = main.customer_snapshot
+    assert len(snap) == len(set(snap.customer_id))
+    maintained = {name: main._maintained_aggregates[name] for name in builders}
+    for name, (key, _) in maintained.items():
+        assert key == ('test-model', snap.version, 'v1'), name
+
+    # Prediksi yang di-patch sama dengan prediksi ulang seluruh snapshot
+    patched_idx, patched_labels = main.predict_snapshot(snap)
+    main._prediction_cache.clear()
+    full_idx, full_labels = main.predict_snapshot(snap)
+    np.testing.assert_array_equal(patched_idx, full_idx)
+    np.testing.assert_array_equal(patched_labels, full_labels)
+
+    rebuilt = {name: main.aggregate_snapshot(snap, make(), make) for name, make in builders.items()}
+
+    churn, churn_full = maintained['churn'][1], rebuilt['churn']
+    assert churn.total == churn_full.total == len(snap)
+    np.testing.assert_array_equal(churn.counts, churn_full.counts)
+    assert churn.revenue_at_risk == pytest.approx(churn_full.revenue_at_risk, rel=1e-12)
+
+    assert_results_equal(overview_result(maintained['overview'][1]), overview_result(rebuilt['overview']))
+    assert dict(maintained['overview'][1].product_counter) == dict(rebuilt['overview'].product_counter)
+
+    columns = list(main.NUMERIC_FEATURES)
+    assert_results_equal(
+        {k: v for k, v in maintained['percentiles'][1].result(QUANTILES, columns).items() if k != 'generated_at'},
+        {k: v for k, v in rebuilt['percentiles'].result(QUANTILES, columns).items() if k != 'generated_at'},
+    )
+
+
+def test_delta_apply_then_retract_restores_aggregate(artifacts):
+    labels = artifacts
+    rng = np.random.default_rng(2)
+    catalog = make_catalog(rng)
+    base = main.CustomerSnapshot.from_records([make_record(rng, f"B{i}", labels) for i in range(300)])
+    delta = main.CustomerSnapshot.from_records([make_record(rng, f"D{i}", labels) for i in range(40)])
+    base_labels, delta_labels = main.predict_labels(base), main.predict_labels(delta)
+
+    for make in (main.ChurnAggregate, lambda: main.OverviewAggregate(catalog), main.PercentileAggregate):
+        reference = make()
+        reference.add(base, base_labels)
+        aggregate = make()
+        aggregate.add(base, base_labels)
+        part = make()
+        part.add(delta, delta_labels)
+        aggregate.merge(part)
+        aggregate.merge(part, -1)
+
+        if isinstance(reference, main.ChurnAggregate):
+            assert aggregate.total == reference.total
+            np.testing.assert_array_equal(aggregate.counts, reference.counts)
+            assert aggregate.revenue_at_risk == pytest.approx(reference.revenue_at_risk, rel=1e-12)
+        elif isinstance(reference, main.OverviewAggregate):
+            assert_results_equal(overview_result(aggregate), overview_result(reference))
+        else:
+            columns = list(main.NUMERIC_FEATURES)
+            got = aggregate.result(QUANTILES, columns)
+            expected = reference.result(QUANTILES, columns)
+            assert got['percentiles'] == expected['percentiles']
+            assert got['total_users'] == expected['total_users']
@@ -0,0 +1,107 @@
+"""_stream_ollama / cached_llm_call terhadap server streaming palsu (NDJSON lokal dan SSE OpenAI)."""
+import asyncio
+import json
+from typing import List
+
+import httpx
+import pytest
+
+import main
+from insight_cache import InsightCache
+from ollama_limiter import OllamaLimiter
+
+
+def ndjson(*parts: str, done: bool = True) -> List[bytes]:
+    lines = [json.dumps({'response': part, 'done': False}) + '\n' for part in parts]
+    if done:
+        lines.append(json.dumps({'response': '', 'done': True}) + '\n')
+    return [line.encode() for line in lines]
+
+
+def openai_sse(*parts: str, done: bool = True) -> List[bytes]:
+    events = [
+        'data: ' + json.dumps({'choices': [{'delta': {'content': part}, 'finish_reason': None}]}) + '\n\n'
+        for part in parts
+    ]
+    if done:
+        events.append('data: [DONE]\n\n')
+    return [event.encode() for event in events]
+
+
+async def serve_once(chunks: List[bytes], complete: bool) -> asyncio.AbstractServer:
+    """
+    Server HTTP/1.1 minimal: kirim `chunks` sebagai chunked body lalu tutup koneksi.
+    complete=False: koneksi diputus tanpa chunk terakhir (body terpotong).
+    """
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        head = await reader.readuntil(b'\r\n\r\n')
+        length = next(
+            (int(line.split(b':', 1)[1]) for line in head.split(b'\r\n') if line.lower().startswith(b'content-length:')),
+            0,
+        )
+        await reader.readexactly(length)
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n')
+        for chunk in chunks:
+            writer.write(f'{len(chunk):x}\r\n'.encode() + chunk + b'\r\n')
+            await writer.drain()
+        if complete:
+            writer.write(b'0\r\n\r\n')
+        await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(handle, '127.0.0.1', 0)
+
+
+def run_stream(monkeypatch, chunks: List[bytes], cloud: bool, complete: bool = True, key: str = 'k'):
+    """cached_llm_call sekali lewat server palsu; return (teks, delta yang diterima, isi cache)."""
+    async def scenario():
+        server = await serve_once(chunks, complete)
+        port = server.sockets[0].getsockname()[1]
+        base_url = f"http://127.0.0.1:{port}" + ('/api' if cloud else '')
+        monkeypatch.setattr(main, 'OLLAMA_BASE_URL', base_url)
+        monkeypatch.setattr(main, 'OLLAMA_API_KEY', 'secret' if cloud else '')
+        deltas: List[str] = []
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            monkeypatch.setattr(main, 'ollama_http', client)
+            text = await main.cached_llm_call(key, 'prompt', deltas.append)
+        server.close()
+        await server.wait_closed()
+        return text, deltas, main.insight_cache.peek(key)
+
+    return asyncio.run(scenario())
+
+
+@pytest.fixture(autouse=True)
+def llm(monkeypatch):
+    monkeypatch.setattr(main, 'OLLAMA_MODEL', 'test-model')
+    monkeypatch.setattr(main, 'insight_cache', InsightCache(100, 3600.0))
+    monkeypatch.setattr(main, 'ollama_limiter', OllamaLimiter(100.0, 10, 4, 10, 5.0))
+
+
+@pytest.mark.parametrize('cloud', [False, True], ids=['ndjson', 'openai-sse'])
+def test_complete_stream_is_cached(monkeypatch, cloud):
+    chunks = (openai_sse if cloud else ndjson)('Halo ', 'dunia')
+    text, deltas, cached = run_stream(monkeypatch, chunks, cloud)
+    assert text == 'Halo dunia'
+    assert deltas == ['Halo ', 'dunia']
+    assert cached == 'Halo dunia'
+
+
+@pytest.mark.parametrize('cloud', [False, True], ids=['ndjson', 'openai-sse'])
+def test_stream_closed_before_done_is_not_cached(monkeypatch, cloud):
+    # body lengkap (chunk terakhir terkirim) tapi tanpa done / [DONE]
+    chunks = (openai_sse if cloud else ndjson)('Halo ', 'dun', done=False)
+    text, deltas, cached = run_stream(monkeypatch, chunks, cloud)
+    assert deltas == ['Halo ', 'dun']
+    assert main.is_llm_error(text) and text.startswith('AI tidak tersedia')
+    assert cached is None
+
+
+@pytest.mark.parametrize('cloud', [False, True], ids=['ndjson', 'openai-sse'])
+def test_dropped_connection_is_not_cached(monkeypatch, cloud):
+    # koneksi putus di tengah body (tanpa chunk terakhir) setelah beberapa token
+    chunks = (openai_sse if cloud else ndjson)('Halo ', 'dun', done=False)
+    text, deltas, cached = run_stream(monkeypatch, chunks, cloud, complete=False)
+    assert deltas == ['Halo ', 'dun']
+    assert main.is_llm_error(text) and text.startswith('AI tidak tersedia')
+    assert cached is None
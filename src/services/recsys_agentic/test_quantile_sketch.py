@@ -0,0 +1,138 @@
+"""KLLSketch / QuantileSketch: compaction, rank error, retract dan switch exact -> sketch."""
+from typing import Tuple
+
+import numpy as np
+import pytest
+
+from sketches import KLLSketch, QuantileSketch
+
+QUANTILES = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+
+def rank_of(sorted_values: np.ndarray, value: float) -> Tuple[float, float]:
+    """Rank normalized nilai terhadap data asli (interval [lo, hi] untuk nilai kembar)."""
+    lo = np.searchsorted(sorted_values, value, side='left') / len(sorted_values)
+    hi = np.searchsorted(sorted_values, value, side='right') / len(sorted_values)
+    return lo, hi
+
+
+def assert_quantiles_within_rank_error(sketch: QuantileSketch, values: np.ndarray) -> None:
+    eps = sketch.rank_error()
+    ordered = np.sort(values)
+    for q in QUANTILES:
+        lo, hi = rank_of(ordered, sketch.quantile(q))
+        assert lo - eps <= q <= hi + eps, (q, lo, hi, eps)
+        # np.quantile di q -/+ error rank mengapit hasil sketch
+        low, high = np.quantile(values, [max(0.0, q - eps), min(1.0, q + eps)])
+        assert low <= sketch.quantile(q) <= high, (q, sketch.quantile(q), np.quantile(values, q))
+
+
+def test_kll_compaction_bounds_size_and_keeps_weight():
+    rng = np.random.default_rng(0)
+    sketch = KLLSketch(k=200)
+    n = 0
+    for _ in range(50):
+        chunk = rng.normal(size=int(rng.integers(1, 20_000)))
+        sketch.update(chunk)
+        n += len(chunk)
+        items, weights = sketch.weighted_items()
+        assert sketch.n == n
+        # compaction: pasangan -> satu item berbobot 2x (item ganjil tetap di level-nya), ukuran ~3k
+        assert int(weights.sum()) == n
+        assert len(items) <= 3 * sketch.k + 2 * len(sketch.levels)
+        for h, level in enumerate(sketch.levels):
+            assert len(level) <= sketch._capacity(h)
+    assert len(sketch.levels) > 5
+
+
+@pytest.mark.parametrize('k', [50, 200])
+def test_kll_rank_error(k):
+    rng = np.random.default_rng(1)
+    values = np.concatenate([rng.lognormal(size=150_000), rng.integers(0, 20, 50_000).astype(float)])
+    rng.shuffle(values)
+    # merge antar chunk seperti aggregate per worker
+    sketch = KLLSketch(k)
+    for part in np.array_split(values, 13):
+        chunk_sketch = KLLSketch(k, seed=len(part))
+        chunk_sketch.update(part)
+        sketch.merge(chunk_sketch)
+    assert sketch.n == len(values)
+
+    items, weights = sketch.weighted_items()
+    order = np.argsort(items, kind='stable')
+    items, cum = items[order], np.cumsum(weights[order]) / sketch.n
+    ordered = np.sort(values)
+    true_rank = np.searchsorted(ordered, items, side='right') / len(values)
+    assert np.abs(cum - true_rank).max() <= KLLSketch.rank_error(k)
+
+
+def test_exact_until_threshold_then_sketch():
+    rng = np.random.default_rng(2)
+    values = rng.gamma(2.0, 10.0, 5000)
+    sketch = QuantileSketch(exact_max=3000, k=200)
+
+    sketch.add(values[:3000])
+    assert sketch.exact and sketch.rank_error() == 0.0
+    for q in QUANTILES:
+        assert sketch.quantile(q) == np.quantile(values[:3000], q)
+    assert sketch.median() == np.median(values[:3000])
+    assert sketch.count_ge(20.0) == int((values[:3000] >= 20.0).sum())
+
+    sketch.add(values[3000:])
+    assert not sketch.exact
+    assert len(sketch) == len(values)
+    assert sketch.rank_error() == KLLSketch.rank_error(200)
+    assert_quantiles_within_rank_error(sketch, values)
+
+
+def test_merge_of_exact_parts_switches_to_sketch():
+    rng = np.random.default_rng(3)
+    parts = [rng.normal(size=900) for _ in range(6)]
+    total = QuantileSketch(exact_max=2000, k=100)
+    for values in parts:
+        part = QuantileSketch(exact_max=2000, k=100)
+        part.add(values)
+        assert part.exact
+        total.merge(part)
+    assert not total.exact
+    assert_quantiles_within_rank_error(total, np.concatenate(parts))
+
+
+def test_sketch_retraction_with_negative_weights():
+    rng = np.random.default_rng(4)
+    kept = rng.uniform(0, 100, 60_000)
+    retracted = rng.uniform(50, 150, 20_000)  # distribusi berbeda: tanpa retract median bergeser
+    sketch = QuantileSketch(exact_max=1000, k=200)
+    sketch.add(np.concatenate([kept, retracted]))
+
+    part = QuantileSketch(exact_max=0, k=200)  # partial mode sketch
+    part.add(retracted)
+    assert not part.exact
+    sketch.merge(part, -1)
+
+    assert len(sketch) == len(kept)
+    # rank = rank add - rank remove: error relatif terhadap semua nilai yang pernah di-add + di-remove
+    eps = KLLSketch.rank_error(200) * (sketch.added.n + sketch.removed.n) / len(sketch)
+    ordered = np.sort(kept)
+    for q in QUANTILES:
+        lo, hi = rank_of(ordered, sketch.quantile(q))
+        assert lo - eps <= q <= hi + eps, (q, lo, hi, eps)
+    threshold = 75.0
+    expected = int((kept >= threshold).sum())
+    assert abs(sketch.count_ge(threshold) - expected) <= eps * len(kept)
+
+
+def test_exact_retract_matches_np_quantile():
+    rng = np.random.default_rng(5)
+    values = rng.integers(0, 50, 4000).astype(float)
+    sketch = QuantileSketch(exact_max=10_000)
+    sketch.add(values)
+    idx = rng.choice(len(values), 1500, replace=False)
+    removed, remaining = values[idx], np.delete(values, idx)
+    sketch.remove(removed)
+
+    assert len(sketch) == len(values) - len(removed)
+    for q in QUANTILES:
+        assert sketch.quantile(q) == np.quantile(remaining, q)
+    with pytest.raises(ValueError, match='never added'):
+        sketch.remove(np.array([1000.0]))
@@ -0,0 +1,179 @@
+"""Golden test recommend_products (ProductCatalog index) vs versi DataFrame sebelumnya."""
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+
+GLOBAL_AVERAGES = {
+    'avg_data_usage_gb': 12.0,
+    'avg_call_duration': 15.0,
+    'pct_video_usage': 0.4,
+    'sms_freq': 18.0,
+    'topup_freq': 3.5,
+}
+CATEGORIES = ['Data', 'Voice', 'VOD', 'SMS', 'Combo', 'Roaming', 'DeviceBundle', 'Retention Offer']
+
+
+# Salinan recommend_products sebelum ProductCatalog (hanya nama global diberi prefix main.)
+def legacy_recommend_products(pred_label: str, user_row: Dict[str, Any], products_df: pd.DataFrame, total_recommendations: int) -> List[main.RecommendationItem]:
+    """Notebook-inspired recommendation v16 (max wallet share, filler murah)."""
+    recs: List[main.RecommendationItem] = []
+    seen = set()
+
+    budget = float(user_row.get('monthly_spend') or 0.0)
+    primary_category = main.TARGET_TO_CATEGORY_MAP.get(pred_label)
+
+    def add_items(df: pd.DataFrame, desc: str, take: int) -> None:
+        nonlocal recs, seen
+        for _, row in df.head(take).iterrows():
+            recs.append(main.RecommendationItem(
+                product_id=str(row.get('product_id') or ''),
+                product_name=str(row.get('product_name') or ''),
+                category=str(row.get('category') or ''),
+                price=float(row.get('price') or 0),
+                duration_days=int(row.get('duration_days') or 30),
+                reasons=[desc, f"Sesuai prediksi model: {pred_label}"]
+            ))
+            seen.add(row.get('product_name'))
+
+    # Primary
+    if primary_category:
+        base = products_df[products_df['category'] == primary_category].copy()
+
+        if primary_category == 'Retention Offer':
+            top = base[base['price'] <= budget * 0.8].sort_values('price', ascending=True)
+            if top.empty:
+                top = base.sort_values('price', ascending=True)
+            add_items(top, "Rekomendasi Utama (Retensi Hemat):", 3)
+
+        elif primary_category == 'DeviceBundle':
+            top = base[base['price'] <= budget].sort_values('price', ascending=False)
+            if top.empty:
+                top = base.sort_values('price', ascending=True)
+            add_items(top, "Rekomendasi Utama (Upgrade Gadget):", 3)
+
+        else:
+            budget_ok = base[base['price'] <= budget].sort_values('price', ascending=False)
+            top = budget_ok if not budget_ok.empty else base.sort_values('price', ascending=True)
+            add_items(top, f"Rekomendasi Utama ({primary_category} - Premium):", 3)
+
+    remaining = total_recommendations - len(recs)
+
+    # Secondary cross-sell murah + durasi pendek
+    if remaining > 0 and main.global_averages is not None:
+        scores = [
+            ('Data', float(user_row.get('avg_data_usage_gb') or 0) / (main.global_averages['avg_data_usage_gb'] + 1e-6)),
+            ('Voice', float(user_row.get('avg_call_duration') or 0) / (main.global_averages['avg_call_duration'] + 1e-6)),
+            ('VOD', float(user_row.get('pct_video_usage') or 0) / (main.global_averages['pct_video_usage'] + 1e-6)),
+            ('SMS', float(user_row.get('sms_freq') or 0) / (main.global_averages['sms_freq'] + 1e-6)),
+        ]
+        sorted_scores = sorted([s for s in scores if s[1] > 1.0], key=lambda x: x[1], reverse=True)
+        if not sorted_scores and primary_category != 'Combo':
+            sorted_scores.append(('Combo', 1.0))
+
+        for cat, _ in sorted_scores:
+            if remaining <= 0:
+                break
+            if primary_category and cat == primary_category:
+                continue
+
+            filtered = products_df[
+                (products_df['category'] == cat) &
+                (products_df['price'] <= budget * 0.5) &
+                (~products_df['product_name'].isin(seen))
+            ].copy()
+            filtered['is_short'] = filtered['duration_days'].apply(lambda x: 1 if x <= 7 else 2)
+            top_sec = filtered.sort_values(by=['is_short', 'price'], ascending=[True, True])
+
+            if not top_sec.empty:
+                add_items(top_sec, f"Rekomendasi Sekunder ({cat})", 1)
+                remaining = total_recommendations - len(recs)
+
+    # Fallback fillers
+    if len(recs) < total_recommendations:
+        remaining = total_recommendations - len(recs)
+        fillers = products_df[(~products_df['product_name'].isin(seen)) & (products_df['price'] <= budget * 0.5)]
+        fillers = fillers.sort_values('price', ascending=True)
+        for _, row in fillers.head(remaining).iterrows():
+            recs.append(main.RecommendationItem(
+                product_id=str(row.get('product_id') or ''),
+                product_name=str(row.get('product_name') or ''),
+                category=str(row.get('category') or ''),
+                price=float(row.get('price') or 0),
+                duration_days=int(row.get('duration_days') or 30),
+                reasons=[f"{row.get('category')}", "Filler value"]
+            ))
+            if len(recs) >= total_recommendations:
+                break
+
+    return recs[:total_recommendations]
+
+
+def make_catalog(rng: np.random.Generator, n: int = 240) -> pd.DataFrame:
+    """Katalog sintetis tanpa harga kembar (urutan quicksort pandas = urutan stabil)."""
+    price = rng.permutation(np.arange(1, n + 1) * 2500.0)
+    return pd.DataFrame({
+        'product_id': [f"P{i:04d}" for i in range(n)],
+        'product_name': [f"Produk {i}" for i in range(n)],
+        'category': rng.choice(CATEGORIES, size=n),
+        'price': price,
+        'duration_days': rng.choice([1, 3, 7, 14, 30], size=n),
+        'product_capacity_gb': rng.choice([1, 5, 10, 50], size=n).astype(float),
+        'product_capacity_minutes': rng.choice([0, 60, 300], size=n).astype(float),
+        'product_capacity_sms': rng.choice([0, 100], size=n).astype(float),
+    })
+
+
+def make_users(rng: np.random.Generator, n: int) -> List[Dict[str, Any]]:
+    users = []
+    for _ in range(n):
+        users.append({
+            'monthly_spend': float(rng.choice([0, 8000, 20000, 50000, 100000, 150000, 500000, 1000000])),
+            'avg_data_usage_gb': float(rng.uniform(0, 30)),
+            'avg_call_duration': float(rng.uniform(0, 30)),
+            'pct_video_usage': float(rng.uniform(0, 1)),
+            'sms_freq': float(rng.uniform(0, 40)),
+        })
+    return users
+
+
+@pytest.fixture
+def averages(monkeypatch):
+    monkeypatch.setattr(main, 'global_averages', GLOBAL_AVERAGES)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_recommendations_match_previous_implementation(averages, seed):
+    rng = np.random.default_rng(seed)
+    frame = make_catalog(rng)
+    catalog = main.ProductCatalog(frame)
+    labels = list(main.TARGET_TO_CATEGORY_MAP)
+
+    for user in make_users(rng, 150):
+        label = labels[int(rng.integers(len(labels)))]
+        for total in (1, 3, 5, 8):
+            got = [rec.model_dump() for rec in main.recommend_products(label, user, catalog, total)]
+            expected = [rec.model_dump() for rec in legacy_recommend_products(label, user, frame, total)]
+            assert got == expected, (label, user, total)
+
+
+def test_price_ties_follow_catalog_row(averages):
+    # Perubahan perilaku: harga kembar mengikuti urutan baris katalog (dulu quicksort pandas)
+    frame = pd.DataFrame({
+        'product_id': ['A', 'B', 'C', 'D', 'E'],
+        'product_name': ['a', 'b', 'c', 'd', 'e'],
+        'category': ['Data'] * 5,
+        'price': [20000.0, 50000.0, 20000.0, 50000.0, np.nan],
+        'duration_days': [30] * 5,
+    })
+    catalog = main.ProductCatalog(frame)
+    index = catalog.category('Data')
+
+    assert [catalog.items[p]['product_id'] for p in index.price_desc] == ['B', 'D', 'A', 'C', 'E']
+    assert [catalog.items[p]['product_id'] for p in index.price_asc] == ['A', 'C', 'B', 'D', 'E']
+
+    recs = main.recommend_products('Data Booster', {'monthly_spend': 60000.0}, catalog, 3)
+    assert [r.product_id for r in recs] == ['B', 'D', 'A']
@@ -0,0 +1,61 @@
+"""SharedSnapshotStore: publish + CURRENT, mmap round trip, versi lama dibuang dan lock refresh."""
+import os
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+import main
+from snapshot_store import SharedSnapshotStore
+
+
+def make_records(rng: np.random.Generator, n: int) -> List[Dict[str, Any]]:
+    records = []
+    for i in range(n):
+        record: Dict[str, Any] = {
+            'customer_id': f"C{i:04d}",
+            'plan_type': ['Prepaid', 'Postpaid'][int(rng.integers(2))],
+            'device_brand': ['Samsung', 'Apple', 'Xiaomi'][int(rng.integers(3))],
+            'target_offer': 'General Offer',
+        }
+        for col in main.NUMERIC_FEATURES:
+            record[col] = round(float(rng.gamma(2.0, 10.0)), 1)
+        records.append(record)
+    return records
+
+
+def test_publish_then_map(tmp_path):
+    rng = np.random.default_rng(0)
+    store = SharedSnapshotStore(tmp_path, lock_timeout=60.0)
+    assert store.current() is None
+
+    first = main.CustomerSnapshot.from_records(make_records(rng, 50))
+    store.publish(first)
+    version, loaded_at = store.current()
+    assert (version, loaded_at) == (first.version, first.loaded_at)
+
+    mapped = main.CustomerSnapshot.load(store.path(version), loaded_at)
+    assert mapped.version == first.version
+    np.testing.assert_array_equal(mapped.customer_id, first.customer_id)
+    for col in main.NUMERIC_FEATURES:
+        np.testing.assert_array_equal(mapped.numeric[col], first.numeric[col])
+
+    # versi baru: CURRENT pindah, directory versi lama dibuang (file .tmp tidak tersisa)
+    second = main.CustomerSnapshot.from_records(make_records(rng, 60))
+    store.publish(second)
+    assert store.current()[0] == second.version
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted([second.version, store.CURRENT])
+
+
+def test_refresh_lock_is_exclusive_and_expires(tmp_path):
+    store = SharedSnapshotStore(tmp_path, lock_timeout=60.0)
+    other = SharedSnapshotStore(tmp_path, lock_timeout=60.0)
+    assert store.try_lock()
+    assert not other.try_lock()
+    store.unlock()
+    assert other.try_lock()
+
+    # pemegang lock mati: lock yang lebih tua dari lock_timeout dianggap basi
+    old = time.time() - 120.0
+    os.utime(tmp_path / other.LOCK, (old, old))
+    assert store.try_lock()